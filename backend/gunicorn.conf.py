@@ -0,0 +1,30 @@
+"""
+gunicorn settings for running the API with several worker processes:
+
+    gunicorn library_project.wsgi -c gunicorn.conf.py
+
+Each worker counts its own Prometheus metrics (library_app/metrics.py).
+PROMETHEUS_MULTIPROC_DIR makes them write to shared files there instead,
+so /metrics reports the sum over all workers whichever one serves it.
+"""
+import os
+import shutil
+import tempfile
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('WEB_CONCURRENCY', 4))
+
+# Set before the workers import prometheus_client, which reads it on import
+metrics_dir = os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR',
+                                    os.path.join(tempfile.gettempdir(), 'library-metrics'))
+
+
+def on_starting(server):
+    # Files left by an earlier run would be added to this one's counts
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -1,5 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
+from . import sharding
 from .models import User, Book, Rental, Review, Payment
 
 class CustomUserAdmin(UserAdmin):
@@ -22,6 +23,13 @@ class CustomUserAdmin(UserAdmin):
     search_fields = ('username', 'email', 'first_name', 'last_name')
     ordering = ('username',)
 
+    def get_readonly_fields(self, request, obj=None):
+        """An existing user's hostel picks the shard of their rows; keep it fixed while sharded"""
+        fields = super().get_readonly_fields(request, obj)
+        if obj is not None and sharding.enabled():
+            fields = (*fields, 'hostel_number')
+        return fields
+
 class BookAdmin(admin.ModelAdmin):
     """Admin configuration for the Book model"""
     list_display = ('title', 'author', 'owner', 'status', 'category')
@@ -0,0 +1,19 @@
+from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_migrate
+
+
+class LibraryAppConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'library_app'
+
+    def ready(self):
+        # Register the model signal handlers
+        from . import signals  # noqa: F401
+        from .search import ensure_triggers
+        from .sharding import ensure_shard
+        from .timing import install
+        post_migrate.connect(ensure_triggers, sender=self)
+        post_migrate.connect(ensure_shard, sender=self)
+        # Per-request SQL timings for the Server-Timing header
+        connection_created.connect(install)
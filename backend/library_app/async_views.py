@@ -0,0 +1,454 @@
+"""
+Async versions of the busiest read endpoints, for deployments served over
+ASGI (library_project/asgi.py).
+
+Under WSGI a worker thread is held for as long as its request waits on the
+database. These views await instead, so one ASGI worker keeps serving other
+requests while queries are in flight. They answer under /api/async/ with
+the same bytes the synchronous endpoints send: the same serializers (or
+values() readers, readers.py), renderer, filters, cursor pagination, ETags
+and response cache.
+
+Queries go through query() and in_parallel() rather than Django's own
+async ORM methods (aget, acount, `async for`). In Django 4.2 those are
+sync_to_async(thread_sensitive=True) wrappers, so the queries of every
+request in the process queue up on one shared thread; `manage.py
+benchmark_asgi` measured that at a third of the WSGI throughput. The
+query pool gives each call a thread and connection of its own, so
+requests overlap, and where one endpoint needs several independent
+queries (a page and its count, a book and its reviews, the dashboard's
+counters) they run at the same time too.
+
+EventFeedView serves the change feed (outbox.py) as Server-Sent Events or
+long polls. One Poller per event loop reads every new event, on every
+shard, each OUTBOX_POLL_INTERVAL while any feed is open, and queues each
+for the feeds of the users it concerns; a thousand idle feeds cost one
+query per interval, not a thousand. A feed subscribes first and then
+catches up from its event id with its own queries, so nothing committed
+in between is missed; events that arrive both ways are dropped by
+position.
+"""
+import asyncio
+import contextvars
+import logging
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.views import View
+from rest_framework import exceptions, permissions
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from rest_framework.views import exception_handler
+
+from . import dashboard, outbox, readers, routers, sharding, timing, versions
+from .filters import FieldFilterBackend
+from .models import Book, Rental, Review
+from .pagination import KeysetPagination
+from .renderers import JSONRenderer
+from .serializers import BookSerializer, RentalSerializer, ReviewSerializer
+from .views import BookViewSet, RentalViewSet
+
+logger = logging.getLogger(__name__)
+_executor = None
+_pollers = weakref.WeakKeyDictionary()
+
+
+def _run(call):
+    # Pool threads keep their own connections; retire broken or expired ones
+    close_old_connections()
+    return call()
+
+
+async def query(call):
+    """Await a synchronous ORM call, run on the query pool"""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(settings.ASYNC_QUERY_WORKERS, thread_name_prefix='async-query')
+    return await sync_to_async(_run, thread_sensitive=False, executor=_executor)(call)
+
+
+async def in_parallel(*calls):
+    """Run independent synchronous ORM calls at the same time; return their results in order"""
+    return await asyncio.gather(*(query(call) for call in calls))
+
+
+class AsyncReadView(View):
+    """
+    Plumbing the DRF viewsets get from APIView: the DRF request wrapper,
+    the DEFAULT_AUTHENTICATION_CLASSES (JWT and session), permissions, replica reads (as ReplicaReadMixin)
+    and errors rendered like DRF's exception handler.
+    """
+    http_method_names = ['get', 'head', 'options']
+    # As the viewsets' get_permissions(); a view answering anonymous
+    # requests must opt out explicitly, as its synchronous endpoint does
+    permission_classes = [permissions.IsAuthenticated]
+    filter_fields = {}
+    replica_reads = True
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.request = Request(request, authenticators=[
+            authentication() for authentication in api_settings.DEFAULT_AUTHENTICATION_CLASSES
+        ])
+        token = None
+        try:
+            if 'HTTP_AUTHORIZATION' in request.META or settings.SESSION_COOKIE_NAME in request.COOKIES:
+                # Authentication can hit the database; keep it off the event loop
+                await query(lambda: self.request.user)
+            else:
+                self.request.user
+            self.check_permissions()
+            if self.replica_reads and settings.DATABASE_REPLICAS and not await sync_to_async(
+                routers.is_sticky
+            )(self.request.user.pk):
+                token = routers.enable_replica_reads()
+            return await super().dispatch(self.request, *args, **kwargs)
+        except (exceptions.APIException, Http404) as exc:
+            return self.handle_exception(exc)
+        finally:
+            if token is not None:
+                routers.reset_replica_reads(token)
+
+    def check_permissions(self):
+        for permission in self.permission_classes:
+            if not permission().has_permission(self.request, self):
+                if self.request.successful_authenticator is None:
+                    raise exceptions.NotAuthenticated()
+                raise exceptions.PermissionDenied()
+
+    def handle_exception(self, exc):
+        if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+            # As APIView.get_authenticate_header(): the first authenticator's
+            exc.auth_header = self.request.authenticators[0].authenticate_header(self.request)
+        response = exception_handler(exc, {'view': self, 'request': self.request})
+        rendered = self.render(response.data, response.status_code)
+        for name, value in response.items():
+            # The unrendered Response still has HttpResponse's default type
+            if name.lower() != 'content-type':
+                rendered[name] = value
+        return rendered
+
+    def render(self, data, status=200):
+        with timing.measure('render'):
+            content = JSONRenderer().render(data)
+        return HttpResponse(content, status=status, content_type='application/json')
+
+    def serializer_context(self):
+        return {'request': self.request, 'format': None, 'view': self}
+
+    async def page(self, queryset, serializer_class, *also):
+        """
+        One cursor page of `queryset` as paginated data, like the sync list
+        views return, followed by the results of `also`: independent calls
+        read alongside the page.
+        """
+        paginator = KeysetPagination()
+        queryset = FieldFilterBackend().filter_queryset(self.request, queryset, self)
+        fast = readers.reader(serializer_class)
+        if fast is not None:
+            queryset = queryset.values(*fast[0])
+        page_query = paginator.page_query(queryset, self.request, self)
+        calls = [lambda: list(page_query), *also]
+        wants_count = paginator.wants_count(self.request)
+        if wants_count:
+            calls.append(queryset.count)
+
+        rows, *results = await in_parallel(*calls)
+        paginator.count = results.pop() if wants_count else None
+
+        page = paginator.paginate_rows(queryset, rows, self.request, self)
+        if fast is not None:
+            data = readers.to_data(fast[1], page)
+        else:
+            data = serializer_class(page, many=True, context=self.serializer_context()).data
+        return (paginator.get_paginated_response(data).data, *results)
+
+    def bind_shard(self, pk):
+        """The shard holding row `pk`, bound for this request (404 if none does)"""
+        if not sharding.enabled():
+            return sharding.use(None)
+        alias = sharding.for_pk(pk)
+        if alias is None:
+            raise Http404
+        return sharding.use(alias)
+
+
+def books():
+    return sharding.sharded(Book.objects.select_related('owner'))
+
+
+class BookListView(AsyncReadView):
+    """GET /api/async/books/, as /api/books/"""
+    filter_fields = BookViewSet.filter_fields
+
+    async def get(self, request):
+        async def render():
+            data, = await self.page(books(), BookSerializer)
+            return self.render(data)
+        return await versions.aconditional_response(request, 'books', render)
+
+
+class AvailableBookListView(AsyncReadView):
+    """GET /api/async/books/available/, as /api/books/available/"""
+    filter_fields = BookViewSet.filter_fields
+
+    async def get(self, request):
+        async def render():
+            data, = await self.page(books().filter(status='available'), BookSerializer)
+            return self.render(data)
+        return await versions.aconditional_response(request, 'books', render)
+
+
+class BookDetailView(AsyncReadView):
+    """GET /api/async/books/<id>/, as /api/books/<id>/"""
+
+    async def get(self, request, pk):
+        async def render():
+            with self.bind_shard(pk):
+                try:
+                    book = await query(lambda: Book.objects.select_related('owner').get(pk=pk))
+                except Book.DoesNotExist:
+                    raise Http404
+            return self.render(BookSerializer(book, context=self.serializer_context()).data)
+        return await versions.aconditional_response(request, versions.book_scope(pk), render)
+
+
+class BookReviewListView(AsyncReadView):
+    """GET /api/async/books/<id>/reviews/, as /api/books/<id>/reviews/"""
+
+    async def get(self, request, pk):
+        async def render():
+            with self.bind_shard(pk):
+                reviews = Review.objects.filter(book_id=pk).select_related('user', 'book')
+                data, found = await self.page(reviews, ReviewSerializer, Book.objects.filter(pk=pk).exists)
+            if not found:
+                raise Http404
+            return self.render(data)
+        return await versions.aconditional_response(request, versions.book_scope(pk), render)
+
+
+class MyRentalListView(AsyncReadView):
+    """GET /api/async/rentals/my_rentals/, as /api/rentals/my_rentals/"""
+    filter_fields = RentalViewSet.filter_fields
+
+    async def get(self, request):
+        rentals = sharding.sharded(Rental.objects.select_related('renter', 'book')).filter(renter=request.user)
+        data, = await self.page(rentals, RentalSerializer)
+        return self.render(data)
+
+
+class DashboardView(AsyncReadView):
+    """GET /api/async/dashboard/, as /api/dashboard/, with the missing parts queried at once"""
+    # Its per-user cache must never hold a lagging replica's data
+    replica_reads = False
+
+    async def get(self, request):
+        timeout = settings.DASHBOARD_CACHE_TIMEOUT
+        key = dashboard.USER_KEY.format(request.user.id)
+        cached = await cache.aget_many([dashboard.CATALOG_KEY, key])
+        catalog, personal = cached.get(dashboard.CATALOG_KEY), cached.get(key)
+
+        calls = [] if catalog is not None else [dashboard.catalog_counts]
+        if personal is None:
+            calls += dashboard.user_queries(request.user)
+        results = await in_parallel(*calls) if calls else []
+        if catalog is None:
+            catalog = results.pop(0)
+            await cache.aset(dashboard.CATALOG_KEY, catalog, timeout)
+        if personal is None:
+            personal = dashboard.merge_parts(results)
+            await cache.aset(key, personal, timeout)
+        return self.render(dashboard.combine(catalog, personal))
+
+
+class Subscription:
+    """The events queued for one open feed, as (shard, event) pairs"""
+
+    def __init__(self, user):
+        self.user = user
+        self.queue = asyncio.Queue(settings.OUTBOX_BATCH_SIZE)
+        # Set when the queue was full and events were dropped: the feed
+        # then catches up from the database again
+        self.overflowed = False
+
+    def offer(self, item):
+        try:
+            self.queue.put_nowait(item)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    async def next(self, timeout):
+        """Everything queued, waiting up to `timeout` seconds for the first; [] on timeout"""
+        try:
+            items = [await asyncio.wait_for(self.queue.get(), timeout)]
+        except asyncio.TimeoutError:
+            return []
+        while not self.queue.empty():
+            items.append(self.queue.get_nowait())
+        return items
+
+
+class Poller:
+    """Reads new events for the open feeds of one event loop, while there are any"""
+
+    def __init__(self):
+        self.subscriptions = set()
+        self.cursor = None
+        self.started = None
+        self.task = None
+
+    async def subscribe(self, user):
+        subscription = Subscription(user)
+        self.subscriptions.add(subscription)
+        if self.task is None:
+            self.cursor = None
+            self.started = asyncio.Event()
+            # In a context of its own, not the first request's
+            self.task = contextvars.Context().run(asyncio.get_running_loop().create_task, self.run())
+        # Catching up must not start before polling has a position
+        await self.started.wait()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        self.subscriptions.discard(subscription)
+
+    async def run(self):
+        try:
+            while self.subscriptions:
+                try:
+                    if self.cursor is None:
+                        self.cursor = await query(outbox.head)
+                        self.started.set()
+                    elif await self.poll():
+                        continue
+                except Exception:
+                    logger.exception('Polling the outbox failed')
+                await asyncio.sleep(settings.OUTBOX_POLL_INTERVAL)
+        finally:
+            self.task = None
+
+    async def poll(self):
+        """Queue every new event for its feeds; True if there may be more"""
+        batch = settings.OUTBOX_BATCH_SIZE
+        items = await query(lambda: outbox.read(self.cursor, batch))
+        for alias, event in items:
+            self.cursor[alias] = outbox.position(event)
+            for subscription in self.subscriptions:
+                if outbox.concerns(subscription.user, event):
+                    subscription.offer((alias, event))
+        return len(items) >= batch
+
+
+def poller():
+    loop = asyncio.get_running_loop()
+    if loop not in _pollers:
+        _pollers[loop] = Poller()
+    return _pollers[loop]
+
+
+class EventFeedView(AsyncReadView):
+    """
+    GET /api/async/events/: the user's rental and book events (outbox.py).
+
+    With `Accept: text/event-stream` it is a Server-Sent Events stream,
+    ended after OUTBOX_STREAM_SECONDS for the client to reconnect with
+    Last-Event-ID. Otherwise it is a long poll: the events after
+    ?last_event_id= as soon as there are any, or none after ?timeout=
+    seconds, with the `last_event_id` to send next. Without an event id
+    the feed starts at the latest event. An event id older than the
+    outbox's retention gets a `reset` instead: reload, then follow on.
+    The stream needs the ASGI server; long polls also work under WSGI.
+    """
+    # Positions must come from the primary
+    replica_reads = False
+
+    async def get(self, request):
+        token = request.META.get('HTTP_LAST_EVENT_ID') or request.query_params.get('last_event_id')
+        try:
+            cursor = outbox.parse_cursor(token) if token else None
+        except ValueError:
+            raise exceptions.ValidationError({'last_event_id': 'This is not an event id of this feed.'})
+        if 'text/event-stream' in request.META.get('HTTP_ACCEPT', ''):
+            response = StreamingHttpResponse(self.stream(cursor), content_type='text/event-stream')
+            response['Cache-Control'] = 'no-cache'
+            # Stop nginx from buffering the stream
+            response['X-Accel-Buffering'] = 'no'
+            return response
+        return await self.long_poll(cursor)
+
+    async def start(self, cursor):
+        """The position to follow on from, and whether the client must reload first"""
+        if cursor is None:
+            return await query(outbox.head), False
+        if await query(lambda: outbox.is_stale(cursor)):
+            return await query(outbox.head), True
+        return cursor, False
+
+    async def fetch(self, cursor):
+        """The user's next (shard, event) pairs from the database, and whether they were the last"""
+        batch = settings.OUTBOX_BATCH_SIZE
+        items = await query(lambda: outbox.read(cursor, batch, self.request.user))
+        return items, len(items) < batch
+
+    async def long_poll(self, cursor):
+        try:
+            timeout = min(float(self.request.query_params.get('timeout', settings.OUTBOX_LONG_POLL_SECONDS)),
+                          settings.OUTBOX_LONG_POLL_SECONDS)
+        except ValueError:
+            raise exceptions.ValidationError({'timeout': 'Must be a number of seconds.'})
+        subscription = await poller().subscribe(self.request.user)
+        try:
+            cursor, reset = await self.start(cursor)
+            events = []
+            if not reset:
+                events = outbox.advance(cursor, (await self.fetch(cursor))[0])
+            deadline = time.monotonic() + timeout
+            while not events and not reset and time.monotonic() < deadline:
+                if subscription.overflowed:
+                    subscription.overflowed = False
+                    items, _ = await self.fetch(cursor)
+                else:
+                    with timing.measure('wait'):
+                        items = await subscription.next(deadline - time.monotonic())
+                events = outbox.advance(cursor, items)
+        finally:
+            poller().unsubscribe(subscription)
+        return self.render({
+            'events': [outbox.payload(event) for event in events],
+            'last_event_id': outbox.format_cursor(cursor),
+            'reset': reset,
+        })
+
+    def message(self, kind, data, cursor):
+        content = JSONRenderer().render(data).decode()
+        return f'id: {outbox.format_cursor(cursor)}\nevent: {kind}\ndata: {content}\n\n'
+
+    async def stream(self, cursor):
+        subscription = await poller().subscribe(self.request.user)
+        try:
+            cursor, reset = await self.start(cursor)
+            yield self.message('reset' if reset else 'ready', {}, cursor)
+            deadline = time.monotonic() + settings.OUTBOX_STREAM_SECONDS
+            caught_up = False
+            while time.monotonic() < deadline:
+                if not caught_up or subscription.overflowed:
+                    subscription.overflowed = False
+                    items, caught_up = await self.fetch(cursor)
+                else:
+                    wait = min(settings.OUTBOX_HEARTBEAT_SECONDS, deadline - time.monotonic())
+                    items = await subscription.next(max(wait, 0))
+                    if not items:
+                        # Keeps proxies from closing an idle connection
+                        yield ': keep-alive\n\n'
+                        continue
+                for alias, event in items:
+                    # Each message's id is the position just past its event
+                    if outbox.advance(cursor, [(alias, event)]):
+                        yield self.message(f'{event.topic}.{event.action}', outbox.payload(event), cursor)
+        finally:
+            poller().unsubscribe(subscription)
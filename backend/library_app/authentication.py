@@ -0,0 +1,106 @@
+"""
+JWT authentication that resolves request.user without a query per request.
+
+simplejwt's JWTAuthentication loads the user row on every request, although
+the views only read a handful of its columns. CachedJWTAuthentication keeps
+recently seen users in a bounded, per-process LRU with a TTL.
+
+Each cached entry remembers the version stamp its user had when it was
+loaded (versions.py, scope `user:<id>`). The User signal handlers bump that
+version on every save or delete, so a profile change, role change or
+suspension is seen by the next request; with a shared RESPONSE_CACHE_ALIAS
+backend that holds across processes too. The TTL only bounds how long an
+idle entry occupies memory and covers writes that bypass signals
+(QuerySet.update() on users).
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from . import versions
+
+
+def user_scope(user_id):
+    return f'user:{user_id}'
+
+
+class UserCache:
+    """Thread-safe LRU of user instances, each entry valid for `timeout` seconds"""
+
+    def __init__(self, max_entries, timeout):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id, version):
+        """A private copy of the cached user, or None if missing, expired or outdated"""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            user, entry_version, expires = entry
+            if entry_version != version or expires < time.monotonic():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+        # Views may modify request.user (users/me); never hand out the shared instance
+        return copy.copy(user)
+
+    def set(self, user_id, user, version):
+        with self._lock:
+            self._entries[user_id] = (copy.copy(user), version, time.monotonic() + self.timeout)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def evict(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+user_cache = UserCache(**settings.AUTH_USER_CACHE)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication that serves request.user from `user_cache` and rejects suspended users"""
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        # Read the version before loading, so a save racing the load leaves
+        # the entry outdated rather than caching old data as current
+        version = versions.get_version(user_scope(user_id))
+        user = user_cache.get(user_id, version)
+        if user is None:
+            user = super().get_user(validated_token)
+            user_cache.set(user_id, user, version)
+        else:
+            if not user.is_active:
+                raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+            if api_settings.CHECK_REVOKE_TOKEN and validated_token.get(
+                api_settings.REVOKE_TOKEN_CLAIM
+            ) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(
+                    _("The user's password has been changed."), code="password_changed"
+                )
+
+        if user.status == 'suspended':
+            raise AuthenticationFailed(_("User is suspended"), code="user_suspended")
+        return user
@@ -0,0 +1,68 @@
+"""
+Per-book availability: which days a book is booked and which are free.
+
+A rental blocks its book from start_date to end_date inclusive while it is
+pending or approved. Open rentals of one book never overlap, so ordered by
+end_date they are also ordered by start_date. That turns both questions
+into short walks of the partial index rental_open_book_end_idx
+(book, end_date WHERE status IN ('pending', 'approved')):
+
+- does [start, end] collide with anything? Only the first open rental
+  ending on or after `start` can; one index probe answers it.
+- what is booked in [from, to]? The open rentals ending inside the window,
+  plus at most one that starts inside it and ends after it.
+
+Neither depends on how much completed or canceled history a book has.
+
+On PostgreSQL the no-overlap rule is also enforced by an exclusion
+constraint over daterange (applied by migration 0005_rental_overlap), so
+it holds even for writes that skip the API. Other backends rely on
+rentals.save_rental, which locks the book row before checking.
+"""
+from datetime import timedelta
+
+BLOCKING_STATUSES = ('pending', 'approved')
+
+# Added on PostgreSQL by migration 0005_rental_overlap
+CONSTRAINT_NAME = 'rental_no_overlap'
+
+
+def _open_rentals(book_id, exclude=None):
+    from .models import Rental
+
+    rentals = Rental.objects.filter(book_id=book_id, status__in=BLOCKING_STATUSES)
+    if exclude is not None:
+        rentals = rentals.exclude(pk=exclude)
+    return rentals.order_by('end_date')
+
+
+def find_overlap(book_id, start, end, exclude=None):
+    """Return the open rental of the book that overlaps [start, end], or None"""
+    first = _open_rentals(book_id, exclude).filter(end_date__gte=start).first()
+    if first is not None and first.start_date <= end:
+        return first
+    return None
+
+
+def booked(book_id, start, end):
+    """Open rentals of the book that overlap [start, end], as dicts, in date order"""
+    fields = ('start_date', 'end_date', 'status')
+    rentals = _open_rentals(book_id)
+    inside = list(rentals.filter(end_date__gte=start, end_date__lte=end).values(*fields))
+    after = rentals.filter(end_date__gt=end).values(*fields).first()
+    if after is not None and after['start_date'] <= end:
+        inside.append(after)
+    return inside
+
+
+def free_windows(intervals, start, end):
+    """The gaps in [start, end] not covered by `intervals` (sorted, inclusive dates)"""
+    windows = []
+    cursor = start
+    for interval in intervals:
+        if interval['start_date'] > cursor:
+            windows.append({'start_date': cursor, 'end_date': interval['start_date'] - timedelta(days=1)})
+        cursor = max(cursor, interval['end_date'] + timedelta(days=1))
+    if cursor <= end:
+        windows.append({'start_date': cursor, 'end_date': end})
+    return windows
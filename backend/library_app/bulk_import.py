@@ -0,0 +1,154 @@
+"""
+Bulk book import from a CSV or NDJSON request body.
+
+The body is read line by line straight off the request stream and handled
+in chunks: each chunk is validated with BookSerializer's rules, its ISBNs
+are checked against each other and against the owner's books already in
+the database, and the valid rows go in with one bulk_create. Earlier
+chunks are already in the database by the time a later one is checked, so
+duplicates across the whole upload are caught without remembering every
+ISBN seen. Peak memory is one chunk plus a capped error list, whatever the
+size of the file.
+
+bulk_create sends no post_save signals, so the dashboard entries and the
+response version a new book affects are invalidated once at the end. Each
+chunk's books and their change-feed events (outbox.py) go in together in
+one transaction.
+"""
+import codecs
+import csv
+import json
+import re
+from itertools import islice
+
+from django.db import transaction
+from django.db.models import CharField
+from django.db.models.expressions import RawSQL
+from rest_framework.exceptions import ValidationError
+
+from . import dashboard, outbox, sharding, versions
+from .models import Book
+from .serializers import BookSerializer
+
+# Content types accepted by /api/books/bulk/
+FORMATS = {
+    'text/csv': 'csv',
+    'application/csv': 'csv',
+    'application/x-ndjson': 'ndjson',
+    'application/ndjson': 'ndjson',
+    'application/jsonl': 'ndjson',
+}
+
+
+def isbn_key(isbn):
+    """ISBNs compare equal whatever their hyphens, spaces or case"""
+    return re.sub(r'[\s-]', '', isbn).upper() if isbn else ''
+
+
+def db_isbn_key():
+    """
+    isbn_key() as a database expression. It matches the expression of the
+    book_owner_isbn_key_idx index; it is raw SQL because SQLite only uses an
+    expression index when the constants are literals, not bound parameters.
+    """
+    return RawSQL("UPPER(REPLACE(REPLACE(isbn, '-', ''), ' ', ''))", [], output_field=CharField())
+
+
+def parse_rows(stream, fmt):
+    """
+    Yield (line number, row dict, error) for every record in the body.
+    Empty CSV cells are dropped so optional fields fall back to their defaults.
+    """
+    lines = codecs.iterdecode(stream, 'utf-8-sig')
+    if fmt == 'csv':
+        reader = csv.DictReader(lines)
+        for row in reader:
+            values = {
+                name.strip(): value.strip() for name, value in row.items()
+                if name and isinstance(value, str) and value.strip()
+            }
+            yield reader.line_num, values, None
+        return
+
+    for number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            yield number, None, 'This line is not valid JSON.'
+            continue
+        if not isinstance(row, dict):
+            yield number, None, 'Each line must be a JSON object.'
+            continue
+        yield number, row, None
+
+
+def import_books(stream, fmt, owner, chunk_size, max_errors):
+    """Import every row of `stream` as a book owned by `owner` and return the report"""
+    report = {'rows': 0, 'created': 0, 'failed': 0, 'errors': [], 'errors_truncated': False}
+    validator = BookSerializer()
+    rows = parse_rows(stream, fmt)
+    try:
+        while True:
+            try:
+                chunk = list(islice(rows, chunk_size))
+            except (UnicodeDecodeError, csv.Error) as exc:
+                # Rows before the unreadable part are already imported
+                report['detail'] = f'The upload could not be read after row {report["rows"]}: {exc}'
+                break
+            if not chunk:
+                break
+            _import_chunk(chunk, validator, owner, chunk_size, max_errors, report)
+    finally:
+        if report['created']:
+            dashboard.invalidate_catalog()
+            dashboard.invalidate_users(owner.id)
+            versions.bump('books')
+    return report
+
+
+def _import_chunk(chunk, validator, owner, chunk_size, max_errors, report):
+    failures = []
+
+    def fail(line, errors):
+        failures.append((line, errors))
+
+    valid = []
+    for line, row, error in chunk:
+        report['rows'] += 1
+        if error:
+            fail(line, {'non_field_errors': [error]})
+            continue
+        try:
+            valid.append((line, validator.run_validation(row)))
+        except ValidationError as exc:
+            fail(line, exc.detail)
+
+    keys = {isbn_key(data.get('isbn')) for _, data in valid} - {''}
+    existing = set(
+        Book.objects.filter(owner=owner).annotate(isbn_key=db_isbn_key())
+        .filter(isbn_key__in=keys).values_list('isbn_key', flat=True)
+    ) if keys else set()
+
+    books = []
+    for line, data in valid:
+        key = isbn_key(data.get('isbn'))
+        if key and key in existing:
+            fail(line, {'isbn': [f'You already have a book with ISBN {data["isbn"]}.']})
+            continue
+        if key:
+            existing.add(key)
+        books.append(Book(owner=owner, **data))
+
+    with transaction.atomic(using=sharding.db()):
+        Book.objects.bulk_create(books, batch_size=chunk_size)
+        outbox.record(*(outbox.book_event(book, 'created') for book in books))
+    report['created'] += len(books)
+
+    report['failed'] += len(failures)
+    for line, errors in sorted(failures, key=lambda failure: failure[0]):
+        if len(report['errors']) < max_errors:
+            report['errors'].append({'row': line, 'errors': errors})
+        else:
+            report['errors_truncated'] = True
@@ -0,0 +1,139 @@
+"""
+Server-side dashboard: every counter the dashboard shows, computed with a
+handful of conditional aggregates, plus short "recent" lists.
+
+Results are cached per user. The catalog-wide counters are shared by every
+user and cached under their own key, so one book changing does not throw
+away every user's dashboard. Signal handlers in signals.py call the
+invalidate_* functions whenever a book, rental or review changes.
+
+With hostel sharding on, every count and list is gathered from all shards.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q
+
+from .models import Book, Rental, Review
+from .serializers import BookSerializer, RentalSerializer, ReviewSerializer
+from .sharding import sharded
+
+CATALOG_KEY = 'dashboard:catalog'
+USER_KEY = 'dashboard:user:{}'
+
+RECENT_BOOKS = 5
+RECENT_RENTALS = 5
+RECENT_REVIEWS = 3
+
+
+def is_owner(user):
+    return user.role in ('owner', 'admin')
+
+
+def is_renter(user):
+    return user.role in ('renter', 'admin')
+
+
+def get_dashboard(user):
+    """Return the dashboard payload for `user`, from cache when possible"""
+    timeout = settings.DASHBOARD_CACHE_TIMEOUT
+
+    catalog = cache.get(CATALOG_KEY)
+    if catalog is None:
+        catalog = catalog_counts()
+        cache.set(CATALOG_KEY, catalog, timeout)
+
+    key = USER_KEY.format(user.id)
+    personal = cache.get(key)
+    if personal is None:
+        personal = build_user_dashboard(user)
+        cache.set(key, personal, timeout)
+
+    return combine(catalog, personal)
+
+
+def combine(catalog, personal):
+    return {
+        'stats': {**catalog, **personal['stats']},
+        **{name: value for name, value in personal.items() if name != 'stats'},
+    }
+
+
+def catalog_counts():
+    return sharded(Book.objects.all()).aggregate(
+        total_books=Count('id'),
+        available_books=Count('id', filter=Q(status='available')),
+    )
+
+
+def build_user_dashboard(user):
+    """Compute the per-user counters and recent lists"""
+    return merge_parts([query() for query in user_queries(user)])
+
+
+def user_queries(user):
+    """
+    The independent queries behind one user's dashboard, as callables that
+    each return a part of it; merge_parts() puts the results together.
+    """
+    queries = [
+        lambda: {'stats': sharded(Review.objects.filter(user=user)).aggregate(my_reviews=Count('id'))},
+        lambda: {'recent_reviews': ReviewSerializer(
+            sharded(Review.objects.filter(user=user)).select_related('user', 'book')
+            .order_by('-id')[:RECENT_REVIEWS],
+            many=True,
+        ).data},
+    ]
+
+    if is_owner(user):
+        queries += [
+            lambda: {'stats': sharded(Book.objects.filter(owner=user)).aggregate(
+                my_books=Count('id'),
+                my_books_rented=Count('id', filter=Q(status='rented')),
+            )},
+            lambda: {'stats': sharded(Rental.objects.filter(book__owner=user)).aggregate(
+                pending_requests=Count('id', filter=Q(status='pending')),
+            )},
+            lambda: {'my_books': BookSerializer(
+                sharded(Book.objects.filter(owner=user)).select_related('owner').order_by('-id')[:RECENT_BOOKS],
+                many=True,
+            ).data},
+            lambda: {'pending_requests': RentalSerializer(
+                sharded(Rental.objects.filter(book__owner=user, status='pending'))
+                .select_related('renter', 'book').order_by('-id')[:RECENT_RENTALS],
+                many=True,
+            ).data},
+        ]
+
+    if is_renter(user):
+        queries += [
+            lambda: {'stats': sharded(Rental.objects.filter(renter=user)).aggregate(
+                active_rentals=Count('id', filter=Q(status__in=('approved', 'overdue'))),
+                pending_rentals=Count('id', filter=Q(status='pending')),
+                completed_rentals=Count('id', filter=Q(status='completed')),
+            )},
+            lambda: {'my_rentals': RentalSerializer(
+                sharded(Rental.objects.filter(renter=user)).select_related('renter', 'book')
+                .order_by('-id')[:RECENT_RENTALS],
+                many=True,
+            ).data},
+        ]
+    return queries
+
+
+def merge_parts(parts):
+    """Combine user_queries() results, in order, into one dashboard"""
+    data = {}
+    stats = {}
+    for part in parts:
+        stats.update(part.pop('stats', {}))
+        data.update(part)
+    data['stats'] = stats
+    return data
+
+
+def invalidate_catalog():
+    cache.delete(CATALOG_KEY)
+
+
+def invalidate_users(*user_ids):
+    cache.delete_many([USER_KEY.format(user_id) for user_id in user_ids if user_id])
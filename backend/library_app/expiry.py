@@ -0,0 +1,144 @@
+"""
+Sweeping rentals whose dates have passed.
+
+Nothing in the API moves a rental on once its dates are gone, so stale
+rows pile up and inflate every status filter. sweep() moves two kinds:
+
+- pending requests whose start_date is more than RENTAL_PENDING_EXPIRY_DAYS
+  behind: nobody approved them in time, and they become `canceled`.
+- approved rentals whose end_date is more than RENTAL_OVERDUE_DAYS behind:
+  they become `overdue`. No return was recorded, so the book stays rented
+  and billing.py keeps charging late fees until the owner completes the
+  rental.
+
+Each shard's candidates are walked in primary-key order (keyset, never
+OFFSET), a chunk per short transaction:
+
+1. SELECT ... FOR UPDATE SKIP LOCKED the next chunk. Rows that an approve
+   or cancel request holds right now are skipped rather than waited on;
+   the next sweep picks them up.
+2. One UPDATE moves the chunk, guarded on the expected status like the
+   transitions in rentals.py.
+
+A book's status says whether it is out today, and approving a rental that
+starts later leaves its book available (see rentals.py). sweep() also
+walks the approved rentals that have started since, in the same chunks,
+and flips their books available -> rented.
+
+Row locks last for one chunk only, so API traffic is never blocked for
+long however many rows a sweep moves. Like rentals.py, the updates set
+updated_at themselves and send no signals; the dashboards and response
+versions they affect are invalidated after each chunk commits, and each
+chunk appends its rentals' events to the change feed (outbox.py).
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+from . import dashboard, outbox, sharding, versions
+from .models import Book, Rental
+from .rentals import out_rentals
+
+# (status, date field, days setting, new status)
+SWEEPS = (
+    ('pending', 'start_date', 'RENTAL_PENDING_EXPIRY_DAYS', 'canceled'),
+    ('approved', 'end_date', 'RENTAL_OVERDUE_DAYS', 'overdue'),
+)
+
+
+def sweep(today, chunk_size=None):
+    """
+    Move every stale rental on and mark the books of started ones rented,
+    on every shard, as of `today`. Returns the counts of rentals `canceled`
+    and marked `overdue`, `books_rented` and `chunks` committed.
+    """
+    chunk_size = chunk_size or settings.RENTAL_SWEEP_CHUNK_SIZE
+    counts = {'canceled': 0, 'overdue': 0, 'books_rented': 0, 'chunks': 0}
+    for from_status, date_field, days_setting, to_status in SWEEPS:
+        cutoff = today - timedelta(days=getattr(settings, days_setting))
+        stale = Rental.objects.filter(status=from_status, **{f'{date_field}__lt': cutoff})
+        for alias in sharding.aliases():
+            with sharding.use(alias):
+                last_id = 0
+                while True:
+                    last_id, moved = _sweep_chunk(stale, from_status, to_status, last_id, chunk_size)
+                    if last_id is None:
+                        break
+                    counts[to_status] += moved
+                    counts['chunks'] += 1
+    started = out_rentals(today).filter(book__status='available')
+    for alias in sharding.aliases():
+        with sharding.use(alias):
+            last_id = 0
+            while True:
+                last_id, rented = _start_chunk(started, last_id, chunk_size)
+                if last_id is None:
+                    break
+                counts['books_rented'] += rented
+                counts['chunks'] += 1
+    return counts
+
+
+@sharding.atomic
+def _sweep_chunk(stale, from_status, to_status, last_id, chunk_size):
+    """
+    Move the next chunk of `stale` after `last_id`. Returns (the chunk's
+    last id, or None once there is none, rentals moved).
+    """
+    locking = stale.filter(pk__gt=last_id).order_by('pk')
+    if connections[sharding.db()].features.has_select_for_update_skip_locked:
+        locking = locking.select_for_update(skip_locked=True)
+    rows = list(locking.values_list('pk', 'book_id', 'renter_id')[:chunk_size])
+    if not rows:
+        return None, 0
+
+    ids = [pk for pk, _, _ in rows]
+    book_ids = {book_id for _, book_id, _ in rows}
+    now = timezone.now()
+    moved = Rental.objects.filter(pk__in=ids, status=from_status).update(status=to_status, updated_at=now)
+
+    owners = dict(Book.objects.filter(pk__in=book_ids).values_list('pk', 'owner_id'))
+    outbox.record(*(
+        outbox.rental_event(Rental(pk=pk, book_id=book_id, renter_id=renter_id, status=to_status),
+                            to_status, owners.get(book_id))
+        for pk, book_id, renter_id in rows
+    ))
+    user_ids = {renter_id for _, _, renter_id in rows} | set(owners.values())
+
+    def invalidate():
+        dashboard.invalidate_catalog()
+        dashboard.invalidate_users(*user_ids)
+    sharding.on_commit(invalidate)
+    versions.bump(*map(versions.book_scope, book_ids))
+    return ids[-1], moved
+
+
+@sharding.atomic
+def _start_chunk(started, last_id, chunk_size):
+    """
+    Mark the books of the next chunk of `started` rentals after `last_id`
+    rented. Returns (the chunk's last id, or None once there is none,
+    books rented).
+    """
+    locking = started.filter(pk__gt=last_id).order_by('pk')
+    if connections[sharding.db()].features.has_select_for_update_skip_locked:
+        # Lock the rentals only: a cancel waits for the chunk, then releases the book
+        locking = locking.select_for_update(skip_locked=True, of=('self',))
+    rows = list(locking.values_list('pk', 'book_id', 'book__owner_id')[:chunk_size])
+    if not rows:
+        return None, 0
+
+    book_ids = {book_id for _, book_id, _ in rows}
+    rented = Book.objects.filter(pk__in=book_ids, status='available').update(
+        status='rented', updated_at=timezone.now(),
+    )
+    owner_ids = {owner_id for _, _, owner_id in rows}
+
+    def invalidate():
+        dashboard.invalidate_catalog()
+        dashboard.invalidate_users(*owner_ids)
+    sharding.on_commit(invalidate)
+    versions.bump(*(['books'] if rented else []), *map(versions.book_scope, book_ids))
+    return rows[-1][0], rented
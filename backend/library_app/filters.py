@@ -0,0 +1,40 @@
+from django.core.exceptions import ValidationError as DjangoValidationError
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+
+class FieldFilterBackend(BaseFilterBackend):
+    """
+    Exact-match filters declared on the viewset as `filter_fields`, a dict of
+    query parameter -> model field name, e.g. {'status': 'status', 'owner': 'owner'}.
+
+    `/api/rentals/?status=pending&book=7` filters the list, the list actions
+    and the export the same way. Values are checked with the model field, so
+    `?owner=abc` is a 400 rather than a database error.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        lookups = {}
+        for param, field_name in getattr(view, 'filter_fields', {}).items():
+            value = request.query_params.get(param)
+            if value in (None, ''):
+                continue
+            field = queryset.model._meta.get_field(field_name)
+            target = field.target_field if field.is_relation else field
+            try:
+                lookups[field.attname] = target.to_python(value)
+            except DjangoValidationError as exc:
+                raise ValidationError({param: exc.messages})
+        return queryset.filter(**lookups) if lookups else queryset
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': param,
+                'required': False,
+                'in': 'query',
+                'description': f'Only rows whose {field_name} equals this value',
+                'schema': {'type': 'string'},
+            }
+            for param, field_name in getattr(view, 'filter_fields', {}).items()
+        ]
@@ -0,0 +1,122 @@
+"""
+Helpers shared by the management commands that exercise the API against a
+throwaway copy of the database (query budgets, benchmarks, stress tests).
+"""
+import multiprocessing
+import os
+import tempfile
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.servers.basehttp import ThreadedWSGIServer
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.testcases import QuietWSGIRequestHandler
+from django.test.utils import (
+    override_settings,
+    setup_databases,
+    setup_test_environment,
+    teardown_databases,
+    teardown_test_environment,
+)
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+
+@contextmanager
+def scratch_database(verbosity=0, keepdb=False, on_disk=False):
+    """
+    Create the test databases for the duration of the block, the same way
+    `manage.py test` does, so harnesses never touch real data.
+
+    SQLite test databases normally live in shared-cache memory, where lock
+    contention between threads fails immediately instead of waiting. Pass
+    on_disk=True for harnesses that write from several threads at once.
+
+    Every cache is swapped for a fresh local-memory one, so dashboards,
+    response versions and rendered responses never leak between the
+    scratch data and a cache the real site shares.
+    """
+    if on_disk:
+        for alias in connections:
+            settings_dict = connections[alias].settings_dict
+            if settings_dict['ENGINE'].endswith('sqlite3') and not settings_dict['TEST'].get('NAME'):
+                settings_dict['TEST']['NAME'] = os.path.join(
+                    tempfile.gettempdir(), f'library_scratch_{alias}_{os.getpid()}.sqlite3'
+                )
+    scratch_caches = override_settings(CACHES={
+        alias: {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                'LOCATION': f'scratch-{alias}-{uuid.uuid4()}', 'OPTIONS': config.get('OPTIONS', {})}
+        for alias, config in settings.CACHES.items()
+    })
+    setup_test_environment()
+    with scratch_caches:
+        old_config = setup_databases(verbosity, interactive=False, keepdb=keepdb)
+        try:
+            yield
+        finally:
+            teardown_databases(old_config, verbosity, keepdb=keepdb)
+            teardown_test_environment()
+
+
+def add_sqlite_database(alias):
+    """
+    Register a SQLite database under `alias` for the rest of the process,
+    next to whatever 'default' is. scratch_database() then creates and
+    removes an on-disk test copy of it like any configured database.
+    """
+    if alias in connections.settings:
+        return
+    path = os.path.join(tempfile.gettempdir(), f'library_scratch_{alias}_{os.getpid()}.sqlite3')
+    configured = connections.configure_settings({
+        DEFAULT_DB_ALIAS: connections.settings[DEFAULT_DB_ALIAS],
+        alias: {'ENGINE': 'django.db.backends.sqlite3', 'NAME': path, 'TEST': {'NAME': path}},
+    })
+    connections.settings[alias] = configured[alias]
+
+
+def api_client_for(user):
+    """Return an APIClient that authenticates as `user` with a real JWT"""
+    client = APIClient()
+    if user is not None:
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+    return client
+
+
+@contextmanager
+def live_server(host='127.0.0.1'):
+    """
+    Serve the API over real HTTP, as runserver does, from a forked process
+    for the duration of the block; yield its base URL. The server opens its
+    own connections, so use it with scratch_database(on_disk=True).
+    """
+    context = multiprocessing.get_context('fork')
+    ports = context.Queue()
+    connections.close_all()
+    process = context.Process(target=_serve, args=(host, ports), daemon=True)
+    process.start()
+    try:
+        yield f'http://{host}:{ports.get(timeout=30)}'
+    finally:
+        process.terminate()
+        process.join()
+
+
+class _RequestHandler(QuietWSGIRequestHandler):
+    # Headers and body go out in separate writes; without this, every
+    # keep-alive response waits out the client's delayed ACK (~40ms)
+    disable_nagle_algorithm = True
+
+
+def _serve(host, ports):
+    server = ThreadedWSGIServer((host, 0), _RequestHandler, allow_reuse_address=False)
+    server.set_app(WSGIHandler())
+    ports.put(server.server_port)
+    server.serve_forever()
+
+
+def percentile(timings, fraction):
+    """The `fraction` quantile (0.99 for p99) of a non-empty list of timings"""
+    ordered = sorted(timings)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
@@ -0,0 +1,162 @@
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from library_app.harness import percentile, scratch_database
+from library_app.models import User, Book, Rental, Review
+
+ENDPOINTS = [
+    ('book list', '/api/books/?count=true'),
+    ('available', '/api/books/available/'),
+    ('book detail', '/api/books/{book}/'),
+    ('book reviews', '/api/books/{book}/reviews/?count=true'),
+    ('my rentals', '/api/rentals/my_rentals/'),
+    ('dashboard', '/api/dashboard/'),
+]
+
+
+class QueryLatency:
+    """
+    Holds every query on every connection for `seconds` first, standing in
+    for the network round trip to a database server. Connections opened
+    later (each thread opens its own) are covered as they connect.
+    """
+
+    def __init__(self):
+        self.seconds = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        if self.seconds:
+            time.sleep(self.seconds)
+        return execute(sql, params, many, context)
+
+    def install(self, connection, **kwargs):
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+
+class Command(BaseCommand):
+    help = 'Compare the sync read endpoints under WSGI threads with their async copies under ASGI, with simulated DB latency'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Requests per endpoint and server')
+        parser.add_argument('--concurrency', type=int, default=32, help='Clients with a request in flight')
+        parser.add_argument('--wsgi-threads', type=int, default=4,
+                            help='Worker threads of the WSGI server the clients share')
+        parser.add_argument('--latency', type=float, default=20.0,
+                            help='Milliseconds added to every query (0 for none)')
+        parser.add_argument('--books', type=int, default=200)
+
+    def handle(self, *args, **options):
+        latency = QueryLatency()
+        connection_created.connect(latency.install)
+        # Every request must reach the database, so nothing is served from a cache
+        with override_settings(RESPONSE_CACHE_TIMEOUT=0, DASHBOARD_CACHE_TIMEOUT=0), \
+                scratch_database(on_disk=True):
+            token, book = self.populate(options)
+            for connection in connections.all():
+                latency.install(connection)
+            latency.seconds = options['latency'] / 1000
+
+            self.stdout.write(
+                f'{"endpoint":<13} {"server":<5} {"req/s":>8} {"p50 ms":>8} {"p99 ms":>8} {"speedup":>8}'
+            )
+            failures = []
+            for name, path in ENDPOINTS:
+                path = path.format(book=book.pk)
+                wsgi = self.run_wsgi(path, token, options)
+                asgi = asyncio.run(self.run_asgi(path.replace('/api/', '/api/async/', 1), token, options))
+                for server, (rate, timings, bodies) in (('wsgi', wsgi), ('asgi', asgi)):
+                    speedup = rate / wsgi[0]
+                    self.stdout.write(
+                        f'{name:<13} {server:<5} {rate:>8.1f} {statistics.median(timings) * 1000:>8.1f} '
+                        f'{percentile(timings, 0.99) * 1000:>8.1f} {speedup:>7.2f}x'
+                    )
+                errors = self.compare(name, wsgi[2], asgi[2])
+                for error in errors:
+                    self.stdout.write(self.style.ERROR(f'    {error}'))
+                failures.extend(errors)
+            latency.seconds = 0
+        connection_created.disconnect(latency.install)
+
+        if failures:
+            raise CommandError(f'{len(failures)} check(s) failed')
+        self.stdout.write(self.style.SUCCESS('Both servers answered every request with the same bodies'))
+
+    def populate(self, options):
+        owner = User.objects.create_user('asgi_owner', password='x', role='owner')
+        renter = User.objects.create_user('asgi_renter', password='x', role='renter')
+        books = Book.objects.bulk_create([
+            Book(title=f'Benchmark book {i}', author='Author', owner=owner,
+                 status='available' if i % 3 else 'rented')
+            for i in range(options['books'])
+        ])
+        start = date.today() + timedelta(days=7)
+        Rental.objects.bulk_create([
+            Rental(book=book, renter=renter, start_date=start, end_date=start + timedelta(days=6))
+            for book in books[:30]
+        ])
+        Review.objects.create(book=books[0], user=renter, rating=4, comment='Worth a read')
+        return str(AccessToken.for_user(renter)), books[0]
+
+    def run_wsgi(self, path, token, options):
+        """
+        `concurrency` clients in a closed loop, their requests queued first
+        come first served for `wsgi_threads` workers, like a threaded server
+        """
+        client = Client(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+        def fetch(_):
+            sent = time.perf_counter()
+            response = server.submit(client.get, path).result()
+            return time.perf_counter() - sent, response
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(options['wsgi_threads']) as server, \
+                ThreadPoolExecutor(options['concurrency']) as clients:
+            results = list(clients.map(fetch, range(options['requests'])))
+            elapsed = time.perf_counter() - started
+        return self.summarize(results, elapsed)
+
+    async def run_asgi(self, path, token, options):
+        """`concurrency` clients in a closed loop against one event loop"""
+        client = AsyncClient()
+        headers = {'Authorization': f'Bearer {token}'}
+        in_flight = asyncio.Semaphore(options['concurrency'])
+
+        async def fetch():
+            async with in_flight:
+                sent = time.perf_counter()
+                response = await client.get(path, headers=headers)
+                return time.perf_counter() - sent, response
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*(fetch() for _ in range(options['requests'])))
+        return self.summarize(results, time.perf_counter() - started)
+
+    @staticmethod
+    def summarize(results, elapsed):
+        timings = [timing for timing, _ in results]
+        bodies = [(response.status_code, response.content) for _, response in results]
+        return len(results) / elapsed, timings, bodies
+
+    @staticmethod
+    def compare(name, wsgi, asgi):
+        """Every response succeeded, and both servers sent the same body apart from link prefixes"""
+        errors = []
+        for server, bodies in (('wsgi', wsgi), ('asgi', asgi)):
+            codes = sorted({code for code, _ in bodies if code != 200})
+            if codes:
+                errors.append(f'{name}: {server} answered {codes}')
+        if wsgi[0][1] != asgi[0][1].replace(b'/api/async/', b'/api/'):
+            errors.append(f'{name}: the async body differs from the sync one')
+        return errors
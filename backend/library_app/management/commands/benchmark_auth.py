@@ -0,0 +1,76 @@
+import time
+from unittest import mock
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from library_app.authentication import CachedJWTAuthentication, user_cache
+from library_app.harness import api_client_for, scratch_database
+from library_app.models import User, Book
+
+# Read endpoints a logged-in session hits over and over
+PATHS = [
+    '/api/users/me/',
+    '/api/books/',
+    '/api/books/available/',
+    '/api/rentals/my_rentals/',
+    '/api/reviews/my_reviews/',
+    '/api/dashboard/',
+]
+
+
+class Command(BaseCommand):
+    help = 'Compare queries and latency per request with and without the authenticated-user cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--rounds', type=int, default=20,
+                            help='Times each user requests every path')
+
+    def handle(self, *args, **options):
+        with scratch_database():
+            users = [
+                User.objects.create_user(f'auth_user{i}', password='x', role=('owner', 'renter')[i % 2])
+                for i in range(options['users'])
+            ]
+            Book.objects.bulk_create([
+                Book(title=f'Book {i}', author='Author', owner=users[0]) for i in range(50)
+            ])
+            clients = [api_client_for(user) for user in users]
+
+            # Plain simplejwt lookup: one SELECT on library_app_user per request
+            with mock.patch.object(CachedJWTAuthentication, 'get_user', JWTAuthentication.get_user):
+                uncached = self.measure(clients, options['rounds'])
+            user_cache.clear()
+            cached = self.measure(clients, options['rounds'])
+
+        self.stdout.write(f'{"":<10} {"requests":>9} {"queries/req":>12} {"user queries/req":>17} {"ms/req":>8}')
+        for name, (requests, queries, user_queries, elapsed) in (('uncached', uncached), ('cached', cached)):
+            self.stdout.write(
+                f'{name:<10} {requests:>9} {queries / requests:>12.2f} '
+                f'{user_queries / requests:>17.3f} {elapsed * 1000 / requests:>8.2f}'
+            )
+        if cached[2] >= uncached[2]:
+            raise CommandError('The user cache did not reduce user lookups')
+        self.stdout.write(self.style.SUCCESS(
+            f'User lookups per request: {uncached[2] / uncached[0]:.2f} -> {cached[2] / cached[0]:.3f}'
+        ))
+
+    def measure(self, clients, rounds):
+        requests = queries = user_queries = 0
+        started = time.perf_counter()
+        for _ in range(rounds):
+            for client in clients:
+                for path in PATHS:
+                    with CaptureQueriesContext(connection) as ctx:
+                        response = client.get(path)
+                    if response.status_code != 200:
+                        raise CommandError(f'{path}: HTTP {response.status_code}')
+                    requests += 1
+                    queries += len(ctx.captured_queries)
+                    user_queries += sum(
+                        'FROM "library_app_user" WHERE' in query['sql'] for query in ctx.captured_queries
+                    )
+        return requests, queries, user_queries, time.perf_counter() - started
@@ -0,0 +1,68 @@
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand, CommandError
+
+from library_app.harness import api_client_for, scratch_database
+from library_app.models import User, Book
+
+
+class Command(BaseCommand):
+    help = 'Stream the book export at growing table sizes; check time-to-first-byte and memory stay flat'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000],
+                            help='Table sizes to measure at (rows are added cumulatively)')
+        parser.add_argument('--format', choices=['csv', 'ndjson'], default='csv')
+        parser.add_argument('--max-ttfb-ms', type=float, default=100)
+        parser.add_argument('--max-memory-mb', type=float, default=50,
+                            help='Peak Python memory allowed while streaming one export')
+        parser.add_argument('--batch-size', type=int, default=10_000)
+
+    def handle(self, *args, **options):
+        failures = []
+        with scratch_database():
+            admin = User.objects.create_user('bench_admin', password='x', role='admin')
+            owner = User.objects.create_user('bench_owner', password='x', role='owner')
+            client = api_client_for(admin)
+
+            self.stdout.write(f'{"rows":>10} {"ttfb":>10} {"total":>10} {"rows/s":>10} {"MB sent":>9} {"peak MB":>9}')
+            loaded = 0
+            for size in sorted(options['sizes']):
+                loaded = self.load(owner, loaded, size, options['batch_size'])
+
+                tracemalloc.start()
+                started = time.perf_counter()
+                response = client.get(f'/api/books/export/?format={options["format"]}')
+                chunks = iter(response.streaming_content)
+                sent = len(next(chunks))
+                ttfb = (time.perf_counter() - started) * 1000
+                # Count the body without keeping it, as a socket would
+                for chunk in chunks:
+                    sent += len(chunk)
+                total = time.perf_counter() - started
+                peak = tracemalloc.get_traced_memory()[1] / 1e6
+                tracemalloc.stop()
+
+                self.stdout.write(
+                    f'{size:>10} {ttfb:>8.1f}ms {total:>9.2f}s {size / total:>10.0f} '
+                    f'{sent / 1e6:>9.1f} {peak:>9.1f}'
+                )
+                if ttfb > options['max_ttfb_ms']:
+                    failures.append(f'{size} rows: first byte after {ttfb:.1f}ms')
+                if peak > options['max_memory_mb']:
+                    failures.append(f'{size} rows: peak memory {peak:.1f}MB')
+
+        if failures:
+            raise CommandError('Export budget exceeded:\n  ' + '\n  '.join(failures))
+        self.stdout.write(self.style.SUCCESS('Time-to-first-byte and memory within budget at every size'))
+
+    def load(self, owner, start, stop, batch_size):
+        for lo in range(start, stop, batch_size):
+            hi = min(lo + batch_size, stop)
+            Book.objects.bulk_create(
+                [Book(title=f'Book {i}', author=f'Author {i % 997}', isbn=f'978{i:010d}', owner=owner)
+                 for i in range(lo, hi)],
+                batch_size=batch_size,
+            )
+        return stop
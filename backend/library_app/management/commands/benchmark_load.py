@@ -0,0 +1,304 @@
+import http.client
+import io
+import itertools
+import json
+import random
+import statistics
+import threading
+import time
+from datetime import date, timedelta
+from urllib.parse import urlencode, urlsplit
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, Q
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from library_app import synthetic
+from library_app.harness import live_server, percentile, scratch_database
+from library_app.models import User, Book
+
+# Relative weights of the actions a client picks from, per traffic mix
+MIXES = {
+    'browse': {
+        'catalog': 30, 'available': 15, 'book': 25, 'reviews': 10, 'search': 10, 'top_rated': 10,
+    },
+    'mixed': {
+        'catalog': 20, 'available': 10, 'book': 20, 'reviews': 8, 'search': 8, 'top_rated': 4,
+        'dashboard': 15, 'my_rentals': 8, 'rental_cycle': 5, 'refresh': 2,
+    },
+    'rentals': {
+        'rental_cycle': 50, 'my_rentals': 20, 'dashboard': 20, 'refresh': 10,
+    },
+}
+SEARCH_TERMS = [word.lower() for word in synthetic.TITLE_WORDS] + list(synthetic.CATEGORIES)
+# Endpoints with fewer measured requests are reported but not judged against
+# a baseline; their p95 is too noisy
+MIN_COMPARED_REQUESTS = 200
+# Rental cycles book these dates and later, clear of the generated history
+CYCLE_START = date.today() + timedelta(days=synthetic.FUTURE_DAYS + 30)
+
+
+class Client:
+    """
+    One simulated user on a keep-alive connection. Each client is a renter
+    with an owner account of its own, whose available books only it books,
+    so rental cycles never race each other.
+    """
+
+    def __init__(self, base_url, renter, owner, books, popular_books, cycles, seed):
+        self.address = urlsplit(base_url).netloc
+        self.connection = http.client.HTTPConnection(self.address, timeout=60)
+        self.rng = random.Random(seed)
+        self.tokens = {'renter': self.pair(renter), 'owner': self.pair(owner)}
+        self.books = books
+        self.popular_books, self.popularity = popular_books
+        self.cycles = cycles
+        self.samples = []
+
+    @staticmethod
+    def pair(user):
+        refresh = RefreshToken.for_user(user)
+        return {'access': str(refresh.access_token), 'refresh': str(refresh)}
+
+    def request(self, label, method, path, body=None, as_user='renter', expect=(200,)):
+        headers = {'Content-Type': 'application/json'}
+        if as_user:
+            headers['Authorization'] = f'Bearer {self.tokens[as_user]["access"]}'
+        payload = json.dumps(body) if body is not None else None
+        started = time.perf_counter()
+        try:
+            self.connection.request(method, path, payload, headers)
+            response = self.connection.getresponse()
+            content = response.read()
+        except (ConnectionError, http.client.HTTPException):
+            # The server dropped the keep-alive connection; reconnect and retry once
+            self.connection.close()
+            self.connection = http.client.HTTPConnection(self.address, timeout=60)
+            self.connection.request(method, path, payload, headers)
+            response = self.connection.getresponse()
+            content = response.read()
+        self.samples.append((f'{method} {label}', started, time.perf_counter() - started, response.status in expect))
+        return json.loads(content) if response.status in expect and content else None
+
+    def book_id(self):
+        return self.rng.choices(self.popular_books, cum_weights=self.popularity)[0]
+
+    def catalog(self):
+        params = {'page_size': 20}
+        if self.rng.random() < 0.3:
+            params['category'] = self.rng.choice(list(synthetic.CATEGORIES))
+        self.request('/api/books/', 'GET', f'/api/books/?{urlencode(params)}')
+
+    def available(self):
+        self.request('/api/books/available/', 'GET', '/api/books/available/?page_size=20')
+
+    def book(self):
+        self.request('/api/books/{id}/', 'GET', f'/api/books/{self.book_id()}/')
+
+    def reviews(self):
+        self.request('/api/books/{id}/reviews/', 'GET', f'/api/books/{self.book_id()}/reviews/')
+
+    def search(self):
+        query = urlencode({'q': self.rng.choice(SEARCH_TERMS)})
+        self.request('/api/books/search/', 'GET', f'/api/books/search/?{query}')
+
+    def top_rated(self):
+        self.request('/api/books/top_rated/', 'GET', '/api/books/top_rated/')
+
+    def dashboard(self):
+        self.request('/api/dashboard/', 'GET', '/api/dashboard/', as_user=self.rng.choice(['renter', 'owner']))
+
+    def my_rentals(self):
+        self.request('/api/rentals/my_rentals/', 'GET', '/api/rentals/my_rentals/')
+
+    def rental_cycle(self):
+        """Request a book, have its owner approve, then return it"""
+        if not self.books:
+            return
+        start = CYCLE_START + timedelta(days=4 * next(self.cycles))
+        rental = self.request('/api/rentals/', 'POST', '/api/rentals/', {
+            'book': self.rng.choice(self.books), 'start_date': str(start), 'end_date': str(start + timedelta(days=2)),
+        }, expect=(201,))
+        if rental is None:
+            return
+        path = f'/api/rentals/{rental["id"]}'
+        if self.request('/api/rentals/{id}/approve/', 'POST', f'{path}/approve/', as_user='owner'):
+            self.request('/api/rentals/{id}/complete/', 'POST', f'{path}/complete/')
+
+    def refresh(self):
+        role = self.rng.choice(['renter', 'owner'])
+        tokens = self.request('/api/token/refresh/', 'POST', '/api/token/refresh/',
+                              {'refresh': self.tokens[role]['refresh']}, as_user=None)
+        if tokens:
+            # Refresh tokens rotate; the old one is spent
+            self.tokens[role] = {**self.tokens[role], **tokens}
+
+    def run(self, mix, deadline):
+        actions, weights = zip(*MIXES[mix].items())
+        while time.perf_counter() < deadline:
+            getattr(self, self.rng.choices(actions, weights)[0])()
+        self.connection.close()
+
+
+def summarize(samples, seconds):
+    """Per-endpoint and overall throughput, latency percentiles and error counts"""
+    by_endpoint = {}
+    for label, latency, ok in samples:
+        by_endpoint.setdefault(label, []).append((latency, ok))
+    by_endpoint['all'] = [(latency, ok) for _, latency, ok in samples]
+    results = {}
+    for label, rows in by_endpoint.items():
+        timings = [latency for latency, _ in rows]
+        results[label] = {
+            'requests': len(rows),
+            'errors': sum(not ok for _, ok in rows),
+            'rps': round(len(rows) / seconds, 2),
+            'p50_ms': round(statistics.median(timings) * 1000, 2),
+            'p95_ms': round(percentile(timings, 0.95) * 1000, 2),
+            'p99_ms': round(percentile(timings, 0.99) * 1000, 2),
+        }
+    return results
+
+
+class Command(BaseCommand):
+    help = ('Replay a traffic mix over HTTP against the API on generated data; report throughput and '
+            'p50/p95/p99 per endpoint, and compare with a saved baseline')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mix', choices=sorted(MIXES), default='mixed')
+        parser.add_argument('--clients', type=int, default=8, help='Concurrent clients')
+        parser.add_argument('--duration', type=float, default=20, help='Measured seconds')
+        parser.add_argument('--warmup', type=float, default=3, help='Seconds of traffic before measuring')
+        parser.add_argument('--users', type=int, default=2000)
+        parser.add_argument('--books', type=int, default=10000)
+        parser.add_argument('--rentals', type=int, default=40000)
+        parser.add_argument('--seed', type=int, default=1, help='Seed of the data and of the clients')
+        parser.add_argument('--save-baseline', metavar='PATH', help='Write the results to PATH as JSON')
+        parser.add_argument('--baseline', metavar='PATH',
+                            help='Fail if throughput or p95 is worse than in this saved run')
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help='Allowed slowdown against the baseline, as a fraction')
+
+    def handle(self, *args, **options):
+        baseline = self.read_baseline(options['baseline'])
+        with scratch_database(on_disk=True):
+            self.stdout.write('Generating data...')
+            call_command('generate_data', users=options['users'], books=options['books'],
+                         rentals=options['rentals'], seed=options['seed'],
+                         stdout=io.StringIO())
+            clients_setup = self.client_accounts(options['clients'])
+
+            with live_server() as base_url:
+                self.stdout.write(f'Serving at {base_url}; {options["clients"]} clients, '
+                                  f'{options["mix"]} mix, {options["duration"]:.0f}s')
+                popular = self.popular_books(options['seed'])
+                cycles = itertools.count()
+                clients = [
+                    Client(base_url, renter, owner, books, popular, cycles, seed=f'{options["seed"]}:{n}')
+                    for n, (renter, owner, books) in enumerate(clients_setup)
+                ]
+                warmup_until = time.perf_counter() + options['warmup']
+                deadline = warmup_until + options['duration']
+                threads = [
+                    threading.Thread(target=client.run, args=(options['mix'], deadline))
+                    for client in clients
+                ]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+
+        # Requests sent during the warmup are not measured
+        samples = [(label, latency, ok) for client in clients
+                   for label, started, latency, ok in client.samples if started >= warmup_until]
+        if not samples:
+            raise CommandError('No request completed within the run')
+        results = summarize(samples, options['duration'])
+        self.report(results, baseline)
+
+        if options['save_baseline']:
+            with open(options['save_baseline'], 'w') as f:
+                json.dump({
+                    'settings': {name: options[name] for name in
+                                 ('mix', 'clients', 'duration', 'users', 'books', 'rentals', 'seed')},
+                    'endpoints': results,
+                }, f, indent=2, sort_keys=True)
+            self.stdout.write(f'Saved the baseline to {options["save_baseline"]}')
+
+        failures = [f'{label}: {row["errors"]} failed requests'
+                    for label, row in results.items() if label != 'all' and row['errors']]
+        if baseline is not None:
+            changed = {name: value for name, value in baseline['settings'].items() if options[name] != value}
+            if changed:
+                self.stdout.write(self.style.WARNING(f'The baseline ran with different settings: {changed}'))
+            failures += self.regressions(results, baseline['endpoints'], options['tolerance'])
+        if failures:
+            for failure in failures:
+                self.stdout.write(self.style.ERROR(f'    {failure}'))
+            raise CommandError(f'{len(failures)} check(s) failed')
+        self.stdout.write(self.style.SUCCESS('No errors' + (' and no regressions' if baseline else '')))
+
+    def read_baseline(self, path):
+        if path is None:
+            return None
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError) as exc:
+            raise CommandError(f'Cannot read the baseline {path}: {exc}')
+
+    def client_accounts(self, count):
+        """(renter, owner, the owner's available book ids) per client, every account different"""
+        renters = list(User.objects.filter(role='renter').order_by('id')[:count])
+        owners = list(
+            User.objects.filter(role='owner')
+            .annotate(available=Count('owned_books', filter=Q(owned_books__status='available')))
+            .filter(available__gt=0).order_by('-available', 'id')[:count]
+        )
+        if len(renters) < count or len(owners) < count:
+            raise CommandError(f'The data has too few renters or owners with books for {count} clients')
+        return [
+            (renter, owner, list(Book.objects.filter(owner=owner, status='available')
+                                 .values_list('id', flat=True)[:50]))
+            for renter, owner in zip(renters, owners)
+        ]
+
+    @staticmethod
+    def popular_books(seed):
+        """Book ids by a Zipf law over a random popularity order, as random.choices() input"""
+        ids = list(Book.objects.values_list('id', flat=True))
+        random.Random(seed).shuffle(ids)
+        return ids, synthetic.zipf_weights(len(ids), 1.0)
+
+    def report(self, results, baseline):
+        base = baseline['endpoints'] if baseline else {}
+        self.stdout.write(
+            f'{"endpoint":<40} {"reqs":>6} {"err":>4} {"req/s":>8} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8}'
+            + (f' {"Δ req/s":>8} {"Δ p95":>7}' if baseline else '')
+        )
+        for label in sorted(results, key=lambda label: (label == 'all', label)):
+            row = results[label]
+            line = (f'{label:<40} {row["requests"]:>6} {row["errors"]:>4} {row["rps"]:>8.1f} '
+                    f'{row["p50_ms"]:>8.1f} {row["p95_ms"]:>8.1f} {row["p99_ms"]:>8.1f}')
+            if label in base:
+                line += (f' {self.change(row["rps"], base[label]["rps"]):>8}'
+                         f' {self.change(row["p95_ms"], base[label]["p95_ms"]):>7}')
+            self.stdout.write(line)
+
+    @staticmethod
+    def change(value, before):
+        return f'{(value - before) / before:+.0%}' if before else 'n/a'
+
+    @staticmethod
+    def regressions(results, base, tolerance):
+        failures = []
+        for label, before in base.items():
+            row = results.get(label)
+            if row is None or min(row['requests'], before['requests']) < MIN_COMPARED_REQUESTS:
+                continue
+            if row['rps'] < before['rps'] * (1 - tolerance):
+                failures.append(f'{label}: {row["rps"]} req/s, baseline {before["rps"]}')
+            if row['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+                failures.append(f'{label}: p95 {row["p95_ms"]} ms, baseline {before["p95_ms"]}')
+        return failures
@@ -0,0 +1,62 @@
+import time
+
+from django.core.management.base import BaseCommand
+from rest_framework.pagination import Cursor
+
+from library_app.harness import api_client_for, scratch_database
+from library_app.models import User, Book
+from library_app.pagination import KeysetPagination
+
+
+class Command(BaseCommand):
+    help = 'Show that keyset page latency stays flat as the books table grows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000],
+                            help='Table sizes to measure at (rows are added cumulatively)')
+        parser.add_argument('--repeat', type=int, default=20,
+                            help='Requests per measurement; the median is reported')
+        parser.add_argument('--batch-size', type=int, default=10_000)
+
+    def handle(self, *args, **options):
+        with scratch_database():
+            owner = User.objects.create_user('bench_owner', password='x', role='owner')
+            client = api_client_for(owner)
+            paginator = KeysetPagination()
+            paginator.base_url = '/api/books/'
+
+            self.stdout.write(f'{"rows":>10} {"page 1":>10} {"deep cursor":>12} {"deep offset":>12}')
+            loaded = 0
+            for size in sorted(options['sizes']):
+                loaded = self.load(owner, loaded, size, options['batch_size'])
+
+                # A cursor positioned 90% of the way through the table
+                deep_id = Book.objects.order_by('-id').values_list('id', flat=True)[size * 9 // 10]
+                deep_url = paginator.encode_cursor(Cursor(offset=0, reverse=False, position=str(deep_id)))
+
+                first = self.median(options['repeat'], lambda: client.get('/api/books/'))
+                deep = self.median(options['repeat'], lambda: client.get(deep_url))
+                # What the old PageNumberPagination did for the same page
+                offset = self.median(options['repeat'], lambda: (
+                    Book.objects.count(),
+                    list(Book.objects.select_related('owner')[size * 9 // 10:size * 9 // 10 + 10]),
+                ))
+                self.stdout.write(f'{size:>10} {first:>8.2f}ms {deep:>10.2f}ms {offset:>10.2f}ms')
+
+    def load(self, owner, start, stop, batch_size):
+        for lo in range(start, stop, batch_size):
+            hi = min(lo + batch_size, stop)
+            Book.objects.bulk_create(
+                [Book(title=f'Book {i}', author=f'Author {i % 997}', owner=owner) for i in range(lo, hi)],
+                batch_size=batch_size,
+            )
+        return stop
+
+    def median(self, repeat, fn):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            fn()
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        return timings[len(timings) // 2]
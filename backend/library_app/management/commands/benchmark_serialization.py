@@ -0,0 +1,139 @@
+import random
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer as DRFJSONRenderer
+
+from library_app.harness import scratch_database
+from library_app.models import User, Book, Rental, Review, Payment
+from library_app.readers import reader
+from library_app.renderers import JSONRenderer, MessagePackRenderer
+from library_app.serializers import BookSerializer, PaymentSerializer, RentalSerializer, ReviewSerializer
+
+# (name, rows as the list views read them, serializer)
+LISTS = [
+    ('books', lambda: Book.objects.select_related('owner'), BookSerializer),
+    ('rentals', lambda: Rental.objects.select_related('renter', 'book'), RentalSerializer),
+    ('reviews', lambda: Review.objects.select_related('user', 'book'), ReviewSerializer),
+    ('payments', lambda: Payment.objects.select_related('rental__renter', 'rental__book'), PaymentSerializer),
+]
+# Titles with the characters JSON encoders disagree on
+TITLES = ['Book {}', 'Café {}', 'Tōkyō Nights {}', 'Quotes "{}" \\ and tabs\t', 'Line separator {}',
+          'Emoji \U0001F4DA {}', 'Control \x01 {}']
+
+
+class Command(BaseCommand):
+    help = ('Time serializing and rendering list pages through ModelSerializer and DRF\'s JSON renderer '
+            'against values() readers with orjson and MessagePack, per 10k rows; checks the bytes match')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10_000, help='Rows of each model to time')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per measurement; the fastest counts')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        rows = options['rows']
+        failures = []
+        with scratch_database():
+            self.populate(rows, random.Random(options['seed']))
+            self.stdout.write(
+                f'{"list":<9} {"path":<18} {"fetch":>9} {"serialize":>10} {"render":>9} '
+                f'{"ser+render":>11} {"speedup":>8}   (ms per 10k rows)'
+            )
+            for name, queryset, serializer_class in LISTS:
+                lookups, convert = reader(serializer_class)
+                slow = self.measure(
+                    options['repeat'], lambda: list(queryset()),
+                    lambda objects: serializer_class(objects, many=True).data, DRFJSONRenderer().render,
+                )
+                paths = [
+                    ('serializer+json', slow),
+                    ('values+orjson', self.measure(
+                        options['repeat'], lambda: list(queryset().values(*lookups)), convert,
+                        JSONRenderer().render,
+                    )),
+                    ('values+msgpack', self.measure(
+                        options['repeat'], lambda: list(queryset().values(*lookups)), convert,
+                        MessagePackRenderer().render,
+                    )),
+                ]
+                baseline = slow['serialize'] + slow['render']
+                for path, result in paths:
+                    scale = 10_000 / rows * 1000
+                    both = result['serialize'] + result['render']
+                    self.stdout.write(
+                        f'{name:<9} {path:<18} {result["fetch"] * scale:>9.1f} {result["serialize"] * scale:>10.1f} '
+                        f'{result["render"] * scale:>9.1f} {both * scale:>11.1f} {baseline / both:>7.1f}x'
+                    )
+
+                # The fast path must produce the serializer's bytes
+                if paths[1][1]['content'] != slow['content']:
+                    failures.append(f'{name}: JSON differs ({self.first_difference(paths[1][1], slow)})')
+                if paths[2][1]['content'] != MessagePackRenderer().render(slow['data']):
+                    failures.append(f'{name}: MessagePack differs from the serializer data')
+
+        if failures:
+            raise CommandError('Fast path output differs:\n  ' + '\n  '.join(failures))
+        self.stdout.write(self.style.SUCCESS('Fast path output matches the serializers byte for byte'))
+
+    def measure(self, repeat, fetch, serialize, render):
+        """Fastest seconds of each stage over `repeat` runs, with the last run's data and bytes"""
+        best = {'fetch': float('inf'), 'serialize': float('inf'), 'render': float('inf')}
+        for _ in range(repeat):
+            started = time.perf_counter()
+            rows = fetch()
+            fetched = time.perf_counter()
+            data = serialize(rows)
+            serialized = time.perf_counter()
+            content = render(data)
+            rendered = time.perf_counter()
+            best['fetch'] = min(best['fetch'], fetched - started)
+            best['serialize'] = min(best['serialize'], serialized - fetched)
+            best['render'] = min(best['render'], rendered - serialized)
+        return {**best, 'data': data, 'content': content}
+
+    def first_difference(self, fast, slow):
+        for fast_row, slow_row in zip(fast['data'], slow['data']):
+            if DRFJSONRenderer().render(fast_row) != DRFJSONRenderer().render(slow_row):
+                return f'first at id {slow_row["id"]}: {dict(fast_row)} != {dict(slow_row)}'
+        return 'in the rendering'
+
+    def populate(self, rows, rng):
+        users = User.objects.bulk_create([
+            User(username=f'bench_user{i}', role=('owner', 'renter')[i % 2], password='!')
+            for i in range(100)
+        ])
+        today = date.today()
+        books = []
+        for i in range(rows):
+            counts = [rng.randint(0, 20) for _ in range(5)]
+            total = sum(counts)
+            books.append(Book(
+                title=rng.choice(TITLES).format(i), author=f'Author {i % 997}',
+                isbn=f'978{i:010d}' if i % 7 else None, owner=users[i % 100],
+                category=rng.choice(['Fiction', 'Poetry', None]),
+                status=rng.choice(['available', 'rented', 'unavailable']),
+                rating_count=total, rating_sum=sum(star * n for star, n in zip(range(1, 6), counts)),
+                rating_average=sum(star * n for star, n in zip(range(1, 6), counts)) / total if total else 0.0,
+                **{f'rating_{star}': n for star, n in zip(range(1, 6), counts)},
+            ))
+        books = Book.objects.bulk_create(books, batch_size=5_000)
+        rentals = Rental.objects.bulk_create([
+            Rental(renter=users[(i * 7) % 100], book=books[i], start_date=today - timedelta(days=i % 400),
+                   end_date=today - timedelta(days=i % 400 - 14), status=rng.choice(['completed', 'canceled']))
+            for i in range(rows)
+        ], batch_size=5_000)
+        Review.objects.bulk_create([
+            Review(book=books[i], user=users[(i * 3) % 100], rating=rng.randint(1, 5),
+                   comment=rng.choice([None, '', 'Très bien', f'Read it twice ({i})']))
+            for i in range(rows)
+        ], batch_size=5_000)
+        Payment.objects.bulk_create([
+            Payment(rental=rentals[i], amount=Decimal(rng.randint(0, 10_000)).scaleb(-2),
+                    status=rng.choice(['pending', 'completed', 'refunded']),
+                    transaction_id=f'TR-{i}' if i % 5 else None,
+                    billing_period=today.replace(day=1) if i % 3 == 0 else None)
+            for i in range(rows)
+        ], batch_size=5_000)
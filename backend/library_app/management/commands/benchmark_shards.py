@@ -0,0 +1,152 @@
+import multiprocessing
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test.utils import override_settings
+
+from library_app import sharding
+from library_app.harness import add_sqlite_database, api_client_for, scratch_database
+from library_app.models import User, Book, Rental
+
+
+def shard_config(shards, hostels):
+    """Hostel h on shard h % shards; shard 0 is 'default', which takes unlisted hostels"""
+    return {
+        f'shard_{n}': {'slot': n, 'hostels': [str(h) for h in hostels if h % shards == n]}
+        for n in range(1, shards)
+    }
+
+
+def write_rentals(job):
+    """
+    Worker process: one hostel's renter books that hostel's books through
+    the API, a week at a time so no two requests overlap. With a `latency`,
+    every INSERT and UPDATE is held for that many seconds first, standing in
+    for the disk flush a real database waits on while it holds its write
+    lock; the sleep, not SQLite, then sets the pace.
+    """
+    renter, book_ids, writes, latency = job
+
+    def slow_writes(execute, sql, params, many, context):
+        if latency and sql.lstrip()[:6].upper() in ('INSERT', 'UPDATE'):
+            time.sleep(latency)
+        return execute(sql, params, many, context)
+
+    client = api_client_for(renter)
+    first = date.today() + timedelta(days=7)
+    codes = []
+    wrappers = [connections[alias].execute_wrapper(slow_writes) for alias in connections]
+    for wrapper in wrappers:
+        wrapper.__enter__()
+    try:
+        for n in range(writes):
+            start = first + timedelta(weeks=n // len(book_ids))
+            response = client.post('/api/rentals/', {
+                'book': book_ids[n % len(book_ids)], 'start_date': start,
+                'end_date': start + timedelta(days=6),
+            }, format='json')
+            codes.append(response.status_code)
+    finally:
+        for wrapper in reversed(wrappers):
+            wrapper.__exit__(None, None, None)
+        connections.close_all()
+    return codes
+
+
+class Command(BaseCommand):
+    help = ('Measure rental-write throughput as the same hostels are spread over more local SQLite shards, '
+            'unthrottled and, with --write-latency, with a simulated per-write lock hold')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shards', type=int, nargs='+', default=[1, 2, 4],
+                            help="Shard counts to compare; 1 keeps everything on 'default'")
+        parser.add_argument('--hostels', type=int, default=4,
+                            help='Hostels, each written to by its own process')
+        parser.add_argument('--books-per-hostel', type=int, default=10)
+        parser.add_argument('--writes', type=int, default=200, help='Rentals created per hostel')
+        parser.add_argument('--write-latency', type=float, default=0.0,
+                            help='Also measure with each write statement holding its lock this many '
+                                 'milliseconds, a simulated disk flush (default 0: unthrottled only)')
+
+    def handle(self, *args, **options):
+        for n in range(1, max(options['shards'])):
+            add_sqlite_database(f'shard_{n}')
+
+        # Unthrottled numbers always; the simulated flush only next to them,
+        # as it alone can make the speedup look linear
+        latencies = [0.0] + ([options['write_latency']] if options['write_latency'] > 0 else [])
+        self.stdout.write(
+            f'{"latency":>9} {"shards":>6} {"writes":>7} {"seconds":>8} {"writes/s":>9} {"speedup":>8}'
+        )
+        failures = []
+        for latency in latencies:
+            baseline = None
+            for shards in options['shards']:
+                hostels = range(options['hostels'])
+                with override_settings(DATABASE_SHARDS=shard_config(shards, hostels)), \
+                        scratch_database(on_disk=True):
+                    jobs = self.populate(hostels, options, latency / 1000)
+                    # Forked workers must open their own connections
+                    connections.close_all()
+                    started = time.perf_counter()
+                    with multiprocessing.get_context('fork').Pool(len(jobs)) as pool:
+                        codes = [code for result in pool.map(write_rentals, jobs) for code in result]
+                    elapsed = time.perf_counter() - started
+                    errors = self.verify(shards, hostels, options, codes)
+
+                rate = len(codes) / elapsed
+                baseline = baseline or rate
+                label = f'{latency:g}ms' if latency else 'none'
+                self.stdout.write(
+                    f'{label:>9} {shards:>6} {len(codes):>7} {elapsed:>8.2f} {rate:>9.1f} {rate / baseline:>7.2f}x'
+                )
+                for error in errors:
+                    self.stdout.write(self.style.ERROR(f'    {error}'))
+                failures.extend(errors)
+
+        if failures:
+            raise CommandError(f'{len(failures)} check(s) failed')
+        self.stdout.write(self.style.SUCCESS('Every row landed on its hostel\'s shard'))
+
+    def populate(self, hostels, options, latency):
+        jobs = []
+        for hostel in hostels:
+            owner = User.objects.create_user(f'owner{hostel}', password='x', role='owner',
+                                             hostel_number=str(hostel))
+            renter = User.objects.create_user(f'renter{hostel}', password='x', role='renter',
+                                              hostel_number=str(hostel))
+            with sharding.use(sharding.for_user(owner)):
+                books = Book.objects.bulk_create([
+                    Book(title=f'Hostel {hostel} book {i}', author='Author', owner=owner)
+                    for i in range(options['books_per_hostel'])
+                ])
+            jobs.append((renter, [book.pk for book in books], options['writes'], latency))
+        return jobs
+
+    def verify(self, shards, hostels, options, codes):
+        """Every write succeeded, on its hostel's shard, and merged reads see them all in order"""
+        errors = []
+        all_ids = []
+        if any(code != 201 for code in codes):
+            errors.append(f'{sum(code != 201 for code in codes)} writes failed: {sorted(set(codes))}')
+        for alias in sharding.aliases():
+            expected = sum(
+                options['writes'] for hostel in hostels
+                if sharding.for_hostel(hostel) == alias
+            )
+            rentals = Rental.objects.using(alias)
+            if rentals.count() != expected:
+                errors.append(f'{alias} holds {rentals.count()} rentals, expected {expected}')
+            ids = list(rentals.values_list('pk', flat=True))
+            all_ids.extend(ids)
+            if any(sharding.for_pk(pk) != alias for pk in ids):
+                errors.append(f'{alias} holds rentals outside its id range')
+
+        admin = User.objects.create_user('shard_admin', password='x', role='admin')
+        page = api_client_for(admin).get('/api/rentals/', {'count': 'true', 'page_size': 100}).json()
+        newest = sorted(all_ids, reverse=True)[:100]
+        if page['count'] != len(all_ids) or [row['id'] for row in page['results']] != newest:
+            errors.append('the merged rental list is incomplete or out of order')
+        return errors
@@ -0,0 +1,28 @@
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from library_app.billing import bill, month_start
+
+
+class Command(BaseCommand):
+    help = ("Bill late fees for approved and overdue rentals past their end date: one pending payment per rental and month, "
+            "safe to rerun")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', type=date.fromisoformat,
+                            help='Bill the month holding this date, counting late days up to it (YYYY-MM-DD); '
+                                 'defaults to the current date')
+        parser.add_argument('--chunk-size', type=int, help='Rentals per transaction (default LATE_FEE_CHUNK_SIZE)')
+
+    def handle(self, *args, **options):
+        as_of = options['date'] or date.today()
+        started = time.perf_counter()
+        counts = bill(as_of, options['chunk_size'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'{month_start(as_of):%Y-%m}: {counts["late"]} late rentals, {counts["created"]} fees created, '
+            f'{counts["updated"]} raised, their fees for the month total {counts["billed"] / 100:.2f}; '
+            f'{elapsed:.2f}s ({counts["late"] / elapsed:.0f} rentals/s)'
+        ))
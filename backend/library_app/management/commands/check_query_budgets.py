@@ -0,0 +1,164 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from library_app.harness import api_client_for, scratch_database
+from library_app.models import User, Book, Rental, Review, Payment
+from library_app.sync import delta_token
+
+# Maximum number of SQL queries each endpoint may run, including the one
+# spent loading request.user when it is not in the user cache yet. The budgets must not depend
+# on how many rows are returned; an N+1 shows up as a blown budget because
+# the sample data always holds more rows than a single page. Keyset pages
+# run no COUNT(*) unless the client asks for one with ?count=true.
+BUDGETS = [
+    # (name, user, method, path, budget)
+    ('users.me', 'renter', 'get', '/api/users/me/', 1),
+    ('users.list', 'admin', 'get', '/api/users/', 2),
+    ('books.list', 'renter', 'get', '/api/books/', 2),
+    ('books.list?count', 'renter', 'get', '/api/books/?count=true', 3),
+    ('books.retrieve', 'renter', 'get', '/api/books/{book}/', 2),
+    ('books.reviews', 'renter', 'get', '/api/books/{book}/reviews/', 3),
+    ('books.my_books', 'owner', 'get', '/api/books/my_books/', 2),
+    ('books.available', 'renter', 'get', '/api/books/available/', 2),
+    # get_object, then the open rentals inside the window and the one after it
+    ('books.availability', 'renter', 'get', '/api/books/{book}/availability/', 4),
+    ('rentals.list', 'renter', 'get', '/api/rentals/', 2),
+    ('rentals.retrieve', 'renter', 'get', '/api/rentals/{rental}/', 2),
+    ('rentals.my_rentals', 'renter', 'get', '/api/rentals/my_rentals/', 2),
+    ('rentals.my_book_rentals', 'owner', 'get', '/api/rentals/my_book_rentals/', 2),
+    # Book lookup, BEGIN, book lock, one-probe overlap check, INSERT, outbox
+    # INSERT, COMMIT
+    ('rentals.create', 'renter', 'post', '/api/rentals/', 8),
+    # State transitions: load, BEGIN, book lock (not for pending cancels),
+    # guarded UPDATEs of rental and book, outbox INSERT, COMMIT; approval
+    # also probes for an overlapping rental
+    ('rentals.approve', 'owner', 'post', '/api/rentals/{pending}/approve/', 8),
+    ('rentals.complete', 'owner', 'post', '/api/rentals/{approved}/complete/', 7),
+    ('rentals.cancel', 'renter', 'post', '/api/rentals/{cancelable}/cancel/', 6),
+    ('reviews.list', 'renter', 'get', '/api/reviews/', 2),
+    ('reviews.retrieve', 'renter', 'get', '/api/reviews/{review}/', 2),
+    ('reviews.my_reviews', 'renter', 'get', '/api/reviews/my_reviews/', 2),
+    ('payments.list', 'admin', 'get', '/api/payments/', 2),
+    ('payments.retrieve', 'renter', 'get', '/api/payments/{payment}/', 2),
+    ('payments.my_payments', 'renter', 'get', '/api/payments/my_payments/', 2),
+    ('dashboard.owner', 'owner', 'get', '/api/dashboard/', 8),
+    ('dashboard.renter', 'renter', 'get', '/api/dashboard/', 6),
+    ('dashboard.cached', 'renter', 'get', '/api/dashboard/', 1),
+    # One read per collection; a delta also reads the tombstones
+    ('sync.snapshot', 'renter', 'get', '/api/sync/', 4),
+    ('sync.delta', 'renter', 'get', '/api/sync/?since={since}', 5),
+]
+
+# Request bodies for the write endpoints, formatted with the sample ids
+PAYLOADS = {
+    'rentals.create': {'book': '{book}', 'start_date': '{next_month}', 'end_date': '{next_month_end}'},
+}
+
+
+class Command(BaseCommand):
+    help = 'Check that every API endpoint stays within its SQL query budget'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=30,
+                            help='Books and rentals to create for the sample data')
+        parser.add_argument('--show-sql', action='store_true',
+                            help='Print the captured SQL for endpoints over budget')
+
+    def handle(self, *args, **options):
+        with scratch_database():
+            ids, users = self.populate(options['rows'])
+            failures = []
+            for name, role, method, path, budget in BUDGETS:
+                client = api_client_for(users[role])
+                payload = {
+                    field: value.format(**ids) for field, value in PAYLOADS.get(name, {}).items()
+                }
+                with CaptureQueriesContext(connection) as ctx:
+                    response = getattr(client, method)(path.format(**ids), payload or None)
+                count = len(ctx.captured_queries)
+                if response.status_code >= 400:
+                    failures.append(name)
+                    self.stdout.write(self.style.ERROR(
+                        f'{name:<28} HTTP {response.status_code}'
+                    ))
+                    continue
+                if count > budget:
+                    failures.append(name)
+                    self.stdout.write(self.style.ERROR(
+                        f'{name:<28} {count:>3} queries (budget {budget})'
+                    ))
+                    if options['show_sql']:
+                        for query in ctx.captured_queries:
+                            self.stdout.write(f'    {query["sql"]}')
+                else:
+                    self.stdout.write(f'{name:<28} {count:>3} queries (budget {budget})')
+
+        if failures:
+            raise CommandError(f'Over budget: {", ".join(failures)}')
+        self.stdout.write(self.style.SUCCESS('All endpoints within budget'))
+
+    def populate(self, rows):
+        """Create enough related rows that a per-row lookup is impossible to miss"""
+        users = {
+            'admin': User.objects.create_user('budget_admin', password='x', role='admin'),
+            'owner': User.objects.create_user('budget_owner', password='x', role='owner'),
+            'renter': User.objects.create_user('budget_renter', password='x', role='renter'),
+        }
+        owners = [users['owner']] + [
+            User.objects.create_user(f'budget_owner{i}', password='x', role='owner')
+            for i in range(3)
+        ]
+        renters = [users['renter']] + [
+            User.objects.create_user(f'budget_renter{i}', password='x', role='renter')
+            for i in range(3)
+        ]
+
+        books = Book.objects.bulk_create([
+            Book(title=f'Book {i}', author=f'Author {i % 7}', isbn=f'978{i:010d}',
+                 owner=owners[i % len(owners)], category='Fiction')
+            for i in range(rows)
+        ])
+        today = date.today()
+        rentals = Rental.objects.bulk_create([
+            Rental(renter=renters[i % len(renters)], book=books[i],
+                   start_date=today - timedelta(days=10), end_date=today + timedelta(days=5),
+                   status='completed')
+            for i in range(rows)
+        ])
+        Review.objects.bulk_create([
+            Review(book=books[i], user=renters[i % len(renters)], rating=i % 5 + 1)
+            for i in range(rows)
+        ])
+        payments = Payment.objects.bulk_create([
+            Payment(rental=rental, amount=5, status='completed', transaction_id=f'TR-{rental.id}')
+            for rental in rentals
+        ])
+
+        own_book = Book.objects.filter(owner=users['owner']).first()
+        # Open rentals of one book may not overlap, so each gets its own day
+        pending = Rental.objects.create(renter=users['renter'], book=own_book,
+                                        start_date=today, end_date=today, status='pending')
+        approved = Rental.objects.create(renter=users['renter'], book=own_book,
+                                         start_date=today + timedelta(days=1),
+                                         end_date=today + timedelta(days=1), status='approved')
+        cancelable = Rental.objects.create(renter=users['renter'], book=own_book,
+                                           start_date=today + timedelta(days=2),
+                                           end_date=today + timedelta(days=2), status='pending')
+        ids = {
+            'book': books[0].id,
+            'rental': rentals[0].id,
+            'review': Review.objects.filter(user=users['renter']).values_list('id', flat=True)[0],
+            'payment': payments[0].id,
+            'pending': pending.id,
+            'approved': approved.id,
+            'cancelable': cancelable.id,
+            'next_month': today + timedelta(days=30),
+            'next_month_end': today + timedelta(days=37),
+            # Older than the sample data, so the delta returns all of it
+            'since': delta_token(timezone.now() - timedelta(hours=1)),
+        }
+        return ids, users
@@ -0,0 +1,194 @@
+import json
+import random
+import re
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from library_app.harness import api_client_for, scratch_database
+from library_app.models import User, Book, Rental, Review, Payment
+from library_app.sync import delta_token
+
+# Read endpoints whose queries must all be served from an index. Tables a
+# query is allowed to scan in full are listed per endpoint (the catalog-wide
+# dashboard counters are a count over every book by definition).
+PLANS = [
+    # (name, user, path, tables allowed to be scanned)
+    ('books.list', 'renter', '/api/books/', set()),
+    ('books.retrieve', 'renter', '/api/books/{book}/', set()),
+    ('books.reviews', 'renter', '/api/books/{book}/reviews/', set()),
+    ('books.my_books', 'owner', '/api/books/my_books/', set()),
+    ('books.available', 'renter', '/api/books/available/', set()),
+    ('books.top_rated', 'renter', '/api/books/top_rated/', set()),
+    ('books.availability', 'renter', '/api/books/{book}/availability/', set()),
+    ('rentals.list', 'renter', '/api/rentals/', set()),
+    ('rentals.retrieve', 'renter', '/api/rentals/{rental}/', set()),
+    ('rentals.my_rentals', 'renter', '/api/rentals/my_rentals/', set()),
+    ('rentals.my_book_rentals', 'owner', '/api/rentals/my_book_rentals/', set()),
+    ('reviews.list', 'renter', '/api/reviews/', set()),
+    ('reviews.my_reviews', 'renter', '/api/reviews/my_reviews/', set()),
+    ('payments.list', 'admin', '/api/payments/', set()),
+    ('payments.my_payments', 'renter', '/api/payments/my_payments/', set()),
+    ('dashboard.owner', 'owner', '/api/dashboard/', {'library_app_book'}),
+    ('dashboard.renter', 'renter', '/api/dashboard/', {'library_app_book'}),
+    ('sync.delta', 'renter', '/api/sync/?since={since}', set()),
+]
+
+
+class Command(BaseCommand):
+    help = 'EXPLAIN every read endpoint on a large synthetic dataset and fail on sequential scans'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=2_000)
+        parser.add_argument('--books', type=int, default=50_000)
+        parser.add_argument('--rentals', type=int, default=200_000)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--show-plans', action='store_true',
+                            help='Print the plan of every query, not just regressions')
+
+    def handle(self, *args, **options):
+        with scratch_database():
+            self.stdout.write('Loading synthetic data...')
+            ids, users = self.populate(options)
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+
+            failures = []
+            for name, role, path, allowed in PLANS:
+                client = api_client_for(users[role])
+                with CaptureQueriesContext(connection) as ctx:
+                    response = client.get(path.format(**ids))
+                if response.status_code >= 400:
+                    failures.append(name)
+                    self.stdout.write(self.style.ERROR(f'{name:<28} HTTP {response.status_code}'))
+                    continue
+
+                scans = []
+                for query in ctx.captured_queries:
+                    sql = query['sql']
+                    if not sql.lstrip().upper().startswith('SELECT'):
+                        continue
+                    plan, scanned = self.explain(sql)
+                    if options['show_plans']:
+                        self.stdout.write(f'  {sql}\n    ' + '\n    '.join(plan))
+                    scans.extend((table, sql, plan) for table in scanned - allowed)
+
+                if scans:
+                    failures.append(name)
+                    self.stdout.write(self.style.ERROR(
+                        f'{name:<28} sequential scan on {", ".join(sorted({t for t, _, _ in scans}))}'
+                    ))
+                    for _, sql, plan in scans:
+                        self.stdout.write(f'    {sql}\n      ' + '\n      '.join(plan))
+                else:
+                    self.stdout.write(f'{name:<28} ok ({len(ctx.captured_queries)} queries)')
+
+        if failures:
+            raise CommandError(f'Plan regressions: {", ".join(failures)}')
+        self.stdout.write(self.style.SUCCESS('No sequential scans'))
+
+    def explain(self, sql):
+        """Return (plan lines, tables read with a full sequential scan)"""
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}')
+                raw = cursor.fetchone()[0]
+                root = (json.loads(raw) if isinstance(raw, str) else raw)[0]['Plan']
+                lines, scanned = [], set()
+                self.walk_postgres(root, 0, lines, scanned)
+                return lines, scanned
+
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            lines = [row[-1] for row in cursor.fetchall()]
+            scanned = {
+                line.split()[1] for line in lines
+                if line.startswith('SCAN ') and ' USING ' not in line
+                and not line.startswith('SCAN CONSTANT')
+            }
+            # SQLite reports a LIMITed walk in rowid order as a bare SCAN;
+            # that is the primary key index, not a table scan.
+            return lines, {table for table in scanned if not self.rowid_walk(sql, table, lines)}
+
+    def rowid_walk(self, sql, table, lines):
+        return (
+            re.search(rf'ORDER BY "{table}"\."id" (ASC|DESC) LIMIT', sql) is not None
+            and not any('TEMP B-TREE FOR ORDER BY' in line for line in lines)
+        )
+
+    def walk_postgres(self, node, depth, lines, scanned):
+        relation = node.get('Relation Name', '')
+        lines.append(f'{"  " * depth}{node["Node Type"]} {relation}'.rstrip())
+        if node['Node Type'] == 'Seq Scan':
+            scanned.add(relation)
+        for child in node.get('Plans', []):
+            self.walk_postgres(child, depth + 1, lines, scanned)
+
+    def populate(self, options):
+        """
+        Users spread over owners and renters, books owned with a long tail,
+        and a rental history that is mostly completed with a small open set.
+        """
+        rng = random.Random(options['seed'])
+        User.objects.bulk_create([
+            User(username=f'plan_user{i}', role=('owner', 'renter')[i % 2], password='!')
+            for i in range(options['users'])
+        ], batch_size=5_000)
+        admin = User.objects.create_user('plan_admin', password='x', role='admin')
+        owner_ids = list(User.objects.filter(role='owner').values_list('id', flat=True))
+        renter_ids = list(User.objects.filter(role='renter').values_list('id', flat=True))
+
+        Book.objects.bulk_create([
+            Book(title=f'Book {i}', author=f'Author {i % 5_000}', isbn=f'978{i:010d}',
+                 owner_id=owner_ids[int(rng.paretovariate(1.2)) % len(owner_ids)],
+                 status=rng.choices(['available', 'rented', 'unavailable'], [85, 12, 3])[0])
+            for i in range(options['books'])
+        ], batch_size=5_000)
+        book_ids = list(Book.objects.values_list('id', flat=True))
+
+        today = date.today()
+        batch = []
+        open_starts = {}
+        for i in range(options['rentals']):
+            book_id = rng.choice(book_ids)
+            start = today - timedelta(days=rng.randint(0, 1_000))
+            status = rng.choices(['completed', 'canceled', 'approved', 'pending'], [85, 8, 5, 2])[0]
+            if status in ('approved', 'pending'):
+                # Open rentals of one book may not overlap; close the clashing ones
+                starts = open_starts.setdefault(book_id, [])
+                if any(abs((start - other).days) <= 14 for other in starts):
+                    status = 'completed'
+                else:
+                    starts.append(start)
+            batch.append(Rental(
+                renter_id=rng.choice(renter_ids), book_id=book_id,
+                start_date=start, end_date=start + timedelta(days=14), status=status,
+            ))
+            if len(batch) == 5_000:
+                Rental.objects.bulk_create(batch)
+                batch = []
+        Rental.objects.bulk_create(batch)
+
+        reviews = {
+            (rng.choice(book_ids), rng.choice(renter_ids)) for _ in range(options['rentals'] // 10)
+        }
+        Review.objects.bulk_create(
+            [Review(book_id=b, user_id=u, rating=rng.randint(1, 5)) for b, u in reviews],
+            batch_size=5_000,
+        )
+        Payment.objects.bulk_create([
+            Payment(rental_id=pk, amount=5, status='completed', transaction_id=f'TR-{pk}')
+            for pk in Rental.objects.filter(status='completed').values_list('id', flat=True)[:50_000]
+        ], batch_size=5_000)
+
+        renter = User.objects.get(pk=Rental.objects.values_list('renter_id', flat=True).first())
+        owner = User.objects.get(pk=Book.objects.values_list('owner_id', flat=True).first())
+        ids = {
+            'book': Book.objects.filter(owner=owner).values_list('id', flat=True).first(),
+            'rental': Rental.objects.filter(renter=renter).values_list('id', flat=True).first(),
+        }
+        # A sync after the load: changes are found through updated_at
+        ids['since'] = delta_token(timezone.now())
+        return ids, {'admin': admin, 'owner': owner, 'renter': renter}
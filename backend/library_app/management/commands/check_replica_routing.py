@@ -0,0 +1,108 @@
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from library_app.harness import add_sqlite_database, api_client_for, scratch_database
+from library_app.models import User, Book, Rental, Review, Payment
+
+REPLICA = 'replica_check'
+# Copied parents first; deleted children first
+REPLICATED_MODELS = [User, Book, Rental, Review, Payment]
+WRITES = ('INSERT', 'UPDATE', 'DELETE')
+
+
+def replicate():
+    """Bring the replica up to date with 'default' in one go; until then it lags"""
+    connection = connections[REPLICA]
+    with transaction.atomic(using=REPLICA), connection.cursor() as cursor:
+        for model in reversed(REPLICATED_MODELS):
+            cursor.execute(f'DELETE FROM {connection.ops.quote_name(model._meta.db_table)}')
+        for model in REPLICATED_MODELS:
+            # bulk_create sends no signals, so nothing is bumped or evicted
+            model.objects.using(REPLICA).bulk_create(model.objects.using(DEFAULT_DB_ALIAS).order_by('pk'))
+
+
+class Command(BaseCommand):
+    help = 'Check replica routing and read-your-writes stickiness against an artificially lagged replica'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sticky-seconds', type=float, default=1.0,
+                            help='REPLICA_STICKY_SECONDS for the run (also the assumed lag)')
+
+    def handle(self, *args, **options):
+        window = options['sticky_seconds']
+        add_sqlite_database(REPLICA)
+        self.failures = []
+        with scratch_database(), override_settings(DATABASE_REPLICAS=[REPLICA],
+                                                   REPLICA_STICKY_SECONDS=window):
+            owner = User.objects.create_user('replica_owner', password='x', role='owner')
+            renter = User.objects.create_user('replica_renter', password='x', role='renter')
+            browser = User.objects.create_user('replica_browser', password='x', role='renter')
+            book = Book.objects.create(title='Replicated', author='Author', owner=owner)
+            owner_client, renter_client, browser_client = map(api_client_for, (owner, renter, browser))
+            replicate()
+            # Let the writes above age past the lag bound
+            time.sleep(window)
+
+            response, replica_reads, _ = self.request(browser_client, 'get', f'/api/books/{book.pk}/')
+            self.expect('book detail is read from the replica', replica_reads > 0)
+
+            # Starting today, so approval marks the book rented
+            start = date.today()
+            response, _, replica_writes = self.request(renter_client, 'post', '/api/rentals/', {
+                'book': book.pk, 'start_date': start, 'end_date': start + timedelta(days=6),
+            })
+            self.expect('rental request is created', response.status_code == 201)
+            self.expect('writes go to the primary only', replica_writes == 0)
+            rental_id = response.json().get('id')
+
+            # The replica has not seen the rental yet
+            response, replica_reads, _ = self.request(renter_client, 'get', '/api/rentals/my_rentals/')
+            self.expect('the renter sees their new rental right away',
+                       replica_reads == 0 and self.ids(response) == [rental_id])
+            response, replica_reads, _ = self.request(browser_client, 'get', '/api/rentals/')
+            self.expect('other users read the lagged replica',
+                       replica_reads > 0 and rental_id not in self.ids(response))
+
+            response, _, replica_writes = self.request(owner_client, 'post', f'/api/rentals/{rental_id}/approve/')
+            self.expect('approval succeeds on the primary', response.status_code == 200 and replica_writes == 0)
+            response, replica_reads, _ = self.request(owner_client, 'get', f'/api/books/{book.pk}/')
+            self.expect('the owner sees the book rented', replica_reads == 0 and response.json()['status'] == 'rented')
+            response, _, _ = self.request(browser_client, 'get', f'/api/books/{book.pk}/')
+            self.expect('a fresh book version is never rendered from the lagged replica',
+                       response.json()['status'] == 'rented')
+
+            time.sleep(window)
+            replicate()
+            response, replica_reads, _ = self.request(renter_client, 'get', '/api/rentals/my_rentals/')
+            self.expect('after the window the renter reads the caught-up replica',
+                       replica_reads > 0 and self.ids(response) == [rental_id]
+                       and response.json()['results'][0]['status'] == 'approved')
+            self.expect('primary and replica agree',
+                       Rental.objects.using(REPLICA).filter(pk=rental_id, status='approved').exists())
+
+        if self.failures:
+            raise CommandError(f'Failed: {", ".join(self.failures)}')
+        self.stdout.write(self.style.SUCCESS('Replica routing and stickiness hold'))
+
+    def request(self, client, method, path, data=None):
+        """Make a request; return the response and the replica's read and write query counts"""
+        with CaptureQueriesContext(connections[REPLICA]) as ctx:
+            response = getattr(client, method)(path, data, format='json')
+        statements = [query['sql'].lstrip().upper() for query in ctx.captured_queries]
+        writes = sum(statement.startswith(WRITES) for statement in statements)
+        return response, len(statements) - writes, writes
+
+    @staticmethod
+    def ids(response):
+        return [row['id'] for row in response.json()['results']]
+
+    def expect(self, name, passed):
+        if passed:
+            self.stdout.write(f'ok    {name}')
+        else:
+            self.failures.append(name)
+            self.stdout.write(self.style.ERROR(f'FAIL  {name}'))
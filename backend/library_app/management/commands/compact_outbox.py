@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from library_app.outbox import compact
+
+
+class Command(BaseCommand):
+    help = ('Delete change-feed events past OUTBOX_RETENTION_DAYS, and events past '
+            'OUTBOX_COMPACT_AFTER_MINUTES that a later event of the same rental or book supersedes')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep compacting, every --interval seconds')
+        parser.add_argument('--interval', type=float, default=600)
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.perf_counter()
+            counts = compact()
+            self.stdout.write(self.style.SUCCESS(
+                f'Pruned {counts["pruned"]} and compacted {counts["compacted"]} events '
+                f'in {time.perf_counter() - started:.2f}s'
+            ))
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
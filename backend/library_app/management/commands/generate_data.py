@@ -0,0 +1,140 @@
+import multiprocessing
+import os
+import time
+from contextlib import nullcontext
+from datetime import date
+
+from django.contrib.auth.hashers import make_password
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, connections, transaction
+from django.db.models import Max
+
+from library_app import sharding, synthetic
+from library_app.models import User, Book, Rental, Review, Payment, OutboxEvent, Tombstone
+
+# Handed to the forked workers with the rest of their memory
+_plan = None
+_write_lock = nullcontext()
+
+
+def load_users(block):
+    rows = synthetic.user_rows(_plan, block)
+    with _write_lock, transaction.atomic():
+        synthetic.insert_rows(User, rows)
+    return {User: min(synthetic.BLOCK_SIZE, _plan.users - block * synthetic.BLOCK_SIZE)}
+
+
+def load_books(block):
+    rows = synthetic.book_rows(_plan, block)
+    # Children after their parents, so the foreign keys always resolve
+    with _write_lock, transaction.atomic():
+        for model in (Book, Rental, Payment, Review):
+            synthetic.insert_rows(model, rows[model])
+    return {model: len(model_rows) for model, model_rows in rows.items()}
+
+
+class Command(BaseCommand):
+    help = ('Generate a realistic synthetic dataset (Zipf popularity, hostel clustering, valid rental '
+            'histories), deterministic from --seed, loaded in parallel')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--books', type=int, default=5000)
+        parser.add_argument('--rentals', type=int, default=20000,
+                            help='Rentals to aim for; the exact count depends on the seed')
+        parser.add_argument('--hostels', type=int, default=12)
+        parser.add_argument('--seed', type=int, default=1, help='Same seed, same data')
+        parser.add_argument('--today', type=date.fromisoformat, default=date.today(),
+                            help='Date the history ends at (YYYY-MM-DD); fix it to reproduce a dataset')
+        parser.add_argument('--history-days', type=int, default=730)
+        parser.add_argument('--popularity-skew', type=float, default=1.0,
+                            help='Zipf exponent of book popularity')
+        parser.add_argument('--local-share', type=float, default=0.8,
+                            help="Share of rentals made by a renter from the book's own hostel")
+        parser.add_argument('--review-share', type=float, default=0.3,
+                            help='Share of completed rentals whose renter reviews the book')
+        parser.add_argument('--password', default='password123', help='Password of every generated user')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='Generating and loading processes. SQLite takes one writer at a time, '
+                                 'so there they only generate in parallel')
+        parser.add_argument('--flush', action='store_true',
+                            help='First delete every book, rental, review and payment, and the users '
+                                 'earlier runs generated')
+
+    def handle(self, *args, **options):
+        global _plan, _write_lock
+        if sharding.enabled():
+            raise CommandError('generate_data loads an unsharded database; unset DATABASE_SHARDS')
+        if options['flush']:
+            self.flush()
+        elif any(model.objects.exists() for model in (Book, Rental, Review, Payment)):
+            raise CommandError('The database already holds library data; pass --flush to replace it')
+
+        started = time.perf_counter()
+        try:
+            _plan = synthetic.Plan(
+                seed=options['seed'], users=options['users'], books=options['books'],
+                rentals=options['rentals'], hostels=options['hostels'], today=options['today'],
+                history_days=options['history_days'], popularity_skew=options['popularity_skew'],
+                local_share=options['local_share'], review_share=options['review_share'],
+                # One hash, salted from the seed, serves every user
+                password=make_password(options['password'], salt=f'seed{options["seed"]}'),
+                first_user_id=(User.objects.aggregate(last=Max('id'))['last'] or 0) + 1,
+            )
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        self.stdout.write(f'Planned {_plan.users} users, {_plan.books} books and {_plan.rentals} rentals '
+                          f'in {time.perf_counter() - started:.1f}s')
+
+        workers = options['workers']
+        context = multiprocessing.get_context('fork')
+        if connection.vendor != 'postgresql':
+            _write_lock = context.Lock()
+        totals = {}
+        # Forked workers must open their own connections
+        connections.close_all()
+        with context.Pool(workers) as pool:
+            for name, load, blocks in (('users', load_users, _plan.blocks(_plan.users)),
+                                       ('books', load_books, _plan.blocks(_plan.books))):
+                for done, counts in enumerate(pool.imap_unordered(load, range(blocks)), 1):
+                    for model, count in counts.items():
+                        totals[model] = totals.get(model, 0) + count
+                    self.progress(name, done, blocks, totals, started)
+                self.stdout.write('')
+
+        self.finish()
+        elapsed = time.perf_counter() - started
+        rows = sum(totals.values())
+        for model in (User, Book, Rental, Payment, Review):
+            self.stdout.write(f'{str(model._meta.verbose_name_plural):>10}: {totals.get(model, 0)}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Loaded {rows} rows in {elapsed:.1f}s ({rows / elapsed:.0f} rows/s) with {workers} worker(s)'
+        ))
+
+    def progress(self, name, done, blocks, totals, started):
+        rows = sum(totals.values())
+        self.stdout.write(
+            f'\r  {name} block {done}/{blocks}, {rows} rows, {rows / (time.perf_counter() - started):.0f} rows/s',
+            ending='',
+        )
+        self.stdout.flush()
+
+    def flush(self):
+        # Events and tombstones name rows by id, and the new rows reuse the ids
+        models = (OutboxEvent, Tombstone, Payment, Review, Rental, Book)
+        tables = [model._meta.db_table for model in models]
+        with transaction.atomic():
+            connection.ops.execute_sql_flush(connection.ops.sql_flush(no_style(), tables))
+            User.objects.filter(email__endswith=f'@{synthetic.EMAIL_DOMAIN}').delete()
+
+    def finish(self):
+        """Move the id sequences past the explicit ids, and drop whatever the caches hold about the old data"""
+        sequences = connection.ops.sequence_reset_sql(no_style(), [User, Book, Rental, Review, Payment])
+        if sequences:
+            with connection.cursor() as cursor:
+                for sql in sequences:
+                    cursor.execute(sql)
+        for alias in caches:
+            caches[alias].clear()
@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from library_app.sync import prune
+
+
+class Command(BaseCommand):
+    help = ('Delete the delta-sync tombstones of books, rentals and reviews deleted more than '
+            'SYNC_TOMBSTONE_DAYS ago; clients that last synced before then get a snapshot')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep pruning, every --interval seconds')
+        parser.add_argument('--interval', type=float, default=3600)
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.perf_counter()
+            deleted = prune()
+            self.stdout.write(self.style.SUCCESS(
+                f'Pruned {deleted} tombstones in {time.perf_counter() - started:.2f}s'
+            ))
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from library_app.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the book full-text search index from the existing catalog'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default',
+                            help='Database alias to rebuild the index on')
+
+    def handle(self, *args, **options):
+        count = rebuild_index(options['database'])
+        self.stdout.write(self.style.SUCCESS(f'Reindexed {count} books'))
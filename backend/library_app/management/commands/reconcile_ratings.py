@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from library_app import sharding
+from library_app.models import Book, Review
+from library_app.ratings import reconcile
+
+
+class Command(BaseCommand):
+    help = "Recompute every book's rating count, sum, average and histogram from its reviews"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000,
+                            help='Books to recompute per batch')
+
+    def handle(self, *args, **options):
+        checked = fixed = 0
+        # Every shard holds its own books and their reviews
+        for alias in sharding.aliases():
+            with sharding.use(alias):
+                counts = reconcile(Book, Review, chunk_size=options['chunk_size'])
+            checked, fixed = checked + counts[0], fixed + counts[1]
+        self.stdout.write(self.style.SUCCESS(f'Checked {checked} books, fixed {fixed}'))
@@ -0,0 +1,49 @@
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from library_app.settlements import reconcile_payments
+
+
+class Command(BaseCommand):
+    help = ("Settle payments from the provider's settlement CSV (transaction_id, amount, status, date) and "
+            "report rows and payments that do not match")
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', help='Settlement CSV, or - for standard input')
+        parser.add_argument('--chunk-size', type=int, default=settings.SETTLEMENT_CHUNK_SIZE,
+                            help='File rows matched per query')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        if options['file'] == '-':
+            report = reconcile_payments(sys.stdin.buffer, options['chunk_size'], settings.SETTLEMENT_MAX_REPORTED)
+        else:
+            with open(options['file'], 'rb') as stream:
+                report = reconcile_payments(stream, options['chunk_size'], settings.SETTLEMENT_MAX_REPORTED)
+        elapsed = time.perf_counter() - started
+
+        for problem in report['problems']:
+            self.stdout.write(f'  row {problem["row"]}: {problem["transaction_id"]}: {problem["problem"]}')
+        for payment in report['pending_not_in_file']:
+            self.stdout.write(f'  payment {payment["id"]}: {payment["transaction_id"]} ({payment["amount"]}) '
+                              f'is pending and not in the file')
+        if report['truncated']:
+            self.stdout.write(f'  (only the first {settings.SETTLEMENT_MAX_REPORTED} of each are listed)')
+        if report['period']:
+            first, last = report['period']
+            unmatched = f'{report["unmatched_payments"]} pending payments from {first} to {last} not in the file'
+        else:
+            unmatched = 'pending payments not checked, as the file has no dates'
+        self.stdout.write(
+            f'{report["rows"]} rows: {report["updated"]} payments settled, '
+            f'{report["already_reconciled"]} already reconciled, {report["unmatched_rows"]} unmatched, '
+            f'{report["amount_mismatches"]} amount mismatches, {report["status_conflicts"]} status conflicts, '
+            f'{report["invalid_rows"]} invalid, {report["duplicate_rows"]} duplicates; '
+            f'{unmatched}'
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Reconciled in {elapsed:.1f}s ({report["rows"] / elapsed:.0f} rows/s)'
+        ))
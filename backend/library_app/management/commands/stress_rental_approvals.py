@@ -0,0 +1,105 @@
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connections
+
+from library_app.harness import api_client_for, scratch_database
+from library_app.models import User, Book, Rental
+
+
+class Command(BaseCommand):
+    help = 'Fire parallel approvals at the rental requests of shared books and check the invariants hold'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', type=int, default=20)
+        parser.add_argument('--requests-per-book', type=int, default=5,
+                            help='Pending rentals per book, for consecutive weeks')
+        parser.add_argument('--attempts', type=int, default=3,
+                            help='Approvals fired at each pending rental')
+        parser.add_argument('--workers', type=int, default=16)
+
+    def handle(self, *args, **options):
+        with scratch_database(on_disk=True):
+            owner, rental_ids = self.populate(options)
+            jobs = [pk for pk in rental_ids for _ in range(options['attempts'])]
+
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+                codes = Counter(pool.map(lambda pk: self.approve(owner, pk), jobs))
+            elapsed = time.perf_counter() - started
+
+            self.stdout.write(
+                f'{len(jobs)} approvals in {elapsed:.2f}s: '
+                + ', '.join(f'HTTP {code} x{count}' for code, count in sorted(codes.items(), key=str))
+            )
+            errors = self.check_invariants(options['books'], options['requests_per_book'], codes)
+
+        if errors:
+            raise CommandError('Invariants violated:\n  ' + '\n  '.join(errors))
+        self.stdout.write(self.style.SUCCESS('All invariants hold'))
+
+    def approve(self, owner, rental_id):
+        client = api_client_for(owner)
+        try:
+            for attempt in range(20):
+                try:
+                    return client.post(f'/api/rentals/{rental_id}/approve/').status_code
+                except OperationalError:
+                    # SQLite can still report a busy database as an error;
+                    # back off and retry like a client would.
+                    time.sleep(0.01 * (attempt + 1))
+            return 'locked'
+        finally:
+            connections.close_all()
+
+    def check_invariants(self, books, requests_per_book, codes):
+        errors = []
+        approved = Rental.objects.filter(status='approved')
+        windows = defaultdict(list)
+        for book_id, start, end in approved.values_list('book_id', 'start_date', 'end_date'):
+            windows[book_id].append((start, end))
+        doubled = [
+            book_id for book_id, dates in windows.items()
+            if any(a[1] >= b[0] for a, b in zip(sorted(dates), sorted(dates)[1:]))
+        ]
+        if doubled:
+            errors.append(f'books approved twice for the same days: {doubled}')
+
+        if codes.get(200, 0) != approved.count():
+            errors.append(f'{codes.get(200, 0)} approvals succeeded but {approved.count()} rentals are approved')
+        if approved.count() != books * requests_per_book:
+            errors.append(f'{approved.count()} of {books * requests_per_book} rentals were approved')
+
+        # Only the first week has started, so only its approval marks a book rented
+        rented = set(Book.objects.filter(status='rented').values_list('id', flat=True))
+        started = set(approved.filter(start_date__lte=date.today()).values_list('book_id', flat=True))
+        if rented != started:
+            errors.append('rented books do not match the books with a started approved rental')
+
+        unexpected = {code: count for code, count in codes.items() if code not in (200, 400, 409)}
+        if unexpected:
+            errors.append(f'unexpected responses: {unexpected}')
+        return errors
+
+    def populate(self, options):
+        owner = User.objects.create_user('stress_owner', password='x', role='owner')
+        renters = [
+            User.objects.create_user(f'stress_renter{i}', password='x', role='renter')
+            for i in range(options['requests_per_book'])
+        ]
+        books = Book.objects.bulk_create([
+            Book(title=f'Contested {i}', author='Author', owner=owner) for i in range(options['books'])
+        ])
+        # Open rentals of a book may not overlap, so the requests ask for
+        # consecutive weeks from today; every one can be approved, each
+        # exactly once.
+        start = date.today()
+        rentals = Rental.objects.bulk_create([
+            Rental(renter=renter, book=book,
+                   start_date=start + timedelta(weeks=i), end_date=start + timedelta(weeks=i, days=6))
+            for book in books for i, renter in enumerate(renters)
+        ])
+        return owner, [rental.id for rental in rentals]
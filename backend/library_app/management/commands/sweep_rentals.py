@@ -0,0 +1,34 @@
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from library_app.expiry import sweep
+
+
+class Command(BaseCommand):
+    help = ('Cancel pending rentals whose start date has passed, mark approved ones long past their end date '
+            'overdue, and mark the books of rentals that have started rented; '
+            'in short chunks, safe alongside API traffic')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, help='Rentals per transaction (default RENTAL_SWEEP_CHUNK_SIZE)')
+        parser.add_argument('--today', type=date.fromisoformat,
+                            help='Date to sweep as of (YYYY-MM-DD); defaults to the current date')
+        parser.add_argument('--loop', action='store_true', help='Keep sweeping, every --interval seconds')
+        parser.add_argument('--interval', type=float, default=300)
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.perf_counter()
+            counts = sweep(options['today'] or date.today(), options['chunk_size'])
+            elapsed = time.perf_counter() - started
+            moved = counts['canceled'] + counts['overdue']
+            self.stdout.write(self.style.SUCCESS(
+                f'Canceled {counts["canceled"]} pending rentals, marked {counts["overdue"]} overdue '
+                f'and {counts["books_rented"]} books rented in {counts["chunks"]} chunks, '
+                f'{elapsed:.2f}s ({moved / elapsed:.0f} rentals/s)'
+            ))
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
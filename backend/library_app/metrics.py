@@ -0,0 +1,171 @@
+"""
+Prometheus metrics, served at /metrics.
+
+MetricsMiddleware records every request under an `endpoint` label naming
+the viewset route and action it reached: `books.available`,
+`rentals.approve`, `payments.my_payments`, `books.retrieve`. Other views
+are labelled by their URL route (`api/token/`), and requests no URL
+matched by `unmatched`, so the label set stays small.
+
+- library_requests_total{endpoint, method}
+- library_request_errors_total{endpoint, method, status}: 4xx and 5xx
+- library_request_duration_seconds{endpoint}: latency histogram
+- library_request_queries{endpoint}: SQL queries per request histogram,
+  taken from the request's timings (timing.py)
+
+The business gauges library_books{status} and library_rentals{status} come
+from one conditional aggregate per table. It is cached for
+METRICS_GAUGE_TIMEOUT seconds in the METRICS_CACHE cache, so repeated
+scrapes reuse it. The shipped 'default' cache is per-process memory, so
+each worker process recounts once per timeout; pointing METRICS_CACHE at
+a cache the workers share (Redis, memcached, the database) brings that
+down to one count per timeout in all.
+
+Scrapes must send METRICS_TOKEN as a bearer token. Without a token only
+the addresses in METRICS_ALLOWED_IPS (loopback by default) are served,
+and METRICS_PUBLIC = True serves anyone.
+
+Under several worker processes each process has its own counters. Set
+PROMETHEUS_MULTIPROC_DIR (gunicorn.conf.py does) and prometheus_client
+keeps them in memory-mapped files there, which every scrape adds up,
+whichever worker serves it.
+"""
+import hmac
+import os
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Count, Q
+from django.http import HttpResponse, HttpResponseForbidden
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess,
+)
+from prometheus_client.core import GaugeMetricFamily
+
+from . import timing
+from .models import Book, Rental
+from .sharding import sharded
+
+GAUGES_KEY = 'metrics:gauges'
+
+REQUESTS = Counter('library_requests', 'Requests served', ['endpoint', 'method'])
+ERRORS = Counter('library_request_errors', 'Requests answered with a 4xx or 5xx status',
+                 ['endpoint', 'method', 'status'])
+LATENCY = Histogram('library_request_duration_seconds', 'Time to produce the response', ['endpoint'],
+                    buckets=(.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10))
+QUERIES = Histogram('library_request_queries', 'SQL queries run per request', ['endpoint'],
+                    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144))
+
+_prefixes = None
+
+
+def endpoint(request):
+    """The endpoint label of a served request"""
+    global _prefixes
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    view = match.func
+    actions = getattr(view, 'actions', None)
+    if actions is None:
+        return match.route
+    if _prefixes is None:
+        from .urls import router
+        _prefixes = {basename: prefix for prefix, _, basename in router.registry}
+    method = request.method.lower()
+    action = actions.get(method) or (method == 'head' and actions.get('get')) or 'method_not_allowed'
+    basename = view.initkwargs.get('basename')
+    return f'{_prefixes.get(basename, basename)}.{action}'
+
+
+class MetricsMiddleware:
+    """Records each request's count, errors, latency and queries; second in MIDDLEWARE, after timings"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        started = time.perf_counter()
+        response = self.get_response(request)
+        observe(request, response, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        observe(request, response, time.perf_counter() - started)
+        return response
+
+
+# Queries run under the middleware belong to the view, not to it
+timing.skip_frames(MetricsMiddleware.__call__, MetricsMiddleware.__acall__)
+
+
+def observe(request, response, seconds):
+    name = endpoint(request)
+    REQUESTS.labels(name, request.method).inc()
+    if response.status_code >= 400:
+        ERRORS.labels(name, request.method, str(response.status_code)).inc()
+    LATENCY.labels(name).observe(seconds)
+    timings = timing.current()
+    if timings is not None:
+        QUERIES.labels(name).observe(timings.queries)
+
+
+def status_counts(model):
+    """Rows of `model` per status, in one aggregate query (per shard)"""
+    return sharded(model.objects.all()).aggregate(**{
+        status: Count('id', filter=Q(status=status)) for status, _ in model.STATUS_CHOICES
+    })
+
+
+class BusinessCollector:
+    """library_books and library_rentals by status, from the cached aggregates"""
+
+    def describe(self):
+        # Registering must not query the database
+        return []
+
+    def collect(self):
+        cache = caches[settings.METRICS_CACHE]
+        counts = cache.get(GAUGES_KEY)
+        if counts is None:
+            counts = {'books': status_counts(Book), 'rentals': status_counts(Rental)}
+            cache.set(GAUGES_KEY, counts, settings.METRICS_GAUGE_TIMEOUT)
+        for name, description in (('books', 'Books by status'), ('rentals', 'Rentals by status')):
+            family = GaugeMetricFamily(f'library_{name}', description, labels=['status'])
+            for status, count in counts[name].items():
+                family.add_metric([status], count)
+            yield family
+
+
+_business = CollectorRegistry()
+_business.register(BusinessCollector())
+
+
+def allowed(request):
+    """Whether `request` may read the metrics: see the module docstring"""
+    token = settings.METRICS_TOKEN
+    if token:
+        return hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}')
+    return settings.METRICS_PUBLIC or request.META.get('REMOTE_ADDR') in settings.METRICS_ALLOWED_IPS
+
+
+def metrics_view(request):
+    """GET /metrics in the Prometheus text format"""
+    if not allowed(request):
+        return HttpResponseForbidden()
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return HttpResponse(generate_latest(registry) + generate_latest(_business), content_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,96 @@
+from django.db import migrations
+
+# The DDL is spelled out here rather than imported from library_app.search,
+# so this migration keeps doing what it did whatever later happens there.
+
+POSTGRES_FORWARD = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    """
+    ALTER TABLE library_app_book ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(author, '')), 'B') ||
+        setweight(to_tsvector('simple', coalesce(isbn, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(category, '')), 'C')
+    ) STORED
+    """,
+    'CREATE INDEX library_app_book_search_gin ON library_app_book USING gin (search_vector)',
+    'CREATE INDEX library_app_book_title_trgm ON library_app_book USING gin (title gin_trgm_ops)',
+    'CREATE INDEX library_app_book_author_trgm ON library_app_book USING gin (author gin_trgm_ops)',
+]
+
+POSTGRES_BACKWARD = [
+    'DROP INDEX IF EXISTS library_app_book_author_trgm',
+    'DROP INDEX IF EXISTS library_app_book_title_trgm',
+    'DROP INDEX IF EXISTS library_app_book_search_gin',
+    'ALTER TABLE library_app_book DROP COLUMN IF EXISTS search_vector',
+]
+
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE library_app_book_fts USING fts5(
+        title, author, isbn, category,
+        content='library_app_book', content_rowid='id', tokenize='unicode61'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS library_app_book_fts_ai AFTER INSERT ON library_app_book BEGIN
+        INSERT INTO library_app_book_fts(rowid, title, author, isbn, category)
+        VALUES (new.id, new.title, new.author, new.isbn, new.category);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS library_app_book_fts_ad AFTER DELETE ON library_app_book BEGIN
+        INSERT INTO library_app_book_fts(library_app_book_fts, rowid, title, author, isbn, category)
+        VALUES ('delete', old.id, old.title, old.author, old.isbn, old.category);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS library_app_book_fts_au AFTER UPDATE OF title, author, isbn, category ON library_app_book BEGIN
+        INSERT INTO library_app_book_fts(library_app_book_fts, rowid, title, author, isbn, category)
+        VALUES ('delete', old.id, old.title, old.author, old.isbn, old.category);
+        INSERT INTO library_app_book_fts(rowid, title, author, isbn, category)
+        VALUES (new.id, new.title, new.author, new.isbn, new.category);
+    END
+    """,
+    "INSERT INTO library_app_book_fts(library_app_book_fts) VALUES ('rebuild')",
+]
+
+SQLITE_BACKWARD = [
+    'DROP TRIGGER IF EXISTS library_app_book_fts_au',
+    'DROP TRIGGER IF EXISTS library_app_book_fts_ad',
+    'DROP TRIGGER IF EXISTS library_app_book_fts_ai',
+    'DROP TABLE IF EXISTS library_app_book_fts',
+]
+
+DDL = {
+    'postgresql': (POSTGRES_FORWARD, POSTGRES_BACKWARD),
+    'sqlite': (SQLITE_FORWARD, SQLITE_BACKWARD),
+}
+
+
+def create_index(apps, schema_editor):
+    forward, _ = DDL.get(schema_editor.connection.vendor, ([], []))
+    for statement in forward:
+        schema_editor.execute(statement)
+
+
+def drop_index(apps, schema_editor):
+    _, backward = DDL.get(schema_editor.connection.vendor, ([], []))
+    for statement in backward:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+    """
+    Full-text search index for books: a generated tsvector column with GIN
+    and trigram indexes on PostgreSQL, an FTS5 table with sync triggers on
+    SQLite. See library_app/search.py.
+    """
+
+    dependencies = [
+        ('library_app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
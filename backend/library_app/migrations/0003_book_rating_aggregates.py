@@ -0,0 +1,96 @@
+# Generated by Django 4.2.7 on 2026-10-17 01:48
+
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def populate_ratings(apps, schema_editor):
+    """Fill the new aggregates from the existing reviews, a chunk of books at a time"""
+    Book = apps.get_model('library_app', 'Book')
+    Review = apps.get_model('library_app', 'Review')
+    stars = range(1, 6)
+    fields = ['rating_count', 'rating_sum', 'rating_average'] + [f'rating_{star}' for star in stars]
+    last_id = 0
+    while True:
+        books = list(Book.objects.filter(pk__gt=last_id).order_by('pk').only('pk')[:5000])
+        if not books:
+            return
+        last_id = books[-1].pk
+        stats = {
+            row['book_id']: row
+            for row in Review.objects
+            .filter(book_id__gte=books[0].pk, book_id__lte=last_id)
+            .values('book_id')
+            .annotate(
+                count=Count('id'),
+                total=Sum('rating'),
+                **{f'stars_{star}': Count('id', filter=Q(rating=star)) for star in stars},
+            )
+        }
+        rated = []
+        for book in books:
+            row = stats.get(book.pk)
+            if row is None:
+                continue
+            book.rating_count = row['count']
+            book.rating_sum = row['total'] or 0
+            book.rating_average = book.rating_sum / book.rating_count
+            for star in stars:
+                setattr(book, f'rating_{star}', row[f'stars_{star}'])
+            rated.append(book)
+        Book.objects.bulk_update(rated, fields, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library_app', '0002_book_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='rating_1',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='rating_2',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='rating_3',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='rating_4',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='rating_5',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='rating_average',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['-rating_average', '-id'], name='book_rating_average_idx'),
+        ),
+        migrations.RunPython(populate_ratings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 4.2.7 on 2026-10-17 01:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library_app', '0003_book_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['status', '-id'], name='book_status_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['owner', 'status'], name='book_owner_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rental',
+            index=models.Index(fields=['renter', '-id'], name='rental_renter_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rental',
+            index=models.Index(fields=['renter', 'status'], name='rental_renter_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rental',
+            index=models.Index(fields=['book', 'status'], name='rental_book_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rental',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['book', '-id'], name='rental_pending_book_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rental',
+            index=models.Index(condition=models.Q(('status', 'approved')), fields=['end_date'], name='rental_approved_end_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rental',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['start_date'], name='rental_pending_start_idx'),
+        ),
+    ]
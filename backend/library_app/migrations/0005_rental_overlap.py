@@ -0,0 +1,58 @@
+# Generated by Django 4.2.7 on 2026-10-17 01:55
+
+from django.db import migrations, models
+
+POSTGRES_OVERLAPS = """
+    SELECT a.id, b.id FROM library_app_rental a
+    JOIN library_app_rental b ON a.book_id = b.book_id AND a.id < b.id
+    WHERE a.status IN ('pending', 'approved') AND b.status IN ('pending', 'approved')
+      AND a.start_date <= b.end_date AND b.start_date <= a.end_date
+    LIMIT 20
+"""
+
+
+def create_constraint(apps, schema_editor):
+    """Add the exclusion constraint on PostgreSQL, once no open rentals overlap"""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(POSTGRES_OVERLAPS)
+        clashes = cursor.fetchall()
+    if clashes:
+        raise RuntimeError(
+            'Cannot add the rental overlap constraint: these open rentals overlap '
+            f'{clashes}. Cancel one of each pair and migrate again.'
+        )
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    schema_editor.execute("""
+        ALTER TABLE library_app_rental ADD CONSTRAINT rental_no_overlap EXCLUDE USING gist (
+            book_id WITH =,
+            daterange(start_date, end_date, '[]') WITH &&
+        ) WHERE (status IN ('pending', 'approved'))
+    """)
+
+
+def drop_constraint(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('ALTER TABLE library_app_rental DROP CONSTRAINT IF EXISTS rental_no_overlap')
+
+
+class Migration(migrations.Migration):
+    """
+    Index the open rentals of each book by end date, and on PostgreSQL add
+    an exclusion constraint so no two open rentals of a book overlap. See
+    library_app/availability.py.
+    """
+
+    dependencies = [
+        ('library_app', '0004_hot_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='rental',
+            index=models.Index(condition=models.Q(('status__in', ('pending', 'approved'))), fields=['book', 'end_date'], name='rental_open_book_end_idx'),
+        ),
+        migrations.RunPython(create_constraint, drop_constraint),
+    ]
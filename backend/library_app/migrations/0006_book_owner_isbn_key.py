@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-17 02:00
+
+from django.db import migrations, models
+import django.db.models.functions.text
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library_app', '0005_rental_overlap'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(models.F('owner'), django.db.models.functions.text.Upper(django.db.models.functions.text.Replace(django.db.models.functions.text.Replace(models.F('isbn'), models.Value('-'), models.Value('')), models.Value(' '), models.Value(''))), name='book_owner_isbn_key_idx'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.7 on 2026-10-17 02:50
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library_app', '0006_book_owner_isbn_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payment',
+            name='billing_period',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='payment',
+            name='rental',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='payments', to='library_app.rental'),
+        ),
+        migrations.AddConstraint(
+            model_name='payment',
+            constraint=models.UniqueConstraint(condition=models.Q(('billing_period__isnull', True)), fields=('rental',), name='payment_rental_key'),
+        ),
+        migrations.AddConstraint(
+            model_name='payment',
+            constraint=models.UniqueConstraint(fields=('billing_period', 'rental'), name='payment_period_rental_key'),
+        ),
+    ]
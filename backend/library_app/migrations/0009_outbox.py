@@ -0,0 +1,33 @@
+# Generated by Django 4.2.7 on 2026-10-17 03:15
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library_app', '0008_payment_transaction_id_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('topic', models.CharField(choices=[('rental', 'Rental'), ('book', 'Book'), ('pruned', 'Pruned')], max_length=10)),
+                ('action', models.CharField(max_length=20)),
+                ('object_id', models.BigIntegerField()),
+                ('book_id', models.BigIntegerField()),
+                ('status', models.CharField(blank=True, max_length=20)),
+                ('xid', models.BigIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('owner', models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('renter', models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['renter', 'xid', 'id'], name='outbox_renter_idx'), models.Index(fields=['owner', 'xid', 'id'], name='outbox_owner_idx'), models.Index(fields=['xid', 'id'], name='outbox_position_idx'), models.Index(fields=['topic', 'object_id', 'id'], name='outbox_object_idx'), models.Index(fields=['created_at'], name='outbox_created_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.7 on 2026-10-17 03:47
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library_app', '0010_sync'),
+    ]
+
+    operations = [
+        # Existing payments keep an empty created_at rather than the migration's time
+        migrations.AddField(
+            model_name='payment',
+            name='created_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='payment',
+            name='created_at',
+            field=models.DateTimeField(blank=True, default=django.utils.timezone.now, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['status', 'created_at'], name='payment_status_created_idx'),
+        ),
+    ]
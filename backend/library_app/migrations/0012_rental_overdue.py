@@ -0,0 +1,26 @@
+# Generated by Django 4.2.7 on 2026-10-17 04:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library_app', '0011_payment_created_at'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='rental',
+            name='rental_approved_end_idx',
+        ),
+        migrations.AlterField(
+            model_name='rental',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('approved', 'Approved'), ('overdue', 'Overdue'), ('active', 'Active'), ('completed', 'Completed'), ('canceled', 'Canceled')], default='pending', max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='rental',
+            index=models.Index(condition=models.Q(('status__in', ('approved', 'overdue'))), fields=['end_date'], name='rental_late_end_idx'),
+        ),
+    ]
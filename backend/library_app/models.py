@@ -1,6 +1,8 @@
 from django.db import models
+from django.db.models.functions import Replace, Upper
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.utils import timezone
 
 class User(AbstractUser):
     """
@@ -28,6 +30,13 @@ class User(AbstractUser):
     
     def __str__(self):
         return self.username
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored username: books and reviews show it
+        instance._stored_username = instance.__dict__.get('username')
+        return instance
 
 class Book(models.Model):
     """
@@ -47,8 +56,52 @@ class Book(models.Model):
     category = models.CharField(max_length=50, blank=True, null=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='available')
     
+    # Review aggregates, maintained by atomic F() updates in ratings.py
+    rating_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_average = models.FloatField(default=0)
+    rating_1 = models.PositiveIntegerField(default=0)
+    rating_2 = models.PositiveIntegerField(default=0)
+    rating_3 = models.PositiveIntegerField(default=0)
+    rating_4 = models.PositiveIntegerField(default=0)
+    rating_5 = models.PositiveIntegerField(default=0)
+    # Set by every write, including the QuerySet.update() ones; delta sync
+    # reads changes in (updated_at, id) order (see sync.py)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        indexes = [
+            # Delta sync
+            models.Index(fields=['updated_at', 'id'], name='book_updated_idx'),
+            # available action: status filter in keyset order
+            models.Index(fields=['status', '-id'], name='book_status_id_idx'),
+            # my_books, dashboard counters and the book__owner side of rental joins
+            models.Index(fields=['owner', 'status'], name='book_owner_status_idx'),
+            # Keyset order for the top_rated action
+            models.Index(fields=['-rating_average', '-id'], name='book_rating_average_idx'),
+            # Duplicate-ISBN checks of the bulk import; the expression must
+            # stay identical to bulk_import.db_isbn_key() for it to be used
+            models.Index(
+                models.F('owner'),
+                Upper(Replace(Replace(models.F('isbn'), models.Value('-'), models.Value('')),
+                              models.Value(' '), models.Value(''))),
+                name='book_owner_isbn_key_idx',
+            ),
+        ]
+    
     def __str__(self):
         return self.title
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored title: rentals and reviews show it
+        instance._stored_title = instance.__dict__.get('title')
+        return instance
+    
+    @property
+    def rating_histogram(self):
+        return {star: getattr(self, f'rating_{star}') for star in range(1, 6)}
 
 class Rental(models.Model):
     """
@@ -58,6 +111,7 @@ class Rental(models.Model):
     STATUS_CHOICES = (
         ('pending', 'Pending'),
         ('approved', 'Approved'),
+        ('overdue', 'Overdue'),
         ('active', 'Active'),
         ('completed', 'Completed'),
         ('canceled', 'Canceled'),
@@ -68,6 +122,29 @@ class Rental(models.Model):
     start_date = models.DateField()
     end_date = models.DateField()
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        indexes = [
+            # Delta sync (see sync.py)
+            models.Index(fields=['updated_at', 'id'], name='rental_updated_idx'),
+            # my_rentals in keyset order, and the renter's dashboard counters
+            models.Index(fields=['renter', '-id'], name='rental_renter_id_idx'),
+            models.Index(fields=['renter', 'status'], name='rental_renter_status_idx'),
+            # Per-book state checks (approve, overlap checks, dashboard)
+            models.Index(fields=['book', 'status'], name='rental_book_status_idx'),
+            # Pending requests on an owner's books
+            models.Index(fields=['book', '-id'], name='rental_pending_book_idx',
+                         condition=models.Q(status='pending')),
+            # Date-range scans over the rentals that are still open
+            models.Index(fields=['end_date'], name='rental_late_end_idx',
+                         condition=models.Q(status__in=('approved', 'overdue'))),
+            models.Index(fields=['start_date'], name='rental_pending_start_idx',
+                         condition=models.Q(status='pending')),
+            # Overlap checks and availability windows (see availability.py)
+            models.Index(fields=['book', 'end_date'], name='rental_open_book_end_idx',
+                         condition=models.Q(status__in=('pending', 'approved'))),
+        ]
     
     def __str__(self):
         return f"{self.renter.username} - {self.book.title}"
@@ -81,13 +158,25 @@ class Review(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='reviews')
     rating = models.IntegerField(validators=[MinValueValidator(1), MaxValueValidator(5)])
     comment = models.TextField(blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         # Ensure each user can only review a book once
         unique_together = ('book', 'user')
+        indexes = [
+            # Delta sync (see sync.py)
+            models.Index(fields=['updated_at', 'id'], name='review_updated_idx'),
+        ]
     
     def __str__(self):
         return f"{self.user.username}'s review of {self.book.title}"
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember what the book's rating aggregates currently count
+        instance._counted = (instance.__dict__.get('book_id'), instance.__dict__.get('rating'))
+        return instance
 
 class Payment(models.Model):
     """
@@ -100,10 +189,103 @@ class Payment(models.Model):
         ('refunded', 'Refunded'),
     )
     
-    rental = models.OneToOneField(Rental, on_delete=models.CASCADE, related_name='payment')
+    rental = models.ForeignKey(Rental, on_delete=models.CASCADE, related_name='payments')
     amount = models.DecimalField(max_digits=10, decimal_places=2)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
-    transaction_id = models.CharField(max_length=100, blank=True, null=True)
+    # Indexed for matching settlement files (see settlements.py)
+    transaction_id = models.CharField(max_length=100, blank=True, null=True, db_index=True)
+    # First day of the month a late fee (see billing.py) is for; empty on
+    # the payment for the rental itself
+    billing_period = models.DateField(blank=True, null=True)
+    # When the payment was made; settlement files only vouch for their own
+    # days (see settlements.py). Empty on payments from before the field.
+    created_at = models.DateTimeField(default=timezone.now, blank=True, null=True)
+    
+    class Meta:
+        indexes = [
+            # Pending payments of a settlement file's days
+            models.Index(fields=['status', 'created_at'], name='payment_status_created_idx'),
+        ]
+        constraints = [
+            # One payment for the rental itself...
+            models.UniqueConstraint(fields=['rental'], condition=models.Q(billing_period__isnull=True),
+                                    name='payment_rental_key'),
+            # ...and at most one late fee per rental and month, found by month
+            models.UniqueConstraint(fields=['billing_period', 'rental'], name='payment_period_rental_key'),
+        ]
+    
+    def __str__(self):
+        return f"Payment for {self.rental}"
+
+class OutboxEvent(models.Model):
+    """
+    A change to a rental or book, written in the transaction that made it
+    and streamed to the users it concerns (see outbox.py).
+    """
+    TOPIC_CHOICES = (
+        ('rental', 'Rental'),
+        ('book', 'Book'),
+        # Not an event: marks how far retention has pruned the outbox
+        ('pruned', 'Pruned'),
+    )
+    
+    topic = models.CharField(max_length=10, choices=TOPIC_CHOICES)
+    action = models.CharField(max_length=20)
+    # Plain ids rather than foreign keys: events outlive deleted rows
+    object_id = models.BigIntegerField()
+    book_id = models.BigIntegerField()
+    status = models.CharField(max_length=20, blank=True)
+    # The users the event concerns; admins see every event
+    renter = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True,
+                               related_name='+', db_index=False)
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True,
+                              related_name='+', db_index=False)
+    # Writing transaction's id on PostgreSQL, 0 elsewhere; events are read
+    # in (xid, id) order (see outbox.py)
+    xid = models.BigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        indexes = [
+            # Each user's events in feed order, and every event for the feed's poller
+            models.Index(fields=['renter', 'xid', 'id'], name='outbox_renter_idx'),
+            models.Index(fields=['owner', 'xid', 'id'], name='outbox_owner_idx'),
+            models.Index(fields=['xid', 'id'], name='outbox_position_idx'),
+            # Compaction: later events for the same rental or book
+            models.Index(fields=['topic', 'object_id', 'id'], name='outbox_object_idx'),
+            # Retention
+            models.Index(fields=['created_at'], name='outbox_created_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.topic}.{self.action} {self.object_id}"
+
+class Tombstone(models.Model):
+    """
+    A deleted book, rental or review, kept for SYNC_TOMBSTONE_DAYS so that
+    delta sync can tell clients to drop it (see sync.py).
+    """
+    MODEL_CHOICES = (
+        ('book', 'Book'),
+        ('rental', 'Rental'),
+        ('review', 'Review'),
+    )
+    
+    model = models.CharField(max_length=10, choices=MODEL_CHOICES)
+    object_id = models.BigIntegerField()
+    # Plain ids rather than foreign keys: the rows they point at may be
+    # deleted in the same transaction. book_id places the tombstone on its
+    # book's shard; user_id is the renter or reviewer, owner_id the book's owner.
+    book_id = models.BigIntegerField()
+    user_id = models.BigIntegerField(null=True, blank=True)
+    owner_id = models.BigIntegerField(null=True, blank=True)
+    deleted_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        indexes = [
+            # Delta sync reads, and retention
+            models.Index(fields=['deleted_at', 'id'], name='tombstone_deleted_idx'),
+        ]
     
     def __str__(self):
-        return f"Payment for {self.rental}"
\ No newline at end of file
+        return f"{self.model} {self.object_id} deleted"
@@ -0,0 +1,223 @@
+"""
+The change feed: an outbox of rental and book events.
+
+Every change to a rental (created, edited, approved, completed, canceled,
+deleted, also by the sweeper in expiry.py) and to a book (created, edited,
+deleted, bulk imported) appends a compact OutboxEvent in the transaction
+that makes it, on the same shard, so an event exists exactly when its
+change committed. /api/async/events/ (async_views.EventFeedView) streams
+them: a rental's events go to its renter and its book's owner, a book's to
+its owner, and every event to admins.
+
+Feed order
+----------
+Ids are taken at INSERT but become visible at COMMIT, so on PostgreSQL a
+reader that has passed id 11 can still see id 10 commit afterwards. Events
+therefore carry their transaction's id (txid_current()) and are read in
+(xid, id) order, only below the reading snapshot's xmin: every transaction
+with a smaller xid has ended, so nothing can appear behind the reader any
+more. A long write transaction holds the feed back until it ends. SQLite
+runs one write transaction at a time, so there id order is commit order
+and xid stays 0.
+
+A client's position is the last (xid, id) it saw on each shard, sent as
+the SSE event id ("<xid>-<id>" per shard, comma-separated; the id names
+the shard; 0 before the first event). Sent back as Last-Event-ID, it
+resumes the feed with no gaps and no repeats.
+
+Retention and compaction
+------------------------
+compact() (`manage.py compact_outbox`) deletes events older than
+OUTBOX_RETENTION_DAYS, and of events older than
+OUTBOX_COMPACT_AFTER_MINUTES keeps only each rental's and book's latest:
+it carries the current status, which is all a client catching up needs.
+The newest pruned event stays behind as a `pruned` marker. A client
+resuming from before it has missed events for good and is told to reload.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Exists, OuterRef, Q
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
+
+from . import sharding
+from .models import OutboxEvent
+
+PRUNED = 'pruned'
+# Feed position before any event
+START = (0, 0)
+# Events deleted per statement by compact()
+DELETE_BATCH = 5000
+
+
+def _postgres():
+    return connections[sharding.db()].vendor == 'postgresql'
+
+
+def _xid():
+    return RawSQL('txid_current()', []) if _postgres() else 0
+
+
+def rental_event(rental, action, owner_id):
+    return OutboxEvent(topic='rental', action=action, object_id=rental.pk, book_id=rental.book_id,
+                       status=rental.status, renter_id=rental.renter_id, owner_id=owner_id, xid=_xid())
+
+
+def book_event(book, action):
+    return OutboxEvent(topic='book', action=action, object_id=book.pk, book_id=book.pk,
+                       status=book.status, owner_id=book.owner_id, xid=_xid())
+
+
+def record(*events):
+    """Append `events` to the bound shard's outbox, in the caller's transaction"""
+    if events:
+        OutboxEvent.objects.bulk_create(events)
+
+
+def payload(event):
+    """What clients receive for an event"""
+    data = {'type': f'{event.topic}.{event.action}', event.topic: event.object_id}
+    if event.topic == 'rental':
+        data['book'] = event.book_id
+    data['status'] = event.status
+    data['at'] = event.created_at
+    return data
+
+
+def position(event):
+    return (event.xid, event.pk)
+
+
+def parse_cursor(token):
+    """The {shard: (xid, id)} positions of an event id; ValueError if it is not one"""
+    cursor = {}
+    if token == '0':
+        return cursor
+    for part in token.split(','):
+        xid, pk = (int(number) for number in part.split('-'))
+        alias = sharding.for_pk(pk)
+        if alias is None or xid < 0:
+            raise ValueError(f'{part} is not a feed position')
+        cursor[alias] = (xid, pk)
+    return cursor
+
+
+def format_cursor(cursor):
+    """The event id for `cursor`; 0 before the first event"""
+    positions = sorted(cursor.values(), key=lambda position: position[1])
+    return ','.join(f'{xid}-{pk}' for xid, pk in positions if pk) or '0'
+
+
+def advance(cursor, items):
+    """The events of the (shard, event) pairs `items` past `cursor`, moving it past them"""
+    events = []
+    for alias, event in items:
+        if position(event) > cursor.get(alias, START):
+            cursor[alias] = position(event)
+            events.append(event)
+    return events
+
+
+def concerns(user, event):
+    return user.role == 'admin' or user.pk in (event.renter_id, event.owner_id)
+
+
+def _after(events, after):
+    """`events` past the position `after` that can be read for good, in feed order"""
+    xid, pk = after
+    if not _postgres():
+        # xid is always 0
+        return events.filter(pk__gt=pk).order_by('pk')
+    return (
+        events.filter(xid__gte=xid).filter(Q(xid__gt=xid) | Q(pk__gt=pk))
+        # Only ended transactions: nothing can commit behind these
+        .filter(xid__lt=RawSQL('txid_snapshot_xmin(txid_current_snapshot())', []))
+        .order_by('xid', 'pk')
+    )
+
+
+def read(cursor, limit, user=None):
+    """
+    Up to `limit` events per shard past `cursor`: the ones concerning
+    `user`, or every one. Returns (shard, event) pairs, each shard's in
+    feed order.
+    """
+    events = OutboxEvent.objects.exclude(topic=PRUNED)
+    if user is not None and user.role != 'admin':
+        events = events.filter(Q(renter=user) | Q(owner=user))
+    pairs = []
+    for alias in sharding.aliases():
+        with sharding.use(alias):
+            pairs += [(alias, event) for event in _after(events, cursor.get(alias, START))[:limit]]
+    return pairs
+
+
+def head():
+    """Every shard's latest position: where a client without an event id starts"""
+    cursor = {}
+    for alias in sharding.aliases():
+        with sharding.use(alias):
+            latest = (
+                _after(OutboxEvent.objects.all(), START).order_by('-xid', '-pk')
+                .values_list('xid', 'pk').first()
+            )
+        if latest:
+            cursor[alias] = latest
+    return cursor
+
+
+def is_stale(cursor):
+    """Whether retention has pruned events past `cursor`"""
+    for alias in sharding.aliases():
+        with sharding.use(alias):
+            marker = OutboxEvent.objects.filter(topic=PRUNED).values_list('xid', 'pk').first()
+        if marker and cursor.get(alias, START) < marker:
+            return True
+    return False
+
+
+def compact(now=None):
+    """
+    Apply retention and compaction on every shard. Returns the counts of
+    events `pruned` and `compacted` away.
+    """
+    now = now or timezone.now()
+    counts = {'pruned': 0, 'compacted': 0}
+    for alias in sharding.aliases():
+        with sharding.use(alias):
+            counts['pruned'] += _prune(now - timedelta(days=settings.OUTBOX_RETENTION_DAYS))
+            if settings.OUTBOX_COMPACT_AFTER_MINUTES is not None:
+                later = OutboxEvent.objects.filter(
+                    topic=OuterRef('topic'), object_id=OuterRef('object_id'), pk__gt=OuterRef('pk')
+                )
+                superseded = OutboxEvent.objects.filter(
+                    created_at__lt=now - timedelta(minutes=settings.OUTBOX_COMPACT_AFTER_MINUTES),
+                ).exclude(topic=PRUNED).filter(Exists(later))
+                counts['compacted'] += _delete(superseded)
+    return counts
+
+
+def _prune(cutoff):
+    expired = OutboxEvent.objects.filter(created_at__lt=cutoff).exclude(topic=PRUNED)
+    newest = expired.order_by('-xid', '-pk').values_list('pk', flat=True).first()
+    if newest is None:
+        return 0
+    # Move the marker first: once it is up, resuming clients are told to
+    # reload, whether or not the deletes below have finished
+    with transaction.atomic(using=sharding.db()):
+        OutboxEvent.objects.filter(topic=PRUNED).delete()
+        OutboxEvent.objects.filter(pk=newest).update(topic=PRUNED, action='', renter=None, owner=None)
+    return 1 + _delete(expired)
+
+
+def _delete(events):
+    """Delete `events` in short batches, walking them in id order"""
+    deleted, last_id = 0, 0
+    while True:
+        batch = list(events.filter(pk__gt=last_id).order_by('pk').values_list('pk', flat=True)[:DELETE_BATCH])
+        if not batch:
+            return deleted
+        last_id = batch[-1]
+        deleted += OutboxEvent.objects.filter(pk__in=batch).delete()[0]
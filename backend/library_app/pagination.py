@@ -0,0 +1,85 @@
+from rest_framework.pagination import CursorPagination
+
+
+class _PageRead(Exception):
+    """Raised with the page's sliced queryset instead of reading it"""
+
+    def __init__(self, queryset):
+        self.queryset = queryset
+
+
+class _PageQuery:
+    """
+    Stands in for the queryset while CursorPagination works out a page.
+    Ordering and filtering pass through; reading the slice either raises
+    _PageRead with it (`rows` unset) or returns `rows`, read elsewhere.
+    """
+
+    def __init__(self, queryset, rows=None):
+        self.queryset = queryset
+        self.rows = rows
+
+    def order_by(self, *fields):
+        return _PageQuery(self.queryset.order_by(*fields), self.rows)
+
+    def filter(self, *args, **kwargs):
+        return _PageQuery(self.queryset.filter(*args, **kwargs), self.rows)
+
+    def __getitem__(self, k):
+        if self.rows is None:
+            raise _PageRead(self.queryset[k])
+        return self.rows
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Cursor pagination over the primary key.
+
+    Each page is a `WHERE id < <cursor> ORDER BY id DESC LIMIT n` range scan
+    on the primary key index, so page N costs the same as page 1 no matter
+    how large the table grows, and no COUNT(*) is run unless a client opts in
+    with `?count=true`.
+    """
+    ordering = '-id'
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    count_query_param = 'count'
+
+    def wants_count(self, request):
+        return request.query_params.get(self.count_query_param, '').lower() in ('1', 'true', 'yes')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count = queryset.count() if self.wants_count(request) else None
+        return super().paginate_queryset(queryset, request, view)
+
+    def page_query(self, queryset, request, view=None):
+        """
+        The sliced queryset paginate_queryset() would read for this request,
+        unread, so async views can fetch the rows themselves and hand them
+        to paginate_rows(). None when the request turns pagination off.
+        """
+        try:
+            super().paginate_queryset(_PageQuery(queryset), request, view)
+        except _PageRead as read:
+            return read.queryset
+        return None
+
+    def paginate_rows(self, queryset, rows, request, view=None):
+        """The page of `rows` (read from page_query()), setting up the links like paginate_queryset()"""
+        return super().paginate_queryset(_PageQuery(queryset, rows), request, view)
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        if self.count is not None:
+            response.data = {'count': self.count, **response.data}
+        return response
+
+    def get_paginated_response_schema(self, schema):
+        schema = super().get_paginated_response_schema(schema)
+        schema['properties']['count'] = {'type': 'integer', 'example': 123}
+        return schema
+
+
+class TopRatedPagination(KeysetPagination):
+    """Keyset pagination over the (rating_average, id) index, best rated first"""
+    ordering = ('-rating_average', '-id')
@@ -17,7 +17,7 @@ class IsOwnerOrReadOnly(permissions.BasePermission):
             return True
         
         # Write permissions are only allowed to the owner or admin
-        return obj.owner == request.user or request.user.role == 'admin'
+        return obj.owner_id == request.user.id or request.user.role == 'admin'
 
 class IsRenterOrOwnerOrAdmin(permissions.BasePermission):
     """
@@ -29,8 +29,8 @@ class IsRenterOrOwnerOrAdmin(permissions.BasePermission):
             return True
         
         # Only renter, book owner, or admin can modify
-        return (obj.renter == request.user or 
-                obj.book.owner == request.user or 
+        return (obj.renter_id == request.user.id or 
+                obj.book.owner_id == request.user.id or 
                 request.user.role == 'admin')
 
 class IsReviewerOrReadOnly(permissions.BasePermission):
@@ -43,4 +43,4 @@ class IsReviewerOrReadOnly(permissions.BasePermission):
             return True
         
         # Write permissions are only allowed to the reviewer or admin
-        return obj.user == request.user or request.user.role == 'admin'
\ No newline at end of file
+        return obj.user_id == request.user.id or request.user.role == 'admin'
\ No newline at end of file
@@ -0,0 +1,116 @@
+"""
+Denormalized review aggregates on Book.
+
+Each review write adjusts its book's rating_count, rating_sum, histogram
+column and rating_average in a single UPDATE built from F() expressions, so
+concurrent reviews of the same book never lose an update. rating_average is
+stored (and indexed) so "best rated first" is an index scan, not a sort over
+an aggregate.
+
+Writes that bypass model signals (bulk_create, QuerySet.update, raw SQL)
+leave the aggregates stale; `manage.py reconcile_ratings` recomputes them.
+Both paths set the book's updated_at, so delta sync (sync.py) picks up the
+new aggregates.
+"""
+from django.db.models import Case, Count, F, FloatField, Q, Sum, Value, When
+from django.db.models.functions import Cast
+from django.utils import timezone
+
+from . import versions
+
+STARS = range(1, 6)
+AGGREGATE_FIELDS = ['rating_count', 'rating_sum', 'rating_average'] + [f'rating_{star}' for star in STARS]
+
+
+def adjust(book_model, book_id, rating, sign):
+    """Add (sign=1) or remove (sign=-1) one review of `rating` stars from a book"""
+    count = F('rating_count') + sign
+    total = F('rating_sum') + sign * rating
+    book_model.objects.filter(pk=book_id).update(
+        rating_count=count,
+        rating_sum=total,
+        rating_average=Case(
+            When(Q(rating_count__gt=-sign), then=Cast(total, FloatField()) / count),
+            default=Value(0.0),
+            output_field=FloatField(),
+        ),
+        **{f'rating_{rating}': F(f'rating_{rating}') + sign},
+        updated_at=timezone.now(),
+    )
+
+
+def review_saved(review, created):
+    """Apply a created or edited review to its book's aggregates"""
+    from .models import Book
+
+    old_book_id, old_rating = (None, None) if created else getattr(review, '_counted', (None, None))
+    new = (review.book_id, review.rating)
+    if (old_book_id, old_rating) != new:
+        if old_book_id is not None and old_rating is not None:
+            adjust(Book, old_book_id, old_rating, -1)
+        adjust(Book, review.book_id, review.rating, 1)
+    review._counted = new
+
+
+def review_deleted(review):
+    """Remove a deleted review from its book's aggregates"""
+    from .models import Book
+
+    book_id, rating = getattr(review, '_counted', (review.book_id, review.rating))
+    if book_id is not None and rating is not None:
+        adjust(Book, book_id, rating, -1)
+
+
+def reconcile(book_model, review_model, chunk_size=5000):
+    """
+    Recompute every book's aggregates from its reviews, walking the books
+    table in primary-key chunks so memory stays bounded. Only books whose
+    stored values are wrong are written. Returns (books checked, books fixed).
+    """
+    checked = fixed = 0
+    last_id = 0
+    while True:
+        books = list(
+            book_model.objects.filter(pk__gt=last_id).order_by('pk')
+            .only('pk', *AGGREGATE_FIELDS)[:chunk_size]
+        )
+        if not books:
+            return checked, fixed
+        last_id = books[-1].pk
+
+        stats = {
+            row['book_id']: row
+            for row in review_model.objects
+            .filter(book_id__gte=books[0].pk, book_id__lte=last_id)
+            .values('book_id')
+            .annotate(
+                count=Count('id'),
+                total=Sum('rating'),
+                **{f'stars_{star}': Count('id', filter=Q(rating=star)) for star in STARS},
+            )
+        }
+
+        stale = []
+        for book in books:
+            row = stats.get(book.pk, {})
+            expected = {
+                'rating_count': row.get('count', 0),
+                'rating_sum': row.get('total') or 0,
+                **{f'rating_{star}': row.get(f'stars_{star}', 0) for star in STARS},
+            }
+            expected['rating_average'] = (
+                expected['rating_sum'] / expected['rating_count'] if expected['rating_count'] else 0.0
+            )
+            if any(getattr(book, name) != value for name, value in expected.items()):
+                for name, value in expected.items():
+                    setattr(book, name, value)
+                stale.append(book)
+
+        if stale:
+            now = timezone.now()
+            for book in stale:
+                book.updated_at = now
+            book_model.objects.bulk_update(stale, AGGREGATE_FIELDS + ['updated_at'], batch_size=1000)
+            versions.bump('books', *(versions.book_scope(book.pk) for book in stale))
+        checked += len(books)
+        fixed += len(stale)
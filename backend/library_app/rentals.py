@@ -0,0 +1,176 @@
+"""
+Rental state transitions.
+
+Every transition is a conditional `UPDATE ... WHERE status = <expected>` on
+the status column alone, run in one transaction with the matching guarded
+update of the book's status. Two requests racing on the same rental cannot
+both win: the loser's UPDATE matches no row, the transaction rolls back and
+the caller gets a 409.
+
+QuerySet.update() sends no model signals and skips auto_now, so the
+updates set updated_at themselves, and the dashboard cache entries and
+response versions the transition affects are dropped explicitly once the
+transaction commits. Each transition, create and edit also appends its
+event to the change feed (outbox.py) in the same transaction.
+
+Creating or re-dating a rental goes through save_rental, which locks the
+book row and refuses dates that overlap another open rental of the book
+(see availability.py).
+
+A book can hold several approved rentals for different dates, so approval
+checks the calendar rather than the book's status: it takes the same book
+lock and refuses an approval whose dates overlap another open rental.
+The book's status says whether it is out today. Approving a rental that
+has started flips the book available -> rented, guarded like the rental
+transitions; approving a later one leaves the book available until
+expiry.py's sweeper flips it on the start date. The book is available
+again once none of its started rentals is approved or overdue. A book its
+owner has made unavailable refuses approvals outright.
+"""
+from django.db import IntegrityError, connections
+from django.db.models import F, Q
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from . import dashboard, outbox, sharding, versions
+from .availability import BLOCKING_STATUSES, CONSTRAINT_NAME, find_overlap
+from .models import Book, Rental
+from .signals import book_owner_id
+
+
+class Conflict(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'This rental was changed by another request. Reload it and try again.'
+    default_code = 'conflict'
+
+
+def out_rentals(today):
+    """The rentals that keep their book rented on `today`: approved and started, or overdue"""
+    return Rental.objects.filter(Q(status='approved', start_date__lte=today) | Q(status='overdue'))
+
+
+def _occupy_book(rental):
+    """available -> rented for the rental's book; False if it is not available"""
+    updated = (
+        Book.objects.filter(pk=rental.book_id, status='available')
+        .update(status='rented', updated_at=timezone.now())
+    )
+    if updated and Rental.book.is_cached(rental):
+        rental.book.status = 'rented'
+    return updated
+
+
+def _release_book(rental):
+    """Make the rental's book available again, unless another of its rentals is out"""
+    updated = (
+        Book.objects.filter(pk=rental.book_id, status='rented')
+        .exclude(pk__in=out_rentals(timezone.localdate()).filter(book_id=rental.book_id).values('book_id'))
+        .update(status='available', updated_at=timezone.now())
+    )
+    if updated and Rental.book.is_cached(rental):
+        rental.book.status = 'available'
+    return updated
+
+
+def _transition(rental, from_status, to_status):
+    updated = (
+        Rental.objects.filter(pk=rental.pk, status=from_status)
+        .update(status=to_status, updated_at=timezone.now())
+    )
+    if not updated:
+        raise Conflict()
+    rental.status = to_status
+    owner_id = book_owner_id(rental)
+    outbox.record(outbox.rental_event(rental, to_status, owner_id))
+    sharding.on_commit(lambda: _invalidate(rental.renter_id, owner_id))
+    # The book's status may flip with the rental
+    versions.bump('books', versions.book_scope(rental.book_id))
+
+
+def _invalidate(*user_ids):
+    dashboard.invalidate_catalog()
+    dashboard.invalidate_users(*user_ids)
+
+
+@sharding.atomic
+def approve_rental(rental):
+    """
+    pending -> approved, if no other open rental overlaps it; the book
+    becomes rented if the rental has started
+    """
+    _lock_book(rental.book_id)
+    _transition(rental, 'pending', 'approved')
+    clash = find_overlap(rental.book_id, rental.start_date, rental.end_date, exclude=rental.pk)
+    if clash is not None:
+        raise Conflict(f'This book is already booked from {clash.start_date} to {clash.end_date}.')
+    if rental.start_date <= timezone.localdate():
+        occupied = _occupy_book(rental)
+    else:
+        occupied = not Book.objects.filter(pk=rental.book_id, status='unavailable').exists()
+    if not occupied:
+        raise Conflict('This book is no longer available.')
+
+
+@sharding.atomic
+def complete_rental(rental):
+    """approved or overdue -> completed, releasing the book if no other rental of it is out"""
+    _lock_book(rental.book_id)
+    _transition(rental, rental.status, 'completed')
+    _release_book(rental)
+
+
+@sharding.atomic
+def cancel_rental(rental):
+    """pending or approved -> canceled; an approved rental releases its book as completion does"""
+    was_approved = rental.status == 'approved'
+    if was_approved:
+        _lock_book(rental.book_id)
+    _transition(rental, rental.status, 'canceled')
+    if was_approved:
+        _release_book(rental)
+
+
+def _lock_book(book_id):
+    """Serialize rental writes for one book until the transaction ends"""
+    if connections[sharding.db()].features.has_select_for_update:
+        list(Book.objects.select_for_update().filter(pk=book_id).values_list('pk'))
+    else:
+        # SQLite has no row locks. A no-op write takes the database write
+        # lock now, so a concurrent booking waits instead of failing at COMMIT.
+        Book.objects.filter(pk=book_id).update(status=F('status'))
+
+
+def save_rental(serializer, **kwargs):
+    """
+    Save a new or edited rental, refusing dates that overlap another pending
+    or approved rental of the same book with a 409
+    """
+    try:
+        return _save_rental(serializer, **kwargs)
+    except IntegrityError as exc:
+        # The PostgreSQL exclusion constraint caught a write that raced us
+        if CONSTRAINT_NAME in str(exc):
+            raise Conflict('This book is already booked for some of those dates.')
+        raise
+
+
+@sharding.atomic
+def _save_rental(serializer, **kwargs):
+    data = serializer.validated_data
+    instance = serializer.instance
+    book = data.get('book', instance.book if instance else None)
+    # Status is read-only on the serializer; only the transitions change it
+    rental_status = instance.status if instance else 'pending'
+    if rental_status in BLOCKING_STATUSES:
+        start = data.get('start_date', instance.start_date if instance else None)
+        end = data.get('end_date', instance.end_date if instance else None)
+        _lock_book(book.pk)
+        clash = find_overlap(book.pk, start, end, exclude=instance.pk if instance else None)
+        if clash is not None:
+            raise Conflict(
+                f'This book is already booked from {clash.start_date} to {clash.end_date}.'
+            )
+    rental = serializer.save(**kwargs)
+    outbox.record(outbox.rental_event(rental, 'updated' if instance else 'created', book.owner_id))
+    return rental
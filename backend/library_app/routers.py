@@ -0,0 +1,93 @@
+"""
+Read-replica routing with read-your-writes stickiness.
+
+Reads go to the primary (`default`) unless the view serving the request
+has opted in. ReplicaReadMixin in views.py does that for safe requests to
+the actions a viewset lists in `replica_actions`. While the flag is on,
+ReplicaRouter sends reads to a random alias from DATABASE_REPLICAS. Writes
+always go to the primary, and so do reads inside a transaction.
+
+A replica can lag behind the primary. Someone who has just created,
+approved or cancelled something must not be shown the old state, so every
+unsafe request marks its user as sticky for REPLICA_STICKY_SECONDS. During
+that window all of their reads use the primary. The mark lives in the
+default cache, which must be shared when several processes serve the API.
+
+Responses cached under a version stamp (versions.py) are rendered from the
+primary while that version is younger than the window, so stale replica
+data is never cached as current.
+
+With DATABASE_REPLICAS empty, everything runs on the primary as before.
+`manage.py check_replica_routing` exercises all of this against a lagged
+SQLite replica.
+"""
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+STICKY_KEY = 'replica:sticky:{}'
+
+# True while the current request may read from a replica
+_replica_reads = ContextVar('replica_reads', default=False)
+
+
+def enable_replica_reads():
+    """Let reads for the rest of this request use a replica; returns a token for reset"""
+    return _replica_reads.set(True)
+
+
+def reset_replica_reads(token):
+    _replica_reads.reset(token)
+
+
+@contextmanager
+def primary_reads():
+    """Send reads inside the block to the primary, whatever the request allows"""
+    token = _replica_reads.set(False)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def replica_may_lag(written_ns):
+    """
+    Whether a replica read could still miss a write committed at
+    `written_ns` (time.time_ns()). The sticky window doubles as the bound
+    on replication lag.
+    """
+    return (_replica_reads.get()
+            and time.time_ns() - written_ns < settings.REPLICA_STICKY_SECONDS * 1_000_000_000)
+
+
+def mark_sticky(user_id):
+    """Pin `user_id`'s reads to the primary for the configured window"""
+    if settings.DATABASE_REPLICAS and user_id:
+        cache.set(STICKY_KEY.format(user_id), True, settings.REPLICA_STICKY_SECONDS)
+
+
+def is_sticky(user_id):
+    return bool(user_id) and cache.get(STICKY_KEY.format(user_id), False)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replicas = settings.DATABASE_REPLICAS
+        if not replicas or not _replica_reads.get():
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            # Read what the open transaction has written
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
@@ -0,0 +1,164 @@
+"""
+Full-text search over the book catalog.
+
+The index lives in the database and is maintained there, so it stays in sync
+on every insert, update and delete, including bulk_create() and
+QuerySet.update(), which bypass model signals:
+
+- PostgreSQL: a stored generated `tsvector` column with a GIN index, plus
+  pg_trgm GIN indexes on title and author so misspelled queries still match.
+- SQLite: an external-content FTS5 table kept current by triggers, which
+  are restored after any migration that rebuilds the books table.
+
+Other backends fall back to case-insensitive substring matching.
+The DDL is applied by migration 0002_book_search.
+"""
+import heapq
+import re
+from itertools import chain
+
+from django.contrib.postgres.search import TrigramSimilarity
+from django.db import connections
+from django.db.models import BooleanField, F, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Greatest
+
+from .sharding import ShardedQuerySet
+
+BOOK_TABLE = 'library_app_book'
+FTS_TABLE = 'library_app_book_fts'
+
+# Also created by migration 0002_book_search; restored by ensure_triggers()
+SQLITE_TRIGGERS = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON {BOOK_TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, author, isbn, category)
+        VALUES (new.id, new.title, new.author, new.isbn, new.category);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON {BOOK_TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, author, isbn, category)
+        VALUES ('delete', old.id, old.title, old.author, old.isbn, old.category);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF title, author, isbn, category ON {BOOK_TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, author, isbn, category)
+        VALUES ('delete', old.id, old.title, old.author, old.isbn, old.category);
+        INSERT INTO {FTS_TABLE}(rowid, title, author, isbn, category)
+        VALUES (new.id, new.title, new.author, new.isbn, new.category);
+    END
+    """,
+]
+
+SQLITE_REBUILD = f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"
+
+
+def ensure_triggers(using='default', **kwargs):
+    """
+    post_migrate hook: SQLite rebuilds a table for most ALTERs, dropping its
+    triggers, so restore the FTS triggers (and resync the index) whenever a
+    migration has removed them.
+    """
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger') AND name LIKE %s",
+            [f'{FTS_TABLE}%'],
+        )
+        existing = {row[0] for row in cursor.fetchall()}
+        triggers = {f'{FTS_TABLE}_ai', f'{FTS_TABLE}_ad', f'{FTS_TABLE}_au'}
+        if FTS_TABLE not in existing or triggers <= existing:
+            return
+        for statement in SQLITE_TRIGGERS:
+            cursor.execute(statement)
+        cursor.execute(SQLITE_REBUILD)
+
+
+def rebuild_index(using='default'):
+    """
+    Rebuild the search index from the books table.
+    Returns the number of indexed books.
+    """
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            # The generated column cannot drift; rebuild the index pages
+            # and refresh planner statistics after large imports.
+            for index in ('library_app_book_search_gin', 'library_app_book_title_trgm',
+                          'library_app_book_author_trgm'):
+                cursor.execute(f'REINDEX INDEX {index}')
+            cursor.execute(f'ANALYZE {BOOK_TABLE}')
+        elif connection.vendor == 'sqlite':
+            cursor.execute(SQLITE_REBUILD)
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')")
+        cursor.execute(f'SELECT COUNT(*) FROM {BOOK_TABLE}')
+        return cursor.fetchone()[0]
+
+
+def search_books(queryset, query, limit):
+    """
+    Return up to `limit` books from `queryset` matching `query`, best match
+    first. Each book carries a `rank` annotation (higher is better).
+    """
+    if isinstance(queryset, ShardedQuerySet):
+        # Each shard ranks against its own index; keep the best overall
+        found = queryset.scatter(lambda shard: search_books(shard, query, limit))
+        return heapq.nsmallest(limit, chain(*found), key=lambda book: (-book.rank, -book.id))
+    vendor = connections[queryset.db].vendor
+    if vendor == 'postgresql':
+        return _search_postgres(queryset, query, limit)
+    if vendor == 'sqlite':
+        return _search_sqlite(queryset, query, limit)
+    return _search_fallback(queryset, query, limit)
+
+
+def _search_postgres(queryset, query, limit):
+    tsquery = "websearch_to_tsquery('simple', %s)"
+    matched = RawSQL(f'{BOOK_TABLE}.search_vector @@ {tsquery}', (query,),
+                     output_field=BooleanField())
+    text_rank = RawSQL(f'ts_rank({BOOK_TABLE}.search_vector, {tsquery})', (query,),
+                       output_field=FloatField())
+    similarity = Greatest(TrigramSimilarity('title', query), TrigramSimilarity('author', query))
+    return list(
+        queryset
+        .filter(Q(matched) | Q(title__trigram_similar=query) | Q(author__trigram_similar=query))
+        .annotate(rank=text_rank + similarity)
+        .order_by(F('rank').desc(), '-id')[:limit]
+    )
+
+
+def _fts5_expression(query):
+    """Turn free text into an FTS5 query of quoted prefix terms, all required"""
+    terms = re.findall(r'\w+', query)
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def _search_sqlite(queryset, query, limit):
+    expression = _fts5_expression(query)
+    if not expression:
+        return []
+    with connections[queryset.db].cursor() as cursor:
+        # Column weights: title, author, isbn, category. bm25() is lower-is-better.
+        cursor.execute(
+            f'SELECT rowid, -bm25({FTS_TABLE}, 10.0, 5.0, 10.0, 2.0) AS rank '
+            f'FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s ORDER BY rank DESC LIMIT %s',
+            [expression, limit],
+        )
+        ranks = dict(cursor.fetchall())
+    if not ranks:
+        return []
+    books = list(queryset.filter(id__in=ranks))
+    for book in books:
+        book.rank = ranks[book.id]
+    return sorted(books, key=lambda book: (-book.rank, -book.id))
+
+
+def _search_fallback(queryset, query, limit):
+    matches = Q()
+    for field in ('title', 'author', 'isbn', 'category'):
+        matches |= Q(**{f'{field}__icontains': query})
+    return list(queryset.filter(matches).annotate(rank=Value(1.0)).order_by('-id')[:limit])
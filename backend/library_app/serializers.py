@@ -1,7 +1,21 @@
 from rest_framework import serializers
+from . import sharding
 from .models import User, Book, Rental, Review, Payment
+from .timing import measure, skip_frames
 
-class UserSerializer(serializers.ModelSerializer):
+class TimedModelSerializer(serializers.ModelSerializer):
+    """ModelSerializer whose validation and output count as serializer time in Server-Timing"""
+    def to_representation(self, instance):
+        with measure('serialize'):
+            return super().to_representation(instance)
+
+    def is_valid(self, *, raise_exception=False):
+        with measure('serialize'):
+            return super().is_valid(raise_exception=raise_exception)
+
+skip_frames(TimedModelSerializer.to_representation, TimedModelSerializer.is_valid)
+
+class UserSerializer(TimedModelSerializer):
     """Serializer for the User model"""
     class Meta:
         model = User
@@ -20,16 +34,29 @@ class UserSerializer(serializers.ModelSerializer):
             user.save()
         return user
 
-class BookSerializer(serializers.ModelSerializer):
+    def validate_hostel_number(self, value):
+        """
+        A user's books, rentals and reviews live on their hostel's shard, so
+        the hostel is fixed once set while sharding is on
+        """
+        if self.instance is not None and sharding.enabled() and value != self.instance.hostel_number:
+            raise serializers.ValidationError('The hostel cannot be changed while the catalog is sharded by hostel.')
+        return value
+
+class BookSerializer(TimedModelSerializer):
     """Serializer for the Book model"""
     owner_name = serializers.ReadOnlyField(source='owner.username')
+    rating_histogram = serializers.ReadOnlyField()
     
     class Meta:
         model = Book
-        fields = ['id', 'title', 'author', 'isbn', 'owner', 'owner_name', 'category', 'status']
-        read_only_fields = ['owner']  # Make owner read-only to fix validation issues
+        fields = ['id', 'title', 'author', 'isbn', 'owner', 'owner_name', 'category', 'status',
+                  'rating_count', 'rating_sum', 'rating_average', 'rating_histogram']
+        read_only_fields = ['owner',  # Make owner read-only to fix validation issues
+                            'rating_count', 'rating_sum', 'rating_average',
+                            'rating_1', 'rating_2', 'rating_3', 'rating_4', 'rating_5']
 
-class RentalSerializer(serializers.ModelSerializer):
+class RentalSerializer(TimedModelSerializer):
     """Serializer for the Rental model"""
     renter_name = serializers.ReadOnlyField(source='renter.username')
     book_title = serializers.ReadOnlyField(source='book.title')
@@ -37,9 +64,20 @@ class RentalSerializer(serializers.ModelSerializer):
     class Meta:
         model = Rental
         fields = ['id', 'renter', 'renter_name', 'book', 'book_title', 'start_date', 'end_date', 'status']
-        read_only_fields = ['renter']  # Make renter read-only as well
+        read_only_fields = ['renter', 'status']  # Status changes only through approve/complete/cancel
 
-class ReviewSerializer(serializers.ModelSerializer):
+    def validate(self, data):
+        """
+        Check that the rental does not end before it starts
+        """
+        start = data.get('start_date', getattr(self.instance, 'start_date', None))
+        end = data.get('end_date', getattr(self.instance, 'end_date', None))
+        if start and end and end < start:
+            raise serializers.ValidationError("End date cannot be before start date.")
+
+        return data
+
+class ReviewSerializer(TimedModelSerializer):
     """Serializer for the Review model"""
     user_name = serializers.ReadOnlyField(source='user.username')
     book_title = serializers.ReadOnlyField(source='book.title')
@@ -63,10 +101,28 @@ class ReviewSerializer(serializers.ModelSerializer):
         
         return data
 
-class PaymentSerializer(serializers.ModelSerializer):
+class PaymentSerializer(TimedModelSerializer):
     """Serializer for the Payment model"""
     rental_details = serializers.ReadOnlyField(source='rental.__str__')
     
     class Meta:
         model = Payment
-        fields = ['id', 'rental', 'rental_details', 'amount', 'status', 'transaction_id']
\ No newline at end of file
+        fields = ['id', 'rental', 'rental_details', 'amount', 'status', 'transaction_id', 'billing_period']
+        read_only_fields = ['billing_period']  # Late fees are billed by bill_late_fees only
+
+    def validate_rental(self, rental):
+        """
+        Check that the rental does not already have its payment, or for a
+        late fee, its fee for the same billing period
+        """
+        period = self.instance.billing_period if self.instance else None
+        others = Payment.objects.filter(rental=rental, billing_period=period)
+        if self.instance:
+            others = others.exclude(pk=self.instance.pk)
+        if others.exists():
+            if period is not None:
+                raise serializers.ValidationError(
+                    "This rental already has a late fee for this billing period."
+                )
+            raise serializers.ValidationError("payment with this rental already exists.")
+        return rental
\ No newline at end of file
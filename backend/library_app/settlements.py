@@ -0,0 +1,218 @@
+"""
+Reconciling payments against the payment provider's settlement files.
+
+A settlement file is CSV with a header row naming at least
+`transaction_id` and `amount`, and optionally `status`: the outcome of
+each transaction (`completed`/`settled`/`paid`, `failed`/`declined`, or
+`refunded`/`refund`; a row without one settled), and `date`: the day of
+the transaction (YYYY-MM-DD, or an ISO timestamp).
+
+The file is read line by line and handled in chunks. Each chunk becomes a
+hash table keyed by transaction id, and the payments carrying those ids
+are fetched with one indexed `transaction_id IN (...)` query per shard and
+joined against it in memory. Payments whose amount agrees move to the
+row's status through one bulk_update; the rows are locked while they
+change, so a concurrent edit waits instead of being overwritten. Memory
+holds one chunk, the capped problem lists and the ids of payments left
+pending by an amount mismatch, however long the file.
+
+Reported, besides the counts:
+- rows no payment matches, unreadable rows, and transaction ids repeated
+  within a chunk (a repeat further on finds the payment already moved and
+  counts as reconciled);
+- amount mismatches, and status changes a payment cannot make, such as
+  a failed payment settling (refunding a pending one is allowed);
+- unmatched payments: pending payments with a transaction id the file
+  does not mention, made (Payment.created_at) on the days from the
+  file's first date to its last. A file only vouches for its own days, so
+  one without dates gets no such check. Every payment the file names
+  moves on from pending unless its amount disagrees, so only those are
+  remembered; the pending payments of the file's days are then walked in
+  keyset batches.
+
+Running the same file again changes nothing; its rows count as already
+reconciled.
+"""
+import codecs
+import csv
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import sharding
+from .models import Payment
+
+# Settlement outcomes, as the provider may spell them, and the payment status each sets
+OUTCOMES = {
+    'completed': 'completed', 'settled': 'completed', 'paid': 'completed',
+    'failed': 'failed', 'declined': 'failed',
+    'refunded': 'refunded', 'refund': 'refunded',
+}
+# Statuses a payment may move to each outcome from
+MOVES_FROM = {
+    'completed': ('pending',),
+    'failed': ('pending',),
+    'refunded': ('pending', 'completed'),
+}
+
+
+def parse_rows(stream):
+    """Yield (line number, transaction id, amount, status, date, error) for every row of the file"""
+    reader = csv.DictReader(codecs.iterdecode(stream, 'utf-8-sig'))
+    for row in reader:
+        row = {(name or '').strip().lower(): (value or '').strip() for name, value in row.items()
+               if isinstance(value, str)}
+        transaction_id = row.get('transaction_id', '')
+        outcome = OUTCOMES.get(row.get('status', '').lower() or 'completed')
+        try:
+            amount = Decimal(row.get('amount', ''))
+        except InvalidOperation:
+            amount = None
+        try:
+            day = date.fromisoformat(row['date'][:10]) if row.get('date') else None
+        except ValueError:
+            day = False
+        if not transaction_id:
+            error = 'No transaction_id.'
+        elif amount is None or not amount.is_finite():
+            error = 'The amount is not a number.'
+        elif outcome is None:
+            error = f'Unknown status "{row["status"]}".'
+        elif day is False:
+            error = 'The date is not a date (YYYY-MM-DD).'
+        else:
+            error = None
+        yield reader.line_num, transaction_id, amount, outcome, day, error
+
+
+class Report:
+    def __init__(self, max_reported):
+        self.max_reported = max_reported
+        self.counts = {
+            'rows': 0, 'updated': 0, 'already_reconciled': 0, 'unmatched_rows': 0, 'invalid_rows': 0,
+            'duplicate_rows': 0, 'amount_mismatches': 0, 'status_conflicts': 0, 'unmatched_payments': 0,
+        }
+        self.problems = []
+        self.unmatched_payments = []
+        self.truncated = False
+        # The file's first and last dates
+        self.period = None
+
+    def problem(self, kind, line, transaction_id, detail):
+        self.counts[kind] += 1
+        if len(self.problems) < self.max_reported:
+            self.problems.append({'row': line, 'transaction_id': transaction_id, 'problem': detail})
+        else:
+            self.truncated = True
+
+    def unmatched_payment(self, pk, transaction_id, amount):
+        self.counts['unmatched_payments'] += 1
+        if len(self.unmatched_payments) < self.max_reported:
+            self.unmatched_payments.append({'id': pk, 'transaction_id': transaction_id, 'amount': str(amount)})
+        else:
+            self.truncated = True
+
+    def dated(self, day):
+        if self.period is None:
+            self.period = (day, day)
+        else:
+            self.period = (min(self.period[0], day), max(self.period[1], day))
+
+    def as_dict(self):
+        return {**self.counts, 'problems': self.problems, 'pending_not_in_file': self.unmatched_payments,
+                'period': list(self.period) if self.period else None, 'truncated': self.truncated}
+
+
+def reconcile_payments(stream, chunk_size, max_reported):
+    """Reconcile the settlement file `stream` (bytes); return the report"""
+    report = Report(max_reported)
+    rows = parse_rows(stream)
+    # Pending payments the file names: its amount mismatches
+    mismatched = set()
+    while True:
+        try:
+            chunk = list(islice(rows, chunk_size))
+        except (UnicodeDecodeError, csv.Error) as exc:
+            # Rows before the unreadable part are already reconciled
+            report.problem('invalid_rows', None, None, f'The file could not be read after row {report.counts["rows"]}: {exc}')
+            break
+        if not chunk:
+            break
+        _reconcile_chunk(chunk, report, mismatched)
+
+    if report.period is not None:
+        _report_unmatched_payments(report, mismatched, chunk_size)
+    return report.as_dict()
+
+
+def _report_unmatched_payments(report, mismatched, chunk_size):
+    """Report the pending payments of the file's days that it does not name, a batch at a time"""
+    first, last = report.period
+    pending = Payment.objects.filter(
+        status='pending',
+        created_at__gte=timezone.make_aware(datetime.combine(first, time.min)),
+        created_at__lt=timezone.make_aware(datetime.combine(last + timedelta(days=1), time.min)),
+    ).exclude(transaction_id__isnull=True).exclude(transaction_id='')
+    for alias in sharding.aliases():
+        with sharding.use(alias):
+            last_id = 0
+            while True:
+                batch = list(
+                    pending.filter(pk__gt=last_id).order_by('pk')
+                    .values_list('pk', 'transaction_id', 'amount')[:chunk_size]
+                )
+                if not batch:
+                    break
+                last_id = batch[-1][0]
+                for pk, transaction_id, amount in batch:
+                    if pk not in mismatched:
+                        report.unmatched_payment(pk, transaction_id, amount)
+
+
+def _reconcile_chunk(chunk, report, mismatched):
+    rows = {}
+    for line, transaction_id, amount, outcome, day, error in chunk:
+        report.counts['rows'] += 1
+        if error:
+            report.problem('invalid_rows', line, transaction_id or None, error)
+            continue
+        if day is not None:
+            report.dated(day)
+        if transaction_id in rows:
+            report.problem('duplicate_rows', line, transaction_id, 'This transaction id was listed earlier in the file.')
+        else:
+            rows[transaction_id] = (line, amount, outcome)
+    matched = set()
+
+    for alias in sharding.aliases():
+        with sharding.use(alias), transaction.atomic(using=sharding.db()):
+            changed = []
+            payments = (
+                Payment.objects.select_for_update().filter(transaction_id__in=list(rows))
+                .only('pk', 'transaction_id', 'amount', 'status').order_by('pk')
+            )
+            for payment in payments:
+                line, amount, outcome = rows[payment.transaction_id]
+                matched.add(payment.transaction_id)
+                if payment.amount != amount:
+                    report.problem('amount_mismatches', line, payment.transaction_id,
+                                   f'Payment {payment.pk} is for {payment.amount}, the file says {amount}.')
+                    if payment.status == 'pending':
+                        mismatched.add(payment.pk)
+                elif payment.status == outcome:
+                    report.counts['already_reconciled'] += 1
+                elif payment.status not in MOVES_FROM[outcome]:
+                    report.problem('status_conflicts', line, payment.transaction_id,
+                                   f'Payment {payment.pk} is {payment.status} and cannot become {outcome}.')
+                else:
+                    payment.status = outcome
+                    changed.append(payment)
+            Payment.objects.bulk_update(changed, ['status'])
+            report.counts['updated'] += len(changed)
+
+    for transaction_id, (line, _, _) in rows.items():
+        if transaction_id not in matched:
+            report.problem('unmatched_rows', line, transaction_id, 'No payment has this transaction id.')
@@ -0,0 +1,379 @@
+"""
+Optional hostel sharding of books, rentals, reviews and payments.
+
+People lend within their hostel, so the catalog partitions cleanly by the
+owner's `hostel_number`. DATABASE_SHARDS maps extra database aliases to the
+hostels they hold. A book lives on its owner's shard, and its rentals,
+reviews, payments, outbox events and tombstones live with it. Hostels
+that are not listed, and users without a hostel, stay on `default`. Users
+themselves live on `default` and are mirrored to every shard, so a shard
+can join rows to their users and enforce its foreign keys. Nothing moves
+a user's rows between shards, so UserSerializer and the admin keep an
+existing user's hostel_number fixed while sharding is on.
+
+Ids are globally unique. Each shard has a fixed `slot`, and its id
+sequences start at slot * ID_SPAN (`default` is slot 0), so an id alone
+names its shard. `ensure_shard` sets this up after every migrate.
+
+Requests find their shard in ShardedViewMixin (views.py), which binds it
+for the request:
+ - detail routes use the shard named by the id in the URL
+ - creates use the shard of the book or rental they belong to
+ - a user's own books use that user's shard
+While a shard is bound, ShardRouter sends every sharded query there,
+including the ones in rentals.py, ratings.py and availability.py.
+
+The few cross-hostel reads (admin lists, browsing, global search, a
+renter's rentals across hostels) get a ShardedQuerySet instead. It runs
+the same query on every shard concurrently and merges the rows in its
+ORDER BY.
+
+With DATABASE_SHARDS empty nothing is bound and every query runs on
+`default` as before.
+"""
+import heapq
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+from functools import cmp_to_key, wraps
+from itertools import chain, islice
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DEFAULT_DB_ALIAS, close_old_connections, connections, transaction
+
+from .models import Book, OutboxEvent, Payment, Rental, Review, Tombstone, User
+
+SHARDED_MODELS = (Book, Rental, Review, Payment, OutboxEvent, Tombstone)
+# Ids each shard can allocate; slot n owns n * ID_SPAN + 1 .. (n + 1) * ID_SPAN
+ID_SPAN = 10 ** 12
+
+# The shard the current request works in, if it has been narrowed to one
+_bound = ContextVar('shard', default=None)
+_executor = None
+
+
+def enabled():
+    return bool(settings.DATABASE_SHARDS)
+
+
+def slot(alias):
+    return 0 if alias == DEFAULT_DB_ALIAS else settings.DATABASE_SHARDS[alias]['slot']
+
+
+def aliases():
+    """Every shard, `default` first, in slot (and so id) order"""
+    shards = sorted(settings.DATABASE_SHARDS, key=slot)
+    slots = [slot(alias) for alias in shards]
+    if len(set(slots)) != len(slots) or any(number < 1 for number in slots):
+        raise ImproperlyConfigured('DATABASE_SHARDS slots must be distinct positive integers')
+    return [DEFAULT_DB_ALIAS, *shards]
+
+
+def for_hostel(hostel_number):
+    for alias, config in settings.DATABASE_SHARDS.items():
+        if hostel_number is not None and str(hostel_number) in config['hostels']:
+            return alias
+    return DEFAULT_DB_ALIAS
+
+
+def for_user(user):
+    """The shard holding the books `user` owns"""
+    return for_hostel(user.hostel_number)
+
+
+def for_pk(pk):
+    """The shard whose id range holds `pk`, or None if no shard does"""
+    wanted = (int(pk) - 1) // ID_SPAN
+    for alias in aliases():
+        if slot(alias) == wanted:
+            return alias
+    return None
+
+
+def home_of(instance):
+    """The shard a new, unsaved row belongs on"""
+    if isinstance(instance, Book):
+        return for_user(instance.owner) if instance.owner_id else None
+    if isinstance(instance, (Rental, Review)):
+        return for_pk(instance.book_id) if instance.book_id else None
+    if isinstance(instance, Payment):
+        return for_pk(instance.rental_id) if instance.rental_id else None
+    if isinstance(instance, (OutboxEvent, Tombstone)):
+        return for_pk(instance.book_id) if instance.book_id else None
+    return None
+
+
+def is_sharded(model):
+    return model in SHARDED_MODELS
+
+
+def bind(alias):
+    """Send sharded queries to `alias` for the rest of this request; returns a token for unbind"""
+    return _bound.set(alias)
+
+
+def unbind(token):
+    _bound.reset(token)
+
+
+@contextmanager
+def use(alias):
+    token = bind(alias)
+    try:
+        yield
+    finally:
+        unbind(token)
+
+
+def db():
+    """The database sharded rows are read from and written to right now"""
+    return _bound.get() or DEFAULT_DB_ALIAS
+
+
+def atomic(func):
+    """Like @transaction.atomic, on the shard bound when the function is called"""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with transaction.atomic(using=db()):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def on_commit(func):
+    """Run `func` once the bound shard's current transaction commits"""
+    transaction.on_commit(func, using=db())
+
+
+class ShardRouter:
+    """
+    Routes books, rentals, reviews, payments and outbox events to their
+    shard. Everything else, and sharded models while no shard is known, is
+    left to the next router (ReplicaRouter), which answers with `default`.
+    """
+
+    def _shard(self, model, instance=None):
+        if not enabled() or not is_sharded(model):
+            return None
+        # Rows and their related rows share a shard; a related manager on a
+        # user (user.owned_books) has no shard of its own
+        if instance is not None and is_sharded(type(instance)):
+            return instance._state.db or home_of(instance) or _bound.get()
+        return _bound.get()
+
+    def db_for_read(self, model, **hints):
+        return self._shard(model, hints.get('instance'))
+
+    def db_for_write(self, model, **hints):
+        return self._shard(model, hints.get('instance'))
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Users are mirrored to every shard
+        return True
+
+
+def scatter(func, items):
+    """func(item) for every item, concurrently when there are several"""
+    items = list(items)
+    if len(items) < 2:
+        return [func(item) for item in items]
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(settings.SHARD_QUERY_WORKERS, thread_name_prefix='shard')
+
+    def task(context, item):
+        # Worker threads keep their own connections; retire broken or expired ones
+        close_old_connections()
+        return context.run(func, item)
+    # Each task runs in a copy of the caller's context, so its queries count
+    # towards the caller's request timings (timing.py)
+    return list(_executor.map(task, [copy_context() for _ in items], items))
+
+
+def _compare(ordering):
+    """cmp() for model instances or values() rows following an order_by() list; NULLs sort lowest"""
+    fields = [(name.lstrip('-'), name.startswith('-')) for name in ordering]
+
+    def value(row, name):
+        if isinstance(row, dict):
+            return row['id' if name == 'pk' else name]
+        for part in ('pk' if name == 'id' else name).split('__'):
+            row = getattr(row, part)
+        return row
+
+    def compare(a, b):
+        for name, descending in fields:
+            x, y = value(a, name), value(b, name)
+            if x == y:
+                continue
+            result = -1 if y is not None and (x is None or x < y) else 1
+            return -result if descending else result
+        return 0
+    return compare
+
+
+class ShardedQuerySet:
+    """
+    The same queryset on every shard, read back as one queryset in its
+    ORDER BY. Supports what the list views, paginators, filters, exports and
+    dashboard use: filter(), exclude(), order_by(), select_related(),
+    values(), values_list(), count(), aggregate() of counts and sums,
+    slicing and iteration. Slices are lazy, as on a QuerySet, and a slice
+    [a:b] asks each shard for its first b rows only.
+    """
+
+    def __init__(self, queryset, shards):
+        self.model = queryset.model
+        self._querysets = [queryset.using(alias) for alias in shards]
+        self._slice = (0, None)
+
+    def _clone(self, querysets, bounds=None):
+        clone = ShardedQuerySet.__new__(ShardedQuerySet)
+        clone.model = self.model
+        clone._querysets = querysets
+        clone._slice = bounds or self._slice
+        return clone
+
+    def _chain(self, method, *args, **kwargs):
+        return self._clone([getattr(queryset, method)(*args, **kwargs) for queryset in self._querysets])
+
+    def all(self):
+        return self._chain('all')
+
+    def filter(self, *args, **kwargs):
+        return self._chain('filter', *args, **kwargs)
+
+    def exclude(self, *args, **kwargs):
+        return self._chain('exclude', *args, **kwargs)
+
+    def order_by(self, *fields):
+        return self._chain('order_by', *fields)
+
+    def select_related(self, *fields):
+        return self._chain('select_related', *fields)
+
+    def values(self, *fields):
+        return self._chain('values', *fields)
+
+    def values_list(self, *fields, **kwargs):
+        return self._chain('values_list', *fields, **kwargs)
+
+    @property
+    def ordering(self):
+        query = self._querysets[0].query
+        return [str(name) for name in (query.order_by or self.model._meta.ordering)]
+
+    def scatter(self, func):
+        """func(queryset) on every shard's queryset, concurrently"""
+        return scatter(func, self._querysets)
+
+    def count(self):
+        return sum(self.scatter(lambda queryset: queryset.count()))
+
+    def exists(self):
+        return any(self.scatter(lambda queryset: queryset.exists()))
+
+    def aggregate(self, **aggregates):
+        """Per-shard aggregates added up; only right for Count and Sum"""
+        totals = {}
+        for result in self.scatter(lambda queryset: queryset.aggregate(**aggregates)):
+            for name, value in result.items():
+                totals[name] = totals.get(name, 0) + (value or 0)
+        return totals
+
+    def _merged(self, limit=None):
+        rows = self.scatter(lambda queryset: list(queryset if limit is None else queryset[:limit]))
+        if not self.ordering:
+            return chain(*rows)
+        return heapq.merge(*rows, key=cmp_to_key(_compare(self.ordering)))
+
+    def __getitem__(self, k):
+        """Like a QuerySet: an index reads one row, a slice is read when iterated"""
+        if isinstance(k, int):
+            return list(self[k:k + 1])[0]
+        if k.step is not None or (k.start or 0) < 0 or (k.stop is not None and k.stop < 0):
+            raise ValueError('Sharded querysets only take non-negative slices')
+        start, stop = self._slice
+        new_start = start + (k.start or 0)
+        new_stop = stop if k.stop is None else start + k.stop
+        if stop is not None and new_stop is not None:
+            new_stop = min(new_stop, stop)
+        return self._clone(self._querysets, (new_start, new_stop))
+
+    def __iter__(self):
+        start, stop = self._slice
+        return islice(self._merged(stop), start, stop)
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def iterator(self, chunk_size=None):
+        """
+        Stream every row without holding whole shards in memory. Rows ordered
+        by id alone come one shard after another, since shards own ascending
+        id ranges; other orderings are merged on the fly.
+        """
+        streams = [queryset.iterator(chunk_size=chunk_size) for queryset in self._querysets]
+        if self.ordering in (['pk'], ['id']):
+            return chain(*streams)
+        if self.ordering in (['-pk'], ['-id']):
+            return chain(*reversed(streams))
+        return heapq.merge(*streams, key=cmp_to_key(_compare(self.ordering)))
+
+
+def sharded(queryset):
+    """`queryset` as is when a shard is bound (or sharding is off), else over every shard"""
+    if not enabled() or _bound.get():
+        return queryset
+    return ShardedQuerySet(queryset, aliases())
+
+
+def mirror_users(users, shards=None):
+    """Copy `users` from `default` to every other shard, inserting or updating them"""
+    users = list(users)
+    if not users:
+        return
+    fields = [field.name for field in User._meta.concrete_fields if not field.primary_key]
+    for alias in shards or aliases()[1:]:
+        User.objects.using(alias).bulk_create(
+            users, batch_size=1000, update_conflicts=True, unique_fields=['id'], update_fields=fields
+        )
+
+
+def drop_user(user_id):
+    """Delete a user's mirror, and with it their rows, from every other shard"""
+    for alias in aliases()[1:]:
+        with use(alias):
+            User.objects.using(alias).filter(pk=user_id).delete()
+
+
+def ensure_shard(using=DEFAULT_DB_ALIAS, **kwargs):
+    """
+    post_migrate hook: start a shard's id sequences at its slot and copy the
+    users to it. Both steps are idempotent.
+    """
+    if not enabled() or using == DEFAULT_DB_ALIAS or using not in settings.DATABASE_SHARDS:
+        return
+
+    connection = connections[using]
+    start = slot(using) * ID_SPAN
+    with connection.cursor() as cursor:
+        for model in SHARDED_MODELS:
+            table = model._meta.db_table
+            if connection.vendor == 'postgresql':
+                cursor.execute(
+                    f"SELECT setval(pg_get_serial_sequence(%s, 'id'), "
+                    f"GREATEST(%s, (SELECT COALESCE(MAX(id), 0) FROM {connection.ops.quote_name(table)})))",
+                    [table, start],
+                )
+            elif connection.vendor == 'sqlite':
+                cursor.execute(
+                    'INSERT INTO sqlite_sequence (name, seq) SELECT %s, 0 '
+                    'WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = %s)',
+                    [table, table],
+                )
+                cursor.execute('UPDATE sqlite_sequence SET seq = %s WHERE name = %s AND seq < %s',
+                               [start, table, start])
+            else:
+                raise ImproperlyConfigured(f'Sharding does not support {connection.vendor} databases')
+    mirror_users(User.objects.using(DEFAULT_DB_ALIAS).order_by('pk'), [using])
@@ -0,0 +1,122 @@
+"""
+Signal handlers that keep derived data in step with writes to the models.
+"""
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import dashboard, ratings, sharding, sync, versions
+from .authentication import user_cache, user_scope
+from .models import Book, Rental, Review, User
+
+
+def book_owner_id(rental):
+    """Owner of the rental's book, without a query when the book is already loaded"""
+    if Rental.book.is_cached(rental):
+        return rental.book.owner_id
+    return Book.objects.filter(pk=rental.book_id).values_list('owner_id', flat=True).first()
+
+
+@receiver([post_save, post_delete], sender=User)
+def user_changed(sender, instance, **kwargs):
+    # Drop this process's copy now; other processes see the version change
+    user_cache.evict(instance.pk)
+    versions.bump(user_scope(instance.pk))
+
+
+@receiver(post_save, sender=User)
+def user_renamed(sender, instance, created, **kwargs):
+    stored = getattr(instance, '_stored_username', None)
+    instance._stored_username = instance.username
+    if created or stored is None or stored == instance.username:
+        return
+    # Books show their owner's name and reviews their author's, so cached
+    # pages of both, and of the books involved, hold the old one; delta
+    # sync sends the user's rows again
+    book_ids = set()
+    for alias in sharding.aliases():
+        with sharding.use(alias):
+            book_ids.update(Book.objects.filter(owner_id=instance.pk).values_list('pk', flat=True))
+            book_ids.update(Review.objects.filter(user_id=instance.pk).values_list('book_id', flat=True))
+            sync.touch_user_names(instance.pk)
+    versions.bump('books', 'reviews', *map(versions.book_scope, book_ids))
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, using, **kwargs):
+    # Shards keep a copy of every user for their foreign keys and joins
+    if sharding.enabled() and using == DEFAULT_DB_ALIAS:
+        transaction.on_commit(lambda: sharding.mirror_users([instance]), using=using)
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, using, **kwargs):
+    if sharding.enabled() and using == DEFAULT_DB_ALIAS:
+        transaction.on_commit(lambda: sharding.drop_user(instance.pk), using=using)
+
+
+@receiver([post_save, post_delete], sender=Book)
+def book_changed(sender, instance, using, **kwargs):
+    owner_id = instance.owner_id
+    # After the commit, or a read in between caches the old counts again
+    transaction.on_commit(dashboard.invalidate_catalog, using=using)
+    transaction.on_commit(lambda: dashboard.invalidate_users(owner_id), using=using)
+    # Reviews show their book's title
+    versions.bump('books', 'reviews', versions.book_scope(instance.pk))
+
+
+@receiver(post_save, sender=Book)
+def book_renamed(sender, instance, created, using, **kwargs):
+    stored = getattr(instance, '_stored_title', None)
+    instance._stored_title = instance.title
+    if not created and stored is not None and stored != instance.title:
+        # Rentals and reviews show the title; delta sync sends them again
+        sync.touch_book_names(instance.pk, using)
+
+
+@receiver([post_save, post_delete], sender=Rental)
+def rental_changed(sender, instance, using, **kwargs):
+    user_ids = (instance.renter_id, book_owner_id(instance))
+    transaction.on_commit(lambda: dashboard.invalidate_users(*user_ids), using=using)
+    versions.bump(versions.book_scope(instance.book_id))
+
+
+@receiver([post_save, post_delete], sender=Review)
+def review_changed(sender, instance, using, **kwargs):
+    user_id = instance.user_id
+    transaction.on_commit(lambda: dashboard.invalidate_users(user_id), using=using)
+    # The book's rating aggregates change with its reviews, and a review
+    # moved to another book changes both
+    book_ids = {instance.book_id, getattr(instance, '_counted', (None, None))[0]} - {None}
+    versions.bump('reviews', 'books', *map(versions.book_scope, book_ids))
+
+
+@receiver(post_delete, sender=Book)
+@receiver(post_delete, sender=Rental)
+@receiver(post_delete, sender=Review)
+def row_deleted(sender, instance, using, **kwargs):
+    # Tells delta-syncing clients to drop the row (sync.py). A book's
+    # rentals are deleted before the book, so their owner is still there.
+    owner_id = book_owner_id(instance) if sender is Rental else None
+    sync.record_deletion(instance, using, owner_id)
+
+
+@receiver(pre_save, sender=Review)
+def review_loading(sender, instance, **kwargs):
+    # Reviews not loaded from the database (or loaded with the rating
+    # deferred) don't know what their book currently counts; look it up.
+    if not instance._state.adding and None in getattr(instance, '_counted', (None,)):
+        instance._counted = tuple(
+            Review.objects.filter(pk=instance.pk).values_list('book_id', 'rating').first()
+            or (None, None)
+        )
+
+
+@receiver(post_save, sender=Review)
+def review_saved(sender, instance, created, **kwargs):
+    ratings.review_saved(instance, created)
+
+
+@receiver(post_delete, sender=Review)
+def review_deleted(sender, instance, **kwargs):
+    ratings.review_deleted(instance)
@@ -0,0 +1,238 @@
+"""
+Delta sync of the books, rentals and reviews a client keeps locally.
+
+Rather than reading every page of /api/books/ and its own lists on each
+load, a client calls /api/sync/ with the token of its last sync and gets
+only what changed since:
+
+- `books`: the whole catalog; `rentals`: the user's own and the ones on
+  their books (every rental for admins); `reviews`: the user's own. Rows
+  are serialized as the list endpoints serialize them, so a client upserts
+  them by id. Rows copy names (book_title, renter_name, ...), so renaming
+  a book touches its rentals and reviews, and renaming a user touches
+  their books, rentals and reviews (signals.py), and they are sent again.
+- `deleted`: the ids of those deleted since, per collection. Deleting a
+  book also deletes its rentals and reviews.
+
+Every book, rental and review carries updated_at: auto_now on save(), and
+set explicitly by the QuerySet.update() calls in rentals.py, expiry.py,
+ratings.py and touch_*_names() here. Deleting one leaves a Tombstone,
+written by a post_delete receiver (signals.py) in the deleting
+transaction, on the row's shard.
+
+Passes and batches
+------------------
+One response holds at most SYNC_BATCH_SIZE rows and deletions. While
+`more` is true the client calls again straight away with `next`; once it
+is false the pass is complete, and its `next` is kept for the next sync.
+A pass walks the collections, then the tombstones, on every shard in
+keyset order: by id in a snapshot, by (updated_at, id) otherwise, so a row
+changed during the pass moves ahead of the walk and is still sent. Rows
+can come twice, which upserting makes harmless.
+
+updated_at is stamped by the app server before COMMIT, so a transaction
+that was still open when a pass began can commit rows older than the
+pass. The token that ends a pass therefore reaches back
+SYNC_OVERLAP_SECONDS before the pass began, which also covers clocks of
+app servers running a little behind.
+
+Snapshots
+---------
+A sync without a token is a snapshot: its first response has `reset` set,
+and the client replaces what it holds with the rows of the pass.
+Tombstones are kept for SYNC_TOMBSTONE_DAYS (`manage.py prune_tombstones`),
+so a token from further back could miss deletions; it gets a snapshot too,
+as does a token of an older format.
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core import signing
+from django.db.models import Q
+from django.utils import timezone
+
+from . import sharding
+from .models import Book, Rental, Review, Tombstone
+from .serializers import BookSerializer, RentalSerializer, ReviewSerializer
+
+SALT = 'library_app.sync'
+# Bumped when tokens change shape; older tokens get a snapshot
+VERSION = 1
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+# Tombstones deleted per statement by prune()
+DELETE_BATCH = 5000
+
+
+def _books(user):
+    return Book.objects.select_related('owner')
+
+
+def _rentals(user):
+    rentals = Rental.objects.select_related('renter', 'book')
+    if user.role == 'admin':
+        return rentals
+    return rentals.filter(Q(renter=user) | Q(book__owner=user))
+
+
+def _reviews(user):
+    return Review.objects.select_related('user', 'book').filter(user=user)
+
+
+def _tombstones(user):
+    rentals = Q(model='rental')
+    if user.role != 'admin':
+        rentals &= Q(user_id=user.pk) | Q(owner_id=user.pk)
+    return Tombstone.objects.filter(Q(model='book') | rentals | Q(model='review', user_id=user.pk))
+
+
+# (name, the rows a user syncs, serializer, Tombstone.model), in pass order
+COLLECTIONS = (
+    ('books', _books, BookSerializer, 'book'),
+    ('rentals', _rentals, RentalSerializer, 'rental'),
+    ('reviews', _reviews, ReviewSerializer, 'review'),
+)
+NAMES = {model: name for name, _, _, model in COLLECTIONS}
+
+
+def touch_book_names(book_id, using):
+    """Re-send the rentals and reviews showing a renamed book's title"""
+    now = timezone.now()
+    Rental.objects.using(using).filter(book_id=book_id).update(updated_at=now)
+    Review.objects.using(using).filter(book_id=book_id).update(updated_at=now)
+
+
+def touch_user_names(user_id):
+    """Re-send the books, rentals and reviews showing a renamed user's name, on the bound shard"""
+    now = timezone.now()
+    Book.objects.filter(owner_id=user_id).update(updated_at=now)
+    Rental.objects.filter(renter_id=user_id).update(updated_at=now)
+    Review.objects.filter(user_id=user_id).update(updated_at=now)
+
+
+def record_deletion(instance, using, owner_id=None):
+    """Leave a tombstone for a deleted book, rental (its book's owner: `owner_id`) or review"""
+    if isinstance(instance, Book):
+        tombstone = Tombstone(model='book', object_id=instance.pk, book_id=instance.pk,
+                              owner_id=instance.owner_id)
+    elif isinstance(instance, Rental):
+        tombstone = Tombstone(model='rental', object_id=instance.pk, book_id=instance.book_id,
+                              user_id=instance.renter_id, owner_id=owner_id)
+    else:
+        tombstone = Tombstone(model='review', object_id=instance.pk, book_id=instance.book_id,
+                              user_id=instance.user_id)
+    tombstone.save(using=using)
+
+
+def _micros(moment):
+    return (moment - EPOCH) // timedelta(microseconds=1)
+
+
+def _moment(micros):
+    return EPOCH + timedelta(microseconds=micros)
+
+
+def delta_token(since):
+    """A token for a sync of what changed after `since`"""
+    return _dump({'v': VERSION, 'since': _micros(since), 'started': None, 'stage': 0, 'after': None})
+
+
+def _dump(state):
+    return signing.dumps(state, salt=SALT, compress=True)
+
+
+def _load(token, now):
+    """The sync state in `token`, or None if it calls for a snapshot; ValueError if it is not a token"""
+    try:
+        state = signing.loads(token, salt=SALT)
+    except signing.BadSignature:
+        raise ValueError('This is not a sync token.')
+    if not isinstance(state, dict) or state.get('v') != VERSION:
+        return None
+    expired = now - timedelta(days=settings.SYNC_TOMBSTONE_DAYS)
+    if state['since'] is not None and _moment(state['since']) < expired:
+        return None
+    return state
+
+
+def _stamp(stage):
+    return 'updated_at' if stage < len(COLLECTIONS) else 'deleted_at'
+
+
+def _remaining(user, stage, since, after):
+    """Stage `stage` of a pass past the position `after`, in keyset order over every shard"""
+    rows = COLLECTIONS[stage][1](user) if stage < len(COLLECTIONS) else _tombstones(user)
+    if since is None:
+        rows = rows.order_by('pk')
+        if after is not None:
+            rows = rows.filter(pk__gt=after)
+    else:
+        stamp = _stamp(stage)
+        rows = rows.filter(**{f'{stamp}__gt': since}).order_by(stamp, 'pk')
+        if after is not None:
+            moment, pk = _moment(after[0]), after[1]
+            rows = rows.filter(Q(**{f'{stamp}__gt': moment}) | Q(**{stamp: moment, 'pk__gt': pk}))
+    return sharding.sharded(rows)
+
+
+def changes(user, token, context, batch_size=None):
+    """
+    The next batch of a sync for `user` from `token` (None for a first
+    sync); `context` is the serializers'. ValueError if `token` is not a
+    sync token.
+    """
+    batch_size = batch_size or settings.SYNC_BATCH_SIZE
+    now = timezone.now()
+    state = _load(token, now) if token else None
+    reset = state is None
+    if reset:
+        state = {'v': VERSION, 'since': None, 'started': None, 'stage': 0, 'after': None}
+    if state['started'] is None:
+        state['started'] = _micros(now)
+    since = None if state['since'] is None else _moment(state['since'])
+    # Deletions only matter to a client that has rows already
+    stages = len(COLLECTIONS) + (since is not None)
+
+    data = {'reset': reset, **{name: [] for name, *_ in COLLECTIONS},
+            'deleted': {name: [] for name, *_ in COLLECTIONS}}
+    room = batch_size
+    while room and state['stage'] < stages:
+        stage = state['stage']
+        rows = list(_remaining(user, stage, since, state['after'])[:room])
+        if stage < len(COLLECTIONS):
+            name, _, serializer, _ = COLLECTIONS[stage]
+            data[name] += serializer(rows, many=True, context=context).data
+        else:
+            for tombstone in rows:
+                data['deleted'][NAMES[tombstone.model]].append(tombstone.object_id)
+        if len(rows) < room:
+            state['stage'], state['after'] = stage + 1, None
+        elif since is None:
+            state['after'] = rows[-1].pk
+        else:
+            state['after'] = [_micros(getattr(rows[-1], _stamp(stage))), rows[-1].pk]
+        room -= len(rows)
+
+    data['more'] = state['stage'] < stages
+    if data['more']:
+        data['next'] = _dump(state)
+    else:
+        started = _moment(state['started'])
+        data['next'] = delta_token(started - timedelta(seconds=settings.SYNC_OVERLAP_SECONDS))
+    return data
+
+
+def prune(now=None):
+    """Delete tombstones older than SYNC_TOMBSTONE_DAYS on every shard; returns how many"""
+    cutoff = (now or timezone.now()) - timedelta(days=settings.SYNC_TOMBSTONE_DAYS)
+    deleted = 0
+    for alias in sharding.aliases():
+        with sharding.use(alias):
+            while True:
+                batch = list(
+                    Tombstone.objects.filter(deleted_at__lt=cutoff).order_by('deleted_at', 'pk')
+                    .values_list('pk', flat=True)[:DELETE_BATCH]
+                )
+                if not batch:
+                    break
+                deleted += Tombstone.objects.filter(pk__in=batch).delete()[0]
+    return deleted
@@ -0,0 +1,387 @@
+"""
+Synthetic datasets for capacity planning, loaded by `manage.py generate_data`.
+
+The data is shaped like a busy campus rather than spread evenly:
+
+- Book popularity follows a Zipf law: the most popular book of a million
+  is rented thousands of times, most are rented a handful of times. A book
+  can only hold so many rentals in the history window, so demand above
+  that is passed down to the next most popular books.
+- Owners' catalogs are Zipf-sized too, and users cluster in hostels of
+  uneven size. A book lives in its owner's hostel, and most of its renters
+  come from the same hostel.
+- Every book's rentals are laid out one after another in time and follow
+  the transitions rentals.py allows. History is completed or canceled,
+  apart from the odd book that was never returned, which is still approved,
+  or overdue once the sweeper (expiry.py) would have marked it. A book has
+  at most one approved or overdue rental, and its status agrees with it. Pending requests only
+  wait for free dates. Completed rentals carry payments, and some of
+  their renters leave one review per book, which the book's rating
+  aggregates count.
+
+Everything is derived from the seed. Users come in blocks of BLOCK_SIZE
+ids, and books come in blocks of BLOCK_SIZE ids together with all their
+rentals, payments and reviews. Each block draws from its own random
+generator, seeded from the seed and its block number, so blocks can be
+generated in any order by any number of worker processes and still come
+out identical.
+
+Rows go in with COPY on PostgreSQL and bulk_create elsewhere. Both skip
+model signals, so the caller clears the caches afterwards.
+"""
+import io
+import random
+from datetime import datetime, time, timedelta, timezone
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connections
+
+from .models import User, Book, Rental, Review, Payment
+
+# Rows of a block: users per user block, books (with their rentals) per book block
+BLOCK_SIZE = 10_000
+# Generated users get addresses at this domain, so a later run can find them
+EMAIL_DOMAIN = 'seed.example.com'
+
+ROLE_WEIGHTS = {'owner': 25, 'renter': 65, 'viewer': 10}
+# Zipf exponents: hostel sizes and how many books each owner lists
+HOSTEL_SKEW = 0.6
+OWNER_SKEW = 1.1
+# Days requests may be made ahead of time, after `today`
+FUTURE_DAYS = 60
+# Every rental gets a slot of at least this many days on its book's timeline
+MIN_SLOT_DAYS = 3
+MAX_RENTAL_DAYS = 21
+DAILY_RATE = Decimal('0.50')
+
+# Outcomes of rentals that have ended, and of requests still ahead
+COMPLETED_SHARE = 0.9
+OVERDUE_SHARE = 0.03
+CANCELED_SHARE = 0.1
+APPROVED_AHEAD_SHARE = 0.4
+WITHDRAWN_SHARE = 0.03
+PAYMENT_OUTCOMES = {'completed': 95, 'refunded': 3, 'failed': 2}
+
+FIRST_NAMES = [
+    'Aarav', 'Aditi', 'Alice', 'Ananya', 'Arjun', 'Bob', 'Chen', 'Diya', 'Emma', 'Farah',
+    'Ishaan', 'Jane', 'John', 'Kabir', 'Lena', 'Meera', 'Nikhil', 'Omar', 'Priya', 'Rahul',
+    'Rohan', 'Sara', 'Tanvi', 'Vikram', 'Yuki', 'Zoya',
+]
+LAST_NAMES = [
+    'Brown', 'Davis', 'Desai', 'Fernandes', 'Gupta', 'Iyer', 'Johnson', 'Khan', 'Kulkarni',
+    'Lee', 'Mehta', 'Menon', 'Nair', 'Patel', 'Rao', 'Reddy', 'Shah', 'Singh', 'Smith', 'Verma',
+]
+TITLE_WORDS = [
+    'Silent', 'River', 'Glass', 'Empire', 'Shadow', 'Garden', 'Winter', 'Code', 'Stone', 'Night',
+    'Ocean', 'Machine', 'Crown', 'Letter', 'Storm', 'Mountain', 'Signal', 'Harvest', 'Mirror',
+    'Engine', 'Forest', 'Memory', 'Light', 'Atlas', 'Orbit', 'Paper', 'Tide', 'Lantern',
+]
+TITLE_PATTERNS = ['The {} {}', '{} of the {}', 'A {} {}', 'The {} and the {}', '{} {}']
+CATEGORIES = {
+    'Fiction': 30, 'Computer Science': 15, 'Fantasy': 12, 'Science Fiction': 10,
+    'Mathematics': 8, 'History': 7, 'Biography': 6, 'Physics': 5, 'Poetry': 4, 'Economics': 3,
+}
+COMMENTS = {
+    1: 'Could not get into {}.',
+    2: 'Not my favorite. {} was okay in parts.',
+    3: 'Decent book. {} was worth a read.',
+    4: 'Very good read. {} was quite interesting.',
+    5: 'Excellent book! I thoroughly enjoyed {}.',
+}
+
+USER_FIELDS = (
+    'id', 'password', 'is_superuser', 'username', 'first_name', 'last_name', 'email',
+    'is_staff', 'is_active', 'date_joined', 'role', 'status', 'room_number', 'phone_number',
+    'hostel_number',
+)
+BOOK_FIELDS = (
+    'id', 'title', 'author', 'isbn', 'owner_id', 'category', 'status', 'rating_count',
+    'rating_sum', 'rating_average', 'rating_1', 'rating_2', 'rating_3', 'rating_4', 'rating_5',
+)
+RENTAL_FIELDS = ('id', 'renter_id', 'book_id', 'start_date', 'end_date', 'status')
+PAYMENT_FIELDS = ('id', 'rental_id', 'amount', 'status', 'transaction_id', 'created_at')
+REVIEW_FIELDS = ('id', 'book_id', 'user_id', 'rating', 'comment')
+
+
+def zipf_weights(count, exponent):
+    """Cumulative weights of ranks 1..count under a Zipf law, for random.choices()"""
+    cumulative, total = [], 0.0
+    for rank in range(1, count + 1):
+        total += rank ** -exponent
+        cumulative.append(total)
+    return cumulative
+
+
+class Plan:
+    """
+    The dataset-wide decisions every block needs: who the users are and
+    how many rentals each book gets. Computed once, before the workers
+    fork, from random generators of their own.
+    """
+
+    def __init__(self, seed, users, books, rentals, hostels, today, history_days,
+                 popularity_skew, local_share, review_share, password, first_user_id):
+        self.seed = seed
+        self.users = users
+        self.books = books
+        self.hostels = hostels
+        self.today = today
+        self.history_days = history_days
+        self.local_share = local_share
+        self.review_share = review_share
+        self.password = password
+        self.first_user_id = first_user_id
+
+        self.roles, self.user_hostels = self.profiles()
+        self.owners = [n for n, role in enumerate(self.roles) if role == 'owner']
+        self.renters = [n for n, role in enumerate(self.roles) if role == 'renter']
+        if not self.owners or not self.renters:
+            raise ValueError('Too few users to have both owners and renters')
+        self.renters_by_hostel = [[] for _ in range(hostels)]
+        for n in self.renters:
+            self.renters_by_hostel[self.user_hostels[n]].append(n)
+        owner_rng = self.rng('owners')
+        owner_ranks = self.owners[:]
+        owner_rng.shuffle(owner_ranks)
+        self.owner_ranks = owner_ranks
+        self.owner_weights = zipf_weights(len(owner_ranks), OWNER_SKEW)
+
+        self.counts = self.rental_counts(rentals, popularity_skew)
+        self.rental_offsets = [0]
+        for block in range(self.blocks(books)):
+            self.rental_offsets.append(
+                self.rental_offsets[-1] + sum(self.counts[block * BLOCK_SIZE:(block + 1) * BLOCK_SIZE])
+            )
+
+    @staticmethod
+    def blocks(rows):
+        return -(-rows // BLOCK_SIZE)
+
+    @property
+    def rentals(self):
+        return self.rental_offsets[-1]
+
+    def rng(self, *name):
+        # String seeds hash the same way in every process and on every run
+        return random.Random(':'.join(map(str, (self.seed, *name))))
+
+    def slot_capacity(self):
+        return (self.history_days + FUTURE_DAYS) // MIN_SLOT_DAYS
+
+    def profiles(self):
+        rng = self.rng('profiles')
+        roles = rng.choices(list(ROLE_WEIGHTS), weights=list(ROLE_WEIGHTS.values()), k=self.users)
+        hostels = rng.choices(range(self.hostels), cum_weights=zipf_weights(self.hostels, HOSTEL_SKEW),
+                              k=self.users)
+        return roles, hostels
+
+    def rental_counts(self, rentals, exponent):
+        """
+        Rentals per book: Zipf demand by a random popularity rank, with
+        books at capacity passing the rest of their demand down the ranks
+        ("water-filling"), rounded stochastically
+        """
+        cap = self.slot_capacity()
+        if rentals > self.books * cap:
+            raise ValueError(f'{self.books} books hold at most {self.books * cap} rentals '
+                             f'over {self.history_days} days of history')
+        weights = [rank ** -exponent for rank in range(1, self.books + 1)]
+        total, remaining, capped = sum(weights), rentals, 0
+        while capped < self.books and remaining * weights[capped] / total > cap:
+            remaining -= cap
+            total -= weights[capped]
+            capped += 1
+
+        rng = self.rng('popularity')
+        ranks = list(range(self.books))
+        rng.shuffle(ranks)
+        counts = []
+        for rank in ranks:
+            expected = cap if rank < capped else remaining * weights[rank] / total
+            whole = int(expected)
+            counts.append(whole + (rng.random() < expected - whole))
+        return counts
+
+    def user_id(self, n):
+        return self.first_user_id + n
+
+
+def user_rows(plan, block):
+    """The rows of users block `block`"""
+    rng = plan.rng('users', block)
+    joined_days = plan.history_days + FUTURE_DAYS
+    rows = []
+    for n in range(block * BLOCK_SIZE, min((block + 1) * BLOCK_SIZE, plan.users)):
+        user_id, role = plan.user_id(n), plan.roles[n]
+        username = f'{role}_{user_id}'
+        joined = datetime.combine(plan.today - timedelta(days=rng.randrange(joined_days)),
+                                  time(rng.randrange(24), rng.randrange(60)), timezone.utc)
+        rows.append((
+            user_id, plan.password, False, username, rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES),
+            f'{username}@{EMAIL_DOMAIN}', False, True, joined, role,
+            'active' if rng.random() < 0.97 else 'inactive',
+            f'{"ABCDEFG"[rng.randrange(7)]}-{rng.randint(1, 6)}{rng.randint(1, 40):02d}',
+            f'{rng.randint(100, 999)}-{rng.randint(100, 999)}-{rng.randint(1000, 9999)}',
+            f'H{plan.user_hostels[n] + 1}',
+        ))
+    return rows
+
+
+def isbn13(rng):
+    digits = [9, 7, 8] + [rng.randrange(10) for _ in range(9)]
+    check = -sum(digit * (3 if i % 2 else 1) for i, digit in enumerate(digits)) % 10
+    return ''.join(map(str, digits + [check]))
+
+
+def rental_slots(rng, count, first_day, span_days):
+    """`count` non-overlapping (start, end) date ranges, in order, within the span"""
+    slots = []
+    for i in range(count):
+        lo, hi = i * span_days // count, (i + 1) * span_days // count
+        days = rng.randint(1, min(MAX_RENTAL_DAYS, hi - lo))
+        start = first_day + timedelta(days=rng.randint(lo, hi - days))
+        slots.append((start, start + timedelta(days=days - 1)))
+    return slots
+
+
+def paid_at(start):
+    """When a rental starting on `start` was paid for: midday, UTC, that day"""
+    return datetime.combine(start, time(12), tzinfo=timezone.utc)
+
+
+def rental_statuses(rng, slots, today, withdrawn):
+    """
+    Statuses for one book's rentals, in time order, that rentals.py could
+    have reached: at most one approved or overdue rental, which is either
+    current, ahead, or the last one before today and never returned
+    """
+    overdue_before = today - timedelta(days=settings.RENTAL_OVERDUE_DAYS)
+    last_past = max((i for i, (_, end) in enumerate(slots) if end < today), default=None)
+    statuses, taken = [], False
+    for i, (start, end) in enumerate(slots):
+        if end < today:
+            if i == last_past and rng.random() < OVERDUE_SHARE:
+                status = 'overdue' if end < overdue_before else 'approved'
+            else:
+                status = 'completed' if rng.random() < COMPLETED_SHARE else 'canceled'
+        elif withdrawn or rng.random() < CANCELED_SHARE:
+            status = 'canceled'
+        elif not taken and (start <= today or rng.random() < APPROVED_AHEAD_SHARE):
+            status = 'approved'
+        else:
+            status = 'pending'
+        taken = taken or status in ('approved', 'overdue')
+        statuses.append(status)
+    return statuses
+
+
+def book_rows(plan, block):
+    """
+    The rows of books block `block` and everything hanging off its books,
+    as {model: rows}. Payments and reviews share the id of the rental
+    they come from.
+    """
+    rng = plan.rng('books', block)
+    first, last = block * BLOCK_SIZE, min((block + 1) * BLOCK_SIZE, plan.books)
+    owners = rng.choices(plan.owner_ranks, cum_weights=plan.owner_weights, k=last - first)
+    categories = rng.choices(list(CATEGORIES), weights=list(CATEGORIES.values()), k=last - first)
+    first_day = plan.today - timedelta(days=plan.history_days)
+    span_days = plan.history_days + FUTURE_DAYS
+    rental_id = plan.rental_offsets[block] + 1
+    rows = {Book: [], Rental: [], Payment: [], Review: []}
+
+    for n in range(first, last):
+        book_id, owner = n + 1, owners[n - first]
+        title = rng.choice(TITLE_PATTERNS).format(*rng.sample(TITLE_WORDS, 2))
+        hostel_renters = plan.renters_by_hostel[plan.user_hostels[owner]]
+        quality = rng.uniform(2.5, 4.8)
+        withdrawn = rng.random() < WITHDRAWN_SHARE
+        slots = rental_slots(rng, plan.counts[n], first_day, span_days)
+        statuses = rental_statuses(rng, slots, plan.today, withdrawn)
+
+        histogram, reviewers = [0] * 5, set()
+        for (start, end), status in zip(slots, statuses):
+            if hostel_renters and rng.random() < plan.local_share:
+                renter = rng.choice(hostel_renters)
+            else:
+                renter = rng.choice(plan.renters)
+            renter_id = plan.user_id(renter)
+            rows[Rental].append((rental_id, renter_id, book_id, start, end, status))
+
+            if status == 'completed':
+                outcome = rng.choices(list(PAYMENT_OUTCOMES), weights=list(PAYMENT_OUTCOMES.values()))[0]
+                rows[Payment].append((rental_id, rental_id, DAILY_RATE * ((end - start).days + 1), outcome,
+                                      f'TR-{rng.getrandbits(64):016X}', paid_at(start)))
+                if renter_id not in reviewers and rng.random() < plan.review_share:
+                    reviewers.add(renter_id)
+                    rating = min(5, max(1, round(rng.gauss(quality, 1))))
+                    histogram[rating - 1] += 1
+                    rows[Review].append((rental_id, book_id, renter_id, rating, COMMENTS[rating].format(title)))
+            elif status in ('approved', 'overdue'):
+                rows[Payment].append((rental_id, rental_id, DAILY_RATE * ((end - start).days + 1),
+                                      'pending', None, paid_at(start)))
+            rental_id += 1
+
+        count = sum(histogram)
+        rating_sum = sum(star * stars for star, stars in enumerate(histogram, 1))
+        # Out today if the approved rental has started or is overdue (see rentals.py)
+        if any(status == 'overdue' or status == 'approved' and start <= plan.today
+               for (start, _), status in zip(slots, statuses)):
+            book_status = 'rented'
+        else:
+            book_status = 'unavailable' if withdrawn else 'available'
+        rows[Book].append((
+            book_id, title, f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}', isbn13(rng),
+            plan.user_id(owner), categories[n - first], book_status, count, rating_sum,
+            rating_sum / count if count else 0, *histogram,
+        ))
+    return rows
+
+
+FIELDS = {User: USER_FIELDS, Book: BOOK_FIELDS, Rental: RENTAL_FIELDS,
+          Payment: PAYMENT_FIELDS, Review: REVIEW_FIELDS}
+
+
+def _copy_value(value):
+    if value is None:
+        return r'\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, str):
+        return value.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n')
+    return str(value)
+
+
+def insert_rows(model, rows, using='default'):
+    """Insert `rows` (tuples in FIELDS[model] order): COPY on PostgreSQL, bulk_create elsewhere"""
+    fields = FIELDS[model]
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        model.objects.using(using).bulk_create(
+            [model(**dict(zip(fields, row))) for row in rows], batch_size=BLOCK_SIZE
+        )
+        return
+
+    # COPY skips auto_now: stamp the rows with the load time, as bulk_create does
+    stamped = any(field.name == 'updated_at' for field in model._meta.concrete_fields)
+    if stamped:
+        fields += ('updated_at',)
+        suffix = '\t' + _copy_value(datetime.now(timezone.utc).isoformat())
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write('\t'.join(map(_copy_value, row)))
+        if stamped:
+            buffer.write(suffix)
+        buffer.write('\n')
+    buffer.seek(0)
+    columns = ', '.join(connection.ops.quote_name(model._meta.get_field(name).column) for name in fields)
+    sql = f'COPY {connection.ops.quote_name(model._meta.db_table)} ({columns}) FROM STDIN'
+    with connection.cursor() as cursor:
+        raw = cursor.cursor
+        if hasattr(raw, 'copy_expert'):
+            raw.copy_expert(sql, buffer)
+        else:
+            # psycopg 3
+            with raw.copy(sql) as copy:
+                copy.write(buffer.getvalue())
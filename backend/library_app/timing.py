@@ -0,0 +1,261 @@
+"""
+Per-request timings: where a request's time went.
+
+ServerTimingMiddleware gives every request a Timings record and reports it
+in a Server-Timing header (shown by the browser's network panel):
+
+    Server-Timing: db;dur=41.2;desc="12 queries", serialize;dur=6.3, render;dur=1.9, total;dur=63.0
+
+- db: every query on every connection, shard and replica, through an
+  execute wrapper installed as connections open. Queries run by pool
+  threads on behalf of the request (shard scatter, async views) count too.
+- serialize: the API serializers' validation and to_representation().
+- render: turning response data into bytes, by whichever renderer.
+- wait: a long poll waiting for events (async_views.EventFeedView); sent
+  only when there was some, and not counted towards SLOW_REQUEST_MS.
+- total: the whole request, middleware included.
+
+Whatever is left of total is views, permissions, authentication and
+middleware.
+
+Requests slower than SLOW_REQUEST_MS are also logged to
+`library_app.slow_requests` as one JSON object: the request, its timings,
+and its SQL grouped by statement, the costliest first, each with its count,
+time and the lines of this app that ran it.
+
+Outside a request (management commands, shells) the wrapper and measure()
+return at once. Inside one they cost a perf_counter() pair and a dict
+update per query; the call site stack walk is only done for the first few
+runs of each statement, so an N+1 loop pays for it a handful of times.
+"""
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+logger = logging.getLogger('library_app.slow_requests')
+
+# Call sites remembered per SQL statement, and statements remembered per request
+SITES_PER_QUERY = 3
+MAX_STATEMENTS = 200
+# Characters of SQL written to the slow-request log per statement
+MAX_SQL_LENGTH = 2000
+
+_APP_DIR = os.path.dirname(os.path.abspath(__file__))
+_SKIPPED = (os.path.join(_APP_DIR, 'timing.py'),)
+# Code of app functions that only wrap their caller's work (see skip_frames)
+_SKIPPED_CODE = set()
+
+_timings = ContextVar('request_timings', default=None)
+# Names of the measure() blocks the current context is inside of
+_measuring = ContextVar('measuring', default=frozenset())
+
+
+class Statement:
+    __slots__ = ('count', 'seconds', 'sites')
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.sites = []
+
+
+class Timings:
+    """What one request spent, filled in as it runs"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.seconds = {'serialize': 0.0, 'render': 0.0, 'wait': 0.0}
+        self.statements = {}
+        # Pool threads working for the request add to it concurrently
+        self.lock = threading.Lock()
+
+    def add(self, name, seconds):
+        with self.lock:
+            self.seconds[name] += seconds
+
+    def add_query(self, sql, seconds):
+        with self.lock:
+            self.queries += 1
+            self.sql_seconds += seconds
+            statement = self.statements.get(sql)
+            if statement is None:
+                if len(self.statements) >= MAX_STATEMENTS:
+                    return
+                statement = self.statements[sql] = Statement()
+            statement.count += 1
+            statement.seconds += seconds
+            if statement.count > SITES_PER_QUERY * 2 or len(statement.sites) >= SITES_PER_QUERY:
+                return
+        site = _call_site()
+        with self.lock:
+            if site not in statement.sites and len(statement.sites) < SITES_PER_QUERY:
+                statement.sites.append(site)
+
+    def header(self, total):
+        wait = f'wait;dur={self.seconds["wait"] * 1000:.1f}, ' if self.seconds['wait'] else ''
+        return (
+            f'db;dur={self.sql_seconds * 1000:.1f};desc="{self.queries} queries", '
+            f'serialize;dur={self.seconds["serialize"] * 1000:.1f}, '
+            f'render;dur={self.seconds["render"] * 1000:.1f}, '
+            f'{wait}total;dur={total * 1000:.1f}'
+        )
+
+    def slow_entry(self, request, response, total):
+        statements = sorted(self.statements.items(), key=lambda item: item[1].seconds, reverse=True)
+        match = getattr(request, 'resolver_match', None)
+        user = getattr(request, 'user', None)
+        return {
+            'method': request.method,
+            'path': request.get_full_path(),
+            'view': match.view_name if match else None,
+            'user': user.pk if user is not None and user.is_authenticated else None,
+            'status': response.status_code,
+            'total_ms': round(total * 1000, 1),
+            'db_ms': round(self.sql_seconds * 1000, 1),
+            'queries': self.queries,
+            'serialize_ms': round(self.seconds['serialize'] * 1000, 1),
+            'render_ms': round(self.seconds['render'] * 1000, 1),
+            'sql': [
+                {
+                    'sql': sql[:MAX_SQL_LENGTH],
+                    'count': statement.count,
+                    'ms': round(statement.seconds * 1000, 1),
+                    'sites': statement.sites,
+                }
+                for sql, statement in statements[:settings.SLOW_REQUEST_STATEMENTS]
+            ],
+        }
+
+
+def skip_frames(*functions):
+    """
+    Leave `functions` out of call sites, as this module is: wrappers such as
+    TimedModelSerializer's methods and MetricsMiddleware would otherwise be
+    named for every query run under them
+    """
+    _SKIPPED_CODE.update(function.__code__ for function in functions)
+
+
+def _call_site():
+    """`file:line in function` of the innermost frame in this app's code, outside this module and skip_frames()"""
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(_APP_DIR) and filename not in _SKIPPED and frame.f_code not in _SKIPPED_CODE:
+            return f'{os.path.relpath(filename, os.path.dirname(_APP_DIR))}:{frame.f_lineno} in {frame.f_code.co_name}'
+        frame = frame.f_back
+    return None
+
+
+def current():
+    """The Timings of the request being served, or None outside one"""
+    return _timings.get()
+
+
+def record_query(execute, sql, params, many, context):
+    """Execute wrapper adding each query's time to the current request's Timings"""
+    timings = _timings.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.add_query(sql, time.perf_counter() - started)
+
+
+def install(connection, **kwargs):
+    """connection_created receiver: time the new connection's queries"""
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class measure:
+    """
+    with measure('serialize'): ... adds the block's time to the current
+    request's timings. A block nested in one of the same name (a nested
+    serializer) is not counted twice.
+    """
+    __slots__ = ('name', 'timings', 'started', 'token')
+
+    def __init__(self, name):
+        self.name = name
+        self.timings = None
+
+    def __enter__(self):
+        timings = _timings.get()
+        if timings is None:
+            return
+        measuring = _measuring.get()
+        if self.name in measuring:
+            return
+        self.timings = timings
+        self.token = _measuring.set(measuring | {self.name})
+        self.started = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        if self.timings is not None:
+            self.timings.add(self.name, time.perf_counter() - self.started)
+            _measuring.reset(self.token)
+            self.timings = None
+
+
+class ServerTimingMiddleware:
+    """Times each request and adds the Server-Timing header; first in MIDDLEWARE, so total covers the rest"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timings = Timings()
+        token = _timings.set(timings)
+        try:
+            response = self.get_response(request)
+        finally:
+            _timings.reset(token)
+        return self.finish(request, response, timings)
+
+    async def __acall__(self, request):
+        timings = Timings()
+        token = _timings.set(timings)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _timings.reset(token)
+        return self.finish(request, response, timings)
+
+    def process_template_response(self, request, response):
+        """DRF Responses are rendered right after this; time it up to the post-render callback"""
+        timings = _timings.get()
+        if timings is not None:
+            started = time.perf_counter()
+
+            def rendered(response):
+                timings.add('render', time.perf_counter() - started)
+            response.add_post_render_callback(rendered)
+        return response
+
+    def finish(self, request, response, timings):
+        total = time.perf_counter() - timings.started
+        if settings.SERVER_TIMING_HEADER:
+            response['Server-Timing'] = timings.header(total)
+        busy = total - timings.seconds['wait']
+        if settings.SLOW_REQUEST_MS is not None and busy * 1000 >= settings.SLOW_REQUEST_MS:
+            entry = timings.slow_entry(request, response, total)
+            logger.warning(json.dumps(entry), extra={'slow_request': entry})
+        return response
@@ -1,6 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from . import views
+from . import async_views, views
 
 # Create a router and register our viewsets with it
 router = DefaultRouter()
@@ -9,8 +9,19 @@ router.register(r'books', views.BookViewSet)
 router.register(r'rentals', views.RentalViewSet)
 router.register(r'reviews', views.ReviewViewSet)
 router.register(r'payments', views.PaymentViewSet)
+router.register(r'dashboard', views.DashboardViewSet, basename='dashboard')
+router.register(r'sync', views.SyncViewSet, basename='sync')
 
 # The API URLs are determined automatically by the router
 urlpatterns = [
+    # Async copies of the busiest reads, for ASGI deployments (async_views.py)
+    path('async/books/', async_views.BookListView.as_view()),
+    path('async/books/available/', async_views.AvailableBookListView.as_view()),
+    path('async/books/<int:pk>/', async_views.BookDetailView.as_view()),
+    path('async/books/<int:pk>/reviews/', async_views.BookReviewListView.as_view()),
+    path('async/rentals/my_rentals/', async_views.MyRentalListView.as_view()),
+    path('async/dashboard/', async_views.DashboardView.as_view()),
+    # Rental and book events as Server-Sent Events or long polls (outbox.py)
+    path('async/events/', async_views.EventFeedView.as_view()),
     path('', include(router.urls)),
 ]
\ No newline at end of file
@@ -0,0 +1,199 @@
+"""
+Version stamps for conditional GETs and the server-side response cache.
+
+Every cacheable read is covered by one version: `books` for the book
+collection, `book:<id>` for one book and the reads hanging off it, and
+`reviews` for the review collection. A version is the nanosecond time of
+the last write that touched it. Signal handlers in signals.py (and the
+rental transitions, which update without signals) bump versions once the
+writing transaction commits, so a read never caches pre-commit data under
+a post-commit version.
+
+A response's ETag hashes its version with everything else the bytes
+depend on (path, query string, negotiated media type and, for per-user
+actions, the user). A client that sends that ETag back gets a 304 before
+any query or serializer runs; otherwise the rendered bytes are served from
+the response cache when another client already asked.
+
+Last-Modified is the version's whole second. While that second is still
+running another write can land in it, so until it has passed the header
+is left out and If-Modified-Since ignored; the ETag still validates.
+
+Versions and responses live in the RESPONSE_CACHE_ALIAS cache. Local
+memory is only correct while a single process serves the API; with
+several workers, point that alias at a shared backend (file, database or
+Redis) so a write in one process is seen by all of them. A version that
+has been evicted is re-stamped with the current time, which can only
+cause a miss, never a stale hit.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, parse_http_date_safe, parse_etags
+
+from . import routers, sharding, timing
+
+VERSION_KEY = 'version:{}'
+RESPONSE_KEY = 'response:{}'
+
+
+def _cache():
+    return caches[settings.RESPONSE_CACHE_ALIAS]
+
+
+def get_version(scope):
+    """Current version stamp of `scope`, stamping it now if it has none"""
+    key = VERSION_KEY.format(scope)
+    version = _cache().get(key)
+    if version is None:
+        version = time.time_ns()
+        # add() so two processes stamping a missing version agree on one
+        if not _cache().add(key, version, None):
+            version = _cache().get(key, version)
+    return version
+
+
+def bump(*scopes):
+    """Give each scope a new version once the current transaction commits"""
+    def apply():
+        version = time.time_ns()
+        _cache().set_many({VERSION_KEY.format(scope): version for scope in scopes}, None)
+    # The transaction is on the bound shard when the catalog is sharded
+    sharding.on_commit(apply)
+
+
+def book_scope(book_id):
+    return f'book:{book_id}'
+
+
+def detail_book_scope(view):
+    """Version of the book in the URL; None (do not cache) for a malformed id"""
+    pk = str(view.kwargs.get(view.lookup_url_kwarg or view.lookup_field, ''))
+    return book_scope(int(pk)) if pk.isdigit() else None
+
+
+def conditional(scope, per_user=False):
+    """
+    Make a viewset GET handler answer conditional requests and serve from
+    the response cache. `scope` is a version name, or a callable taking the
+    view and returning one (None skips caching for that request).
+    """
+    def decorator(handler):
+        @wraps(handler)
+        def wrapper(view, request, *args, **kwargs):
+            name = scope(view) if callable(scope) else scope
+            render = lambda: handler(view, request, *args, **kwargs)
+            if name is None:
+                return render()
+            return conditional_response(view, request, name, render, per_user)
+        return wrapper
+    return decorator
+
+
+def conditional_response(view, request, scope, render, per_user=False):
+    """
+    Serve a GET covered by `scope`: 304 when the client's copy is current,
+    the cached bytes when another request already rendered them, and
+    otherwise `render()` (a DRF Response), rendered and cached.
+    """
+    version = get_version(scope)
+    renderer = request.accepted_renderer
+    if renderer.format == 'api':
+        # The browsable API embeds per-request forms; never cache it
+        return render()
+
+    etag = _etag(request, scope, version, request.accepted_media_type, per_user)
+    last_modified = _last_modified(version)
+
+    if _not_modified(request, etag, last_modified):
+        response = HttpResponseNotModified()
+    else:
+        key = RESPONSE_KEY.format(etag.strip('"'))
+        cached = _cache().get(key)
+        if cached is None:
+            if routers.replica_may_lag(version):
+                # The write behind this version may not have reached the replicas
+                with routers.primary_reads():
+                    response = render()
+            else:
+                response = render()
+            if response.status_code != 200:
+                return response
+            content_type = renderer.media_type
+            if renderer.charset:
+                content_type = f'{content_type}; charset={renderer.charset}'
+            with timing.measure('render'):
+                cached = (renderer.render(response.data, request.accepted_media_type,
+                                          view.get_renderer_context()), content_type)
+            _cache().set(key, cached, settings.RESPONSE_CACHE_TIMEOUT)
+        response = HttpResponse(cached[0], content_type=cached[1])
+    return _validated(response, etag, last_modified)
+
+
+async def aconditional_response(request, scope, render, per_user=False):
+    """
+    conditional_response() for the async views, which always answer JSON.
+    `render` is a coroutine function returning the rendered HttpResponse.
+    """
+    version = await sync_to_async(get_version)(scope)
+    etag = _etag(request, scope, version, 'application/json', per_user)
+    last_modified = _last_modified(version)
+
+    if _not_modified(request, etag, last_modified):
+        response = HttpResponseNotModified()
+    else:
+        key = RESPONSE_KEY.format(etag.strip('"'))
+        cached = await _cache().aget(key)
+        if cached is None:
+            if routers.replica_may_lag(version):
+                with routers.primary_reads():
+                    response = await render()
+            else:
+                response = await render()
+            if response.status_code != 200:
+                return response
+            cached = (response.content, response['Content-Type'])
+            await _cache().aset(key, cached, settings.RESPONSE_CACHE_TIMEOUT)
+        response = HttpResponse(cached[0], content_type=cached[1])
+    return _validated(response, etag, last_modified)
+
+
+def _etag(request, scope, version, media_type, per_user):
+    return '"{}"'.format(hashlib.sha1('|'.join([
+        # Bodies hold absolute `next` links, so the host is part of the key
+        scope, str(version), request.get_host(), request.get_full_path(), media_type,
+        str(request.user.pk) if per_user else '',
+    ]).encode()).hexdigest())
+
+
+def _last_modified(version):
+    """The version's second, or None while that second is still running"""
+    second = version // 1_000_000_000
+    return second if time.time_ns() // 1_000_000_000 > second else None
+
+
+def _validated(response, etag, last_modified):
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    # Clients keep their copy but must check it is still current every time
+    patch_cache_control(response, private=True, no_cache=True)
+    # The same URL answers JSON or MessagePack
+    patch_vary_headers(response, ['Authorization', 'Accept'])
+    return response
+
+
+def _not_modified(request, etag, last_modified):
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match:
+        return etag in parse_etags(if_none_match) or if_none_match.strip() == '*'
+    if last_modified is None:
+        return False
+    if_modified_since = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+    return if_modified_since is not None and last_modified <= if_modified_since
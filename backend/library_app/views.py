@@ -1,8 +1,12 @@
 from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
-from django.db.models import Avg
+from django.conf import settings
+from django.db.models import Q
 from django.shortcuts import get_object_or_404
+from django.utils.dateparse import parse_date
+from datetime import date, timedelta
 from .models import User, Book, Rental, Review, Payment
 from .serializers import (
     UserSerializer, 
@@ -12,8 +16,127 @@ from .serializers import (
     PaymentSerializer
 )
 from .permissions import IsAdmin, IsOwnerOrReadOnly, IsRenterOrOwnerOrAdmin, IsReviewerOrReadOnly
+from .pagination import TopRatedPagination
+from .search import search_books
+from .rentals import approve_rental, complete_rental, cancel_rental, save_rental
+from .availability import booked, free_windows
+from .bulk_import import FORMATS, import_books
+from .settlements import reconcile_payments
+from .exports import CSVRenderer, NDJSONRenderer, stream_export
+from .versions import conditional, detail_book_scope
+from .dashboard import get_dashboard
+from .routers import enable_replica_reads, reset_replica_reads, is_sticky, mark_sticky
+from .outbox import book_event, record, rental_event
+from .sync import changes
+from .readers import reader, to_data
+from . import sharding
 
-class UserViewSet(viewsets.ModelViewSet):
+class PaginatedActionMixin:
+    """
+    Lets list and custom list actions page through the viewset's paginator,
+    so they never serialize a whole table in one response. Pages of the
+    serializers readers.py covers are read as values() rows instead of
+    model instances and serializers.
+    """
+    def list(self, request, *args, **kwargs):
+        return self.paginated_response(self.get_queryset())
+
+    def paginated_response(self, queryset, serializer_class=None, filter=True):
+        # The viewset's filter_fields name fields of its own model; actions
+        # listing another model's rows pass filter=False
+        if filter:
+            queryset = self.filter_queryset(queryset)
+        fast = reader(serializer_class or self.get_serializer_class())
+        if fast is not None:
+            lookups, convert = fast
+            page = self.paginate_queryset(queryset.values(*lookups))
+            return self.get_paginated_response(to_data(convert, page))
+        page = self.paginate_queryset(queryset)
+        if serializer_class is None:
+            serializer = self.get_serializer(page, many=True)
+        else:
+            serializer = serializer_class(page, many=True, context=self.get_serializer_context())
+        return self.get_paginated_response(serializer.data)
+
+class ReplicaReadMixin:
+    """
+    Serves safe requests to the actions named in `replica_actions` from a
+    read replica (see routers.py), unless the user wrote something within
+    the sticky window. Every unsafe request starts that window.
+    """
+    replica_actions = ()
+    _replica_token = None
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.method not in permissions.SAFE_METHODS:
+            mark_sticky(request.user.pk)
+        elif self.action in self.replica_actions and not is_sticky(request.user.pk):
+            self._replica_token = enable_replica_reads()
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        if self._replica_token is not None:
+            reset_replica_reads(self._replica_token)
+            self._replica_token = None
+        return super().finalize_response(request, response, *args, **kwargs)
+
+class ShardedViewMixin:
+    """
+    With hostel sharding on (see sharding.py), binds each request to the
+    shard it concerns: detail routes to the shard of the id in the URL,
+    creates to the shard of the `shard_parent` row named in the body (the
+    user's own shard when there is none), and `home_actions` to the user's
+    shard. get_queryset() passes its queryset through sharded(), so every
+    other read is gathered from all shards.
+    """
+    shard_parent = None
+    home_actions = ()
+    _shard_token = None
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        alias = self.get_shard(request) if sharding.enabled() else None
+        if alias is not None:
+            self._shard_token = sharding.bind(alias)
+
+    def get_shard(self, request):
+        pk = str(self.kwargs.get(self.lookup_url_kwarg or self.lookup_field, ''))
+        if pk.isdigit():
+            return sharding.for_pk(int(pk))
+        if self.action in self.home_actions or (self.action == 'create' and not self.shard_parent):
+            return sharding.for_user(request.user)
+        if self.action == 'create':
+            parent = str(request.data.get(self.shard_parent, ''))
+            return sharding.for_pk(int(parent)) if parent.isdigit() else None
+        return None
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        if self._shard_token is not None:
+            sharding.unbind(self._shard_token)
+            self._shard_token = None
+        return super().finalize_response(request, response, *args, **kwargs)
+
+    def sharded(self, queryset):
+        return sharding.sharded(queryset)
+
+class ExportMixin:
+    """
+    Adds an admin-only `export` action that streams every row the list view
+    would return, with the same filters, as CSV or NDJSON. `export_columns`
+    lists the (column name, field lookup) pairs to write.
+    """
+    export_columns = []
+
+    @action(detail=False, methods=['get'], renderer_classes=[CSVRenderer, NDJSONRenderer])
+    def export(self, request):
+        """Stream all matching rows as CSV (?format=csv, the default) or NDJSON (?format=ndjson)"""
+        queryset = self.filter_queryset(self.get_queryset())
+        return stream_export(
+            queryset, self.export_columns, request.accepted_renderer.format,
+            queryset.model._meta.verbose_name_plural, settings.EXPORT_CHUNK_SIZE
+        )
+
+class UserViewSet(ReplicaReadMixin, viewsets.ModelViewSet):
     """
     API endpoint for users
     """
@@ -51,85 +174,240 @@ class UserViewSet(viewsets.ModelViewSet):
             serializer.save()
             return Response(serializer.data)
 
-class BookViewSet(viewsets.ModelViewSet):
+class BookViewSet(ReplicaReadMixin, ShardedViewMixin, PaginatedActionMixin, ExportMixin, viewsets.ModelViewSet):
     """
     API endpoint for books
     """
     queryset = Book.objects.all()
     serializer_class = BookSerializer
+    filter_fields = {'status': 'status', 'owner': 'owner', 'category': 'category'}
+    replica_actions = ('list', 'retrieve', 'reviews', 'availability', 'my_books', 'available',
+                       'top_rated', 'search')
+    home_actions = ('my_books', 'bulk')
+    export_columns = [
+        ('id', 'id'), ('title', 'title'), ('author', 'author'), ('isbn', 'isbn'),
+        ('owner', 'owner_id'), ('owner_name', 'owner__username'), ('category', 'category'),
+        ('status', 'status'), ('rating_count', 'rating_count'), ('rating_average', 'rating_average'),
+    ]
+    # Default and largest date window for the availability action
+    AVAILABILITY_DEFAULT_DAYS = 90
+    AVAILABILITY_MAX_DAYS = 366
+    
+    def get_queryset(self):
+        """Join the owner so owner_name does not cost a query per book"""
+        return self.sharded(Book.objects.select_related('owner'))
     
     def get_permissions(self):
         """
         - Anyone can view books
         - Only authenticated users can create books
         - Only book owner or admin can update/delete books
+        - Only admin can export books
         """
         if self.action in ['update', 'partial_update', 'destroy']:
             return [permissions.IsAuthenticated(), IsOwnerOrReadOnly()]
         elif self.action == 'create':
             return [permissions.IsAuthenticated()]
+        elif self.action == 'export':
+            return [permissions.IsAuthenticated(), IsAdmin()]
         return [permissions.IsAuthenticated()]
     
+    # Book writes append their event to the change feed (outbox.py) in
+    # the same transaction
+    @sharding.atomic
     def perform_create(self, serializer):
         """Set the book owner to the current user when creating a book"""
-        serializer.save(owner=self.request.user)
+        book = serializer.save(owner=self.request.user)
+        record(book_event(book, 'created'))
+    
+    @sharding.atomic
+    def perform_update(self, serializer):
+        book = serializer.save()
+        record(book_event(book, 'updated'))
+    
+    @sharding.atomic
+    def perform_destroy(self, instance):
+        """Delete the book, and with it its rentals, telling their renters too"""
+        rentals = instance.rentals.only('pk', 'book_id', 'renter_id', 'status')
+        record(book_event(instance, 'deleted'),
+               *(rental_event(rental, 'deleted', instance.owner_id) for rental in rentals))
+        instance.delete()
+    
+    # Reads answer If-None-Match / If-Modified-Since and are served from the
+    # response cache while their version (see versions.py) is unchanged
+    @conditional('books')
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+    
+    @conditional(detail_book_scope)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
     
     @action(detail=True, methods=['get'])
+    @conditional(detail_book_scope)
     def reviews(self, request, pk=None):
         """Get all reviews for a specific book"""
         book = self.get_object()
-        reviews = Review.objects.filter(book=book)
-        serializer = ReviewSerializer(reviews, many=True)
-        return Response(serializer.data)
+        reviews = Review.objects.filter(book=book).select_related('user', 'book')
+        return self.paginated_response(reviews, ReviewSerializer, filter=False)
+    
+    @action(detail=True, methods=['get'])
+    def availability(self, request, pk=None):
+        """Booked and free date windows for a book between ?from= and ?to= (inclusive)"""
+        book = self.get_object()
+        start = self._date_param(request, 'from', date.today())
+        end = self._date_param(request, 'to', start + timedelta(days=self.AVAILABILITY_DEFAULT_DAYS))
+        if end < start:
+            raise ValidationError({'to': 'Must not be before from.'})
+        if (end - start).days > self.AVAILABILITY_MAX_DAYS:
+            raise ValidationError({'to': f'The window may span at most {self.AVAILABILITY_MAX_DAYS} days.'})
+
+        intervals = booked(book.pk, start, end)
+        return Response({
+            'book': book.pk,
+            'from': start,
+            'to': end,
+            'booked': intervals,
+            'free': free_windows(intervals, start, end),
+        })
+    
+    @staticmethod
+    def _date_param(request, name, default):
+        value = request.query_params.get(name)
+        if not value:
+            return default
+        try:
+            parsed = parse_date(value)
+        except ValueError:
+            parsed = None
+        if parsed is None:
+            raise ValidationError({name: 'Use the YYYY-MM-DD format.'})
+        return parsed
+    
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """Import many books at once from a CSV or NDJSON body, owned by the current user"""
+        fmt = FORMATS.get(request.content_type)
+        if fmt is None:
+            return Response(
+                {"detail": "Send the books as text/csv or application/x-ndjson"},
+                status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE
+            )
+        if request.stream is None:
+            return Response(
+                {"detail": "The upload is empty"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            chunk_size = int(request.query_params.get('chunk_size', settings.BULK_IMPORT_CHUNK_SIZE))
+        except ValueError:
+            chunk_size = 0
+        if not 1 <= chunk_size <= settings.BULK_IMPORT_MAX_CHUNK_SIZE:
+            raise ValidationError({'chunk_size': f'Must be between 1 and {settings.BULK_IMPORT_MAX_CHUNK_SIZE}.'})
+
+        report = import_books(request.stream, fmt, request.user, chunk_size,
+                              settings.BULK_IMPORT_MAX_ERRORS)
+        return Response(
+            report,
+            status=status.HTTP_201_CREATED if report['created'] else status.HTTP_400_BAD_REQUEST
+        )
     
     @action(detail=False, methods=['get'])
+    @conditional('books', per_user=True)
     def my_books(self, request):
         """Get all books owned by the current user"""
-        books = Book.objects.filter(owner=request.user)
-        serializer = self.get_serializer(books, many=True)
-        return Response(serializer.data)
+        books = self.get_queryset().filter(owner=request.user)
+        return self.paginated_response(books)
     
     @action(detail=False, methods=['get'])
+    @conditional('books')
     def available(self, request):
         """Get all available books"""
-        books = Book.objects.filter(status='available')
+        books = self.get_queryset().filter(status='available')
+        return self.paginated_response(books)
+    
+    @action(detail=False, methods=['get'], pagination_class=TopRatedPagination)
+    @conditional('books')
+    def top_rated(self, request):
+        """Get books ordered by average rating, best first"""
+        books = self.get_queryset().filter(rating_average__gt=0)
+        return self.paginated_response(books)
+    
+    @action(detail=False, methods=['get'])
+    @conditional('books')
+    def search(self, request):
+        """
+        Rank books matching ?q= across title, author, ISBN and category.
+        Returns the best `page_size` matches, best first.
+        """
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response(
+                {"detail": "The q parameter is required"}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        limit = self.paginator.get_page_size(request)
+        books = search_books(self.get_queryset(), query, limit)
         serializer = self.get_serializer(books, many=True)
-        return Response(serializer.data)
+        return Response({'results': serializer.data})
 
-class RentalViewSet(viewsets.ModelViewSet):
+class RentalViewSet(ReplicaReadMixin, ShardedViewMixin, PaginatedActionMixin, ExportMixin, viewsets.ModelViewSet):
     """
     API endpoint for rentals
     """
     queryset = Rental.objects.all()
     serializer_class = RentalSerializer
     permission_classes = [permissions.IsAuthenticated]
+    filter_fields = {'status': 'status', 'book': 'book', 'renter': 'renter'}
+    replica_actions = ('list', 'my_rentals', 'my_book_rentals')
+    shard_parent = 'book'
+    home_actions = ('my_book_rentals',)
+    export_columns = [
+        ('id', 'id'), ('renter', 'renter_id'), ('renter_name', 'renter__username'),
+        ('book', 'book_id'), ('book_title', 'book__title'), ('start_date', 'start_date'),
+        ('end_date', 'end_date'), ('status', 'status'),
+    ]
+    
+    def get_queryset(self):
+        """Join the renter and book read by renter_name, book_title and the ownership checks"""
+        return self.sharded(Rental.objects.select_related('renter', 'book'))
     
     def get_permissions(self):
         """
         - Only authenticated users can view/create rentals
         - Only the renter, book owner, or admin can update/delete a rental
+        - Only admin can export rentals
         """
         if self.action in ['update', 'partial_update', 'destroy']:
             return [permissions.IsAuthenticated(), IsRenterOrOwnerOrAdmin()]
+        elif self.action == 'export':
+            return [permissions.IsAuthenticated(), IsAdmin()]
         return [permissions.IsAuthenticated()]
     
     def perform_create(self, serializer):
-        """Set the renter to current user when creating a rental"""
-        serializer.save(renter=self.request.user)
+        """Set the renter to current user when creating a rental, refusing overlapping dates"""
+        save_rental(serializer, renter=self.request.user)
+    
+    def perform_update(self, serializer):
+        """Refuse edits that move the rental onto dates already booked"""
+        save_rental(serializer)
+    
+    @sharding.atomic
+    def perform_destroy(self, instance):
+        record(rental_event(instance, 'deleted', instance.book.owner_id))
+        instance.delete()
     
     @action(detail=False, methods=['get'])
     def my_rentals(self, request):
         """Get all rentals where the current user is the renter"""
-        rentals = Rental.objects.filter(renter=request.user)
-        serializer = self.get_serializer(rentals, many=True)
-        return Response(serializer.data)
+        rentals = self.get_queryset().filter(renter=request.user)
+        return self.paginated_response(rentals)
     
     @action(detail=False, methods=['get'])
     def my_book_rentals(self, request):
         """Get all rentals for books owned by the current user"""
-        rentals = Rental.objects.filter(book__owner=request.user)
-        serializer = self.get_serializer(rentals, many=True)
-        return Response(serializer.data)
+        rentals = self.get_queryset().filter(book__owner=request.user)
+        return self.paginated_response(rentals)
     
     @action(detail=True, methods=['post'])
     def approve(self, request, pk=None):
@@ -137,7 +415,7 @@ class RentalViewSet(viewsets.ModelViewSet):
         rental = self.get_object()
         
         # Check if the current user is the book owner
-        if rental.book.owner != request.user and request.user.role != 'admin':
+        if rental.book.owner_id != request.user.id and request.user.role != 'admin':
             return Response(
                 {"detail": "You are not the owner of this book"}, 
                 status=status.HTTP_403_FORBIDDEN
@@ -150,13 +428,8 @@ class RentalViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Update rental and book status
-        rental.status = 'approved'
-        rental.save()
-        
-        book = rental.book
-        book.status = 'rented'
-        book.save()
+        # Update rental and book status; 409 if another request got there first
+        approve_rental(rental)
         
         serializer = self.get_serializer(rental)
         return Response(serializer.data)
@@ -167,28 +440,23 @@ class RentalViewSet(viewsets.ModelViewSet):
         rental = self.get_object()
         
         # Check if the current user is the book owner, renter, or admin
-        if (rental.book.owner != request.user and 
-            rental.renter != request.user and 
+        if (rental.book.owner_id != request.user.id and 
+            rental.renter_id != request.user.id and 
             request.user.role != 'admin'):
             return Response(
                 {"detail": "You are not authorized to complete this rental"}, 
                 status=status.HTTP_403_FORBIDDEN
             )
         
-        # Check if the rental is in approved status
-        if rental.status != 'approved':
+        # Check if the rental is in approved or overdue status
+        if rental.status not in ['approved', 'overdue']:
             return Response(
-                {"detail": "This rental is not in approved status"}, 
+                {"detail": "This rental is not in approved or overdue status"}, 
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Update rental and book status
-        rental.status = 'completed'
-        rental.save()
-        
-        book = rental.book
-        book.status = 'available'
-        book.save()
+        # Update rental and book status; 409 if another request got there first
+        complete_rental(rental)
         
         serializer = self.get_serializer(rental)
         return Response(serializer.data)
@@ -199,8 +467,8 @@ class RentalViewSet(viewsets.ModelViewSet):
         rental = self.get_object()
         
         # Check if the current user is the renter, book owner, or admin
-        if (rental.renter != request.user and 
-            rental.book.owner != request.user and 
+        if (rental.renter_id != request.user.id and 
+            rental.book.owner_id != request.user.id and 
             request.user.role != 'admin'):
             return Response(
                 {"detail": "You are not authorized to cancel this rental"}, 
@@ -214,25 +482,25 @@ class RentalViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # If the rental was approved, update the book status back to available
-        if rental.status == 'approved':
-            book = rental.book
-            book.status = 'available'
-            book.save()
-        
-        # Update rental status
-        rental.status = 'canceled'
-        rental.save()
+        # Cancel, releasing the book if the rental was approved; 409 if
+        # another request got there first
+        cancel_rental(rental)
         
         serializer = self.get_serializer(rental)
         return Response(serializer.data)
 
-class ReviewViewSet(viewsets.ModelViewSet):
+class ReviewViewSet(ReplicaReadMixin, ShardedViewMixin, PaginatedActionMixin, viewsets.ModelViewSet):
     """
     API endpoint for reviews
     """
     queryset = Review.objects.all()
     serializer_class = ReviewSerializer
+    replica_actions = ('list', 'retrieve', 'my_reviews')
+    shard_parent = 'book'
+    
+    def get_queryset(self):
+        """Join the reviewer and book read by user_name and book_title"""
+        return self.sharded(Review.objects.select_related('user', 'book'))
     
     def get_permissions(self):
         """
@@ -246,52 +514,122 @@ class ReviewViewSet(viewsets.ModelViewSet):
             return [permissions.IsAuthenticated()]
         return [permissions.IsAuthenticated()]
     
+    @sharding.atomic
     def perform_create(self, serializer):
         """Set the user to current user when creating a review"""
         serializer.save(user=self.request.user)
     
+    # Reviews and their book's rating aggregates change together
+    @sharding.atomic
+    def perform_update(self, serializer):
+        serializer.save()
+    
+    @sharding.atomic
+    def perform_destroy(self, instance):
+        instance.delete()
+    
+    @conditional('reviews')
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+    
+    @conditional('reviews')
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+    
     @action(detail=False, methods=['get'])
+    @conditional('reviews', per_user=True)
     def my_reviews(self, request):
         """Get all reviews created by the current user"""
-        reviews = Review.objects.filter(user=request.user)
-        serializer = self.get_serializer(reviews, many=True)
-        return Response(serializer.data)
+        reviews = self.get_queryset().filter(user=request.user)
+        return self.paginated_response(reviews)
 
-class PaymentViewSet(viewsets.ModelViewSet):
+class PaymentViewSet(ReplicaReadMixin, ShardedViewMixin, PaginatedActionMixin, ExportMixin, viewsets.ModelViewSet):
     """
     API endpoint for payments
     """
     queryset = Payment.objects.all()
     serializer_class = PaymentSerializer
     permission_classes = [permissions.IsAuthenticated]
+    filter_fields = {'status': 'status', 'rental': 'rental'}
+    replica_actions = ('list', 'my_payments')
+    shard_parent = 'rental'
+    export_columns = [
+        ('id', 'id'), ('rental', 'rental_id'), ('amount', 'amount'),
+        ('status', 'status'), ('transaction_id', 'transaction_id'), ('billing_period', 'billing_period'),
+    ]
     
     def get_permissions(self):
         """
-        - Only admin can view all payments
+        - Only admin can view or export all payments, and reconcile settlement files
         - Users can only see payments related to their rentals
         """
-        if self.action == 'list':
+        if self.action in ['list', 'export', 'reconcile']:
             return [permissions.IsAuthenticated(), IsAdmin()]
         return [permissions.IsAuthenticated()]
     
     def get_queryset(self):
         """Filter payments based on user role"""
         user = self.request.user
+        # rental_details renders Rental.__str__, which reads the renter and book
+        payments = self.sharded(Payment.objects.select_related('rental__renter', 'rental__book'))
         
         # Admin can see all payments
         if user.role == 'admin':
-            return Payment.objects.all()
+            return payments
         
         # Other users can only see payments related to their rentals
-        return Payment.objects.filter(
-            rental__renter=user
-        ) | Payment.objects.filter(
-            rental__book__owner=user
-        )
+        return payments.filter(Q(rental__renter=user) | Q(rental__book__owner=user))
     
     @action(detail=False, methods=['get'])
     def my_payments(self, request):
         """Get all payments related to the current user's rentals"""
-        payments = Payment.objects.filter(rental__renter=request.user)
-        serializer = self.get_serializer(payments, many=True)
-        return Response(serializer.data)
\ No newline at end of file
+        payments = self.get_queryset().filter(rental__renter=request.user)
+        return self.paginated_response(payments)
+    
+    @action(detail=False, methods=['post'])
+    def reconcile(self, request):
+        """Settle payments from the provider's settlement file, sent as a text/csv body"""
+        if FORMATS.get(request.content_type) != 'csv':
+            return Response(
+                {"detail": "Send the settlement file as text/csv"},
+                status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE
+            )
+        if request.stream is None:
+            return Response(
+                {"detail": "The upload is empty"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response(reconcile_payments(request.stream, settings.SETTLEMENT_CHUNK_SIZE,
+                                           settings.SETTLEMENT_MAX_REPORTED))
+
+class DashboardViewSet(ReplicaReadMixin, viewsets.ViewSet):
+    """
+    API endpoint for the current user's dashboard
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def list(self, request):
+        """
+        Catalog counters plus the role-specific counters and recent lists
+        the dashboard shows, in one response
+        """
+        return Response(get_dashboard(request.user))
+
+class SyncViewSet(viewsets.ViewSet):
+    """
+    API endpoint for delta sync of the books, rentals and reviews a client
+    keeps locally (see sync.py)
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def list(self, request):
+        """
+        ?since=<the `next` of the previous response>: the rows changed and
+        deleted since, SYNC_BATCH_SIZE at a time. Without it, or when it is
+        too old, a full snapshot with `reset` set.
+        """
+        try:
+            return Response(changes(request.user, request.query_params.get('since'),
+                                    {'request': request, 'view': self}))
+        except ValueError as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
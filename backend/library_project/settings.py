@@ -1,6 +1,7 @@
 import os
 from pathlib import Path
 from datetime import timedelta
+from decimal import Decimal
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -25,6 +26,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     # Third-party apps
     'rest_framework',
     'rest_framework_simplejwt',
@@ -34,6 +36,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so its total covers every other middleware
+    'library_app.timing.ServerTimingMiddleware',
+    # Prometheus request metrics, reading the query counts timed above
+    'library_app.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -78,6 +84,146 @@ DATABASES = {
     }
 }
 
+# Read replicas: aliases of extra DATABASES entries that replicate 'default',
+# e.g. 'replica': {..., 'HOST': 'replica.internal', 'TEST': {'MIRROR': 'default'}}.
+# Listed viewset reads are spread over them (library_app/routers.py); empty
+# keeps every query on 'default'.
+DATABASE_REPLICAS = []
+# Hostel sharding (library_app/sharding.py): extra DATABASES aliases holding
+# the books, rentals, reviews and payments of the listed hostels, e.g.
+#   'hostels_1': {'slot': 1, 'hostels': ['1', '2', '3']},
+# A slot fixes the shard's id range and must never change once it holds
+# data. Unlisted hostels stay on 'default'; empty turns sharding off.
+DATABASE_SHARDS = {}
+# Threads querying shards concurrently for cross-hostel reads
+SHARD_QUERY_WORKERS = 8
+# Threads (each with its own connection) running the independent queries
+# of the async read views (library_app/async_views.py) side by side
+ASYNC_QUERY_WORKERS = 16
+DATABASE_ROUTERS = ['library_app.sharding.ShardRouter', 'library_app.routers.ReplicaRouter']
+# Seconds a user's reads stay on 'default' after any write they make; also
+# the replication lag the router assumes at most. Marks live in the default
+# cache, which must be shared between processes once replicas are in use.
+REPLICA_STICKY_SECONDS = 5
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# Local memory is per process: multi-process deployments should point this
+# at a shared backend so invalidations reach every worker.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Version stamps and rendered book/review responses (library_app/versions.py).
+    # Local memory is only correct with a single server process; with several
+    # workers use a shared backend, e.g.
+    #   'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+    #   'LOCATION': '/var/tmp/library_responses',
+    # or 'django.core.cache.backends.db.DatabaseCache' after createcachetable.
+    'responses': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'responses',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+
+RESPONSE_CACHE_ALIAS = 'responses'
+# Seconds a rendered response is kept; writes make it unreachable at once
+RESPONSE_CACHE_TIMEOUT = 300
+
+# Seconds a computed dashboard may be served from cache. Writes invalidate
+# it immediately; the timeout only bounds memory for idle users.
+DASHBOARD_CACHE_TIMEOUT = 300
+
+# /api/books/bulk/: rows validated and inserted per chunk (clients may ask
+# for a different ?chunk_size= up to the maximum), and the most per-row
+# errors one import reports in full
+BULK_IMPORT_CHUNK_SIZE = 500
+BULK_IMPORT_MAX_CHUNK_SIZE = 5000
+BULK_IMPORT_MAX_ERRORS = 1000
+
+# Rows fetched per database round trip (and per write to the client) by
+# the streaming export actions
+EXPORT_CHUNK_SIZE = 2000
+
+# Per-request timings (library_app/timing.py): a Server-Timing header with
+# the query count and SQL, serializer and render time of every response,
+# and a JSON entry in the library_app.slow_requests log for requests taking
+# SLOW_REQUEST_MS or longer (None turns the log off), listing their
+# costliest SLOW_REQUEST_STATEMENTS SQL statements with call sites
+SERVER_TIMING_HEADER = True
+SLOW_REQUEST_MS = 1000
+SLOW_REQUEST_STATEMENTS = 10
+
+# Prometheus metrics at /metrics (library_app/metrics.py). Seconds the
+# book and rental gauges are cached between recounts, and the cache alias
+# they are kept in (share one between workers to count once for all). A
+# token, when set, must be sent by the scraper as `Authorization: Bearer
+# <token>`; without one only METRICS_ALLOWED_IPS are served (REMOTE_ADDR,
+# so behind a proxy set a token), unless METRICS_PUBLIC opens /metrics to
+# anyone. For several worker processes, set the PROMETHEUS_MULTIPROC_DIR
+# environment variable (see gunicorn.conf.py).
+METRICS_GAUGE_TIMEOUT = 30
+METRICS_CACHE = 'default'
+METRICS_TOKEN = None
+METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
+METRICS_PUBLIC = False
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'library_app.slow_requests': {'handlers': ['console'], 'level': 'WARNING', 'propagate': False},
+    },
+}
+
+# Rental sweeper (library_app/expiry.py, `manage.py sweep_rentals`): days
+# past its start_date before a still-pending request is canceled, days past
+# its end_date before an approved rental is marked overdue (it stays billed
+# and its book stays out until it is completed), and rentals moved per
+# (short) transaction
+RENTAL_PENDING_EXPIRY_DAYS = 1
+RENTAL_OVERDUE_DAYS = 14
+RENTAL_SWEEP_CHUNK_SIZE = 1000
+
+# Late fees (library_app/billing.py, `manage.py bill_late_fees`): charged
+# per day an approved rental is kept past its end_date, billed as one
+# payment per rental and month; rentals billed per transaction
+LATE_FEE_DAILY_RATE = Decimal('0.50')
+LATE_FEE_CHUNK_SIZE = 100000
+
+# Settlement reconciliation (library_app/settlements.py): file rows matched
+# per chunk, and the most problems and unmatched payments one run lists
+SETTLEMENT_CHUNK_SIZE = 5000
+SETTLEMENT_MAX_REPORTED = 1000
+
+# Change feed (library_app/outbox.py, /api/async/events/): days events are
+# kept (a client resuming from further back is told to reload), minutes
+# after which only each rental's and book's latest event is kept (None
+# keeps all), seconds between reads of new events, the longest a long poll
+# waits, how long one event stream stays open before the client reconnects,
+# seconds between keep-alives on an idle stream, and events per read
+OUTBOX_RETENTION_DAYS = 7
+OUTBOX_COMPACT_AFTER_MINUTES = 60
+OUTBOX_POLL_INTERVAL = 1.0
+OUTBOX_LONG_POLL_SECONDS = 25
+OUTBOX_STREAM_SECONDS = 300
+OUTBOX_HEARTBEAT_SECONDS = 15
+OUTBOX_BATCH_SIZE = 500
+
+# Delta sync (library_app/sync.py, /api/sync/): rows and deletions per
+# response, seconds each sync reaches back before the previous one ended
+# (covers transactions still open then, and clock skew between app
+# servers), and days deletions are remembered: a client whose last sync is
+# older gets a fresh snapshot
+SYNC_BATCH_SIZE = 1000
+SYNC_OVERLAP_SECONDS = 60
+SYNC_TOMBSTONE_DAYS = 30
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -123,14 +269,31 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        # simplejwt's JWTAuthentication, with request.user served from a cache
+        'library_app.authentication.CachedJWTAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
-    'PAGE_SIZE': 10
+    # Keyset pagination on -id; pass ?count=true for an exact total
+    'DEFAULT_PAGINATION_CLASS': 'library_app.pagination.KeysetPagination',
+    'PAGE_SIZE': 10,
+    # Exact-match ?field=value filters declared per viewset as filter_fields
+    'DEFAULT_FILTER_BACKENDS': ('library_app.filters.FieldFilterBackend',),
+    # JSON through orjson, and MessagePack for `Accept: application/msgpack`
+    'DEFAULT_RENDERER_CLASSES': (
+        'library_app.renderers.JSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+        'library_app.renderers.MessagePackRenderer',
+    ),
+}
+
+# Users resolved by CachedJWTAuthentication, per process. Saves invalidate
+# an entry at once; the timeout (seconds) bounds idle entries.
+AUTH_USER_CACHE = {
+    'max_entries': 10000,
+    'timeout': 300,
 }
 
 # JWT settings
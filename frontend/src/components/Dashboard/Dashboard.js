@@ -11,7 +11,7 @@ import {
   FaCheckCircle, 
   FaTimesCircle 
 } from 'react-icons/fa';
-import { BookService, RentalService, ReviewService } from '../../services/api.service';
+import { DashboardService } from '../../services/api.service';
 import { useAuth } from '../../contexts/AuthContext';
 
 const Dashboard = () => {
@@ -29,7 +29,8 @@ const Dashboard = () => {
       booksAvailable: 0,
       booksRented: 0,
       activeRentals: 0,
-      pendingRentals: 0
+      pendingRentals: 0,
+      pendingRequests: 0
     }
   });
   
@@ -42,60 +43,25 @@ const Dashboard = () => {
       setLoading(true);
       setError('');
       
-      // Create an object to hold all dashboard data
+      // Every counter and recent list comes from one server-side aggregate
+      const response = await DashboardService.getDashboard();
+      const { stats } = response.data;
+      
       const data = {
-        myBooks: [],
-        myRentals: [],
-        pendingRequests: [],
-        recentReviews: [],
+        myBooks: response.data.my_books || [],
+        myRentals: response.data.my_rentals || [],
+        pendingRequests: response.data.pending_requests || [],
+        recentReviews: response.data.recent_reviews || [],
         stats: {
-          totalBooks: 0,
-          booksAvailable: 0,
-          booksRented: 0,
-          activeRentals: 0,
-          pendingRentals: 0
+          totalBooks: stats.total_books,
+          booksAvailable: stats.available_books,
+          booksRented: stats.my_books_rented || 0,
+          activeRentals: stats.active_rentals || 0,
+          pendingRentals: stats.pending_rentals || 0,
+          pendingRequests: stats.pending_requests || 0
         }
       };
       
-      // Fetch available books (for everyone)
-      const availableBooksResponse = await BookService.getAvailableBooks();
-      data.stats.booksAvailable = availableBooksResponse.data.length;
-      
-      // Fetch all books (for counts)
-      const allBooksResponse = await BookService.getAllBooks();
-      data.stats.totalBooks = allBooksResponse.data.results ? allBooksResponse.data.results.length : allBooksResponse.data.length;
-      
-      // For book owners, fetch their books
-      if (hasRole('owner') || hasRole('admin')) {
-        const myBooksResponse = await BookService.getMyBooks();
-        data.myBooks = myBooksResponse.data.slice(0, 5); // Get only the first 5
-        
-        // Fetch requests for the owner's books
-        const pendingRequestsResponse = await RentalService.getMyBookRentals();
-        data.pendingRequests = pendingRequestsResponse.data
-          .filter(rental => rental.status === 'pending')
-          .slice(0, 5);
-        
-        data.stats.booksRented = myBooksResponse.data.filter(book => book.status === 'rented').length;
-      }
-      
-      // For renters, fetch their rentals
-      if (hasRole('renter') || hasRole('admin')) {
-        const myRentalsResponse = await RentalService.getMyRentals();
-        data.myRentals = myRentalsResponse.data.slice(0, 5);
-        
-        data.stats.activeRentals = myRentalsResponse.data.filter(rental => rental.status === 'approved').length;
-        data.stats.pendingRentals = myRentalsResponse.data.filter(rental => rental.status === 'pending').length;
-      }
-      
-      // Get recent reviews
-      try {
-        const myReviewsResponse = await ReviewService.getMyReviews();
-        data.recentReviews = myReviewsResponse.data.slice(0, 3);
-      } catch (err) {
-        console.error('Error fetching reviews:', err);
-      }
-      
       setDashboardData(data);
     } catch (err) {
       setError('Failed to fetch dashboard data. Please try again.');
@@ -233,7 +199,7 @@ const Dashboard = () => {
           <h4 className="mb-3 d-flex align-items-center">
             <FaBell className="text-warning me-2" />
             Pending Rental Requests
-            <Badge bg="info" className="ms-2">{dashboardData.pendingRequests.length}</Badge>
+            <Badge bg="info" className="ms-2">{dashboardData.stats.pendingRequests}</Badge>
           </h4>
           <Card className="mb-4">
             <Card.Body>
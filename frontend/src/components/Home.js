@@ -16,8 +16,8 @@ const Home = () => {
     const fetchFeaturedBooks = async () => {
       try {
         setLoading(true);
-        const response = await BookService.getAvailableBooks();
-        setFeaturedBooks(response.data.slice(0, 6)); // Get up to 6 books
+        const response = await BookService.getAvailableBooks({ page_size: 6 });
+        setFeaturedBooks(response.data.results); // Get up to 6 books
       } catch (err) {
         setError('Failed to fetch featured books.');
         console.error(err);
@@ -68,6 +68,18 @@ API.interceptors.response.use(
   }
 );
 
+// List endpoints use cursor pagination; follow the `next` links to collect
+// every page of a per-user list into a single array
+const getAllPages = async (url, params) => {
+  let response = await API.get(url, { params });
+  const results = [...response.data.results];
+  while (response.data.next) {
+    response = await API.get(response.data.next);
+    results.push(...response.data.results);
+  }
+  return { ...response, data: results };
+};
+
 // Authentication services
 const AuthService = {
   login: async (username, password) => {
@@ -119,15 +131,31 @@ const BookService = {
   },
   
   getMyBooks: async () => {
-    return API.get('/books/my_books/');
+    return getAllPages('/books/my_books/');
+  },
+  
+  // file: a CSV (with a header row) or NDJSON File from an <input type="file">
+  bulkImportBooks: async (file) => {
+    const isCsv = file.type === 'text/csv' || file.name.toLowerCase().endsWith('.csv');
+    return API.post('/books/bulk/', file, {
+      headers: { 'Content-Type': isCsv ? 'text/csv' : 'application/x-ndjson' },
+    });
+  },
+  
+  getAvailableBooks: async (params) => {
+    return API.get('/books/available/', { params });
   },
   
-  getAvailableBooks: async () => {
-    return API.get('/books/available/');
+  searchBooks: async (q, params) => {
+    return API.get('/books/search/', { params: { ...params, q } });
   },
   
   getBookReviews: async (id) => {
-    return API.get(`/books/${id}/reviews/`);
+    return getAllPages(`/books/${id}/reviews/`);
+  },
+  
+  getBookAvailability: async (id, params) => {
+    return API.get(`/books/${id}/availability/`, { params });
   },
 };
 
@@ -154,11 +182,11 @@ const RentalService = {
   },
   
   getMyRentals: async () => {
-    return API.get('/rentals/my_rentals/');
+    return getAllPages('/rentals/my_rentals/');
   },
   
   getMyBookRentals: async () => {
-    return API.get('/rentals/my_book_rentals/');
+    return getAllPages('/rentals/my_book_rentals/');
   },
   
   approveRental: async (id) => {
@@ -197,7 +225,7 @@ const ReviewService = {
   },
   
   getMyReviews: async () => {
-    return API.get('/reviews/my_reviews/');
+    return getAllPages('/reviews/my_reviews/');
   },
 };
 
@@ -220,7 +248,14 @@ const PaymentService = {
   },
   
   getMyPayments: async () => {
-    return API.get('/payments/my_payments/');
+    return getAllPages('/payments/my_payments/');
+  },
+};
+
+// Dashboard services
+const DashboardService = {
+  getDashboard: async () => {
+    return API.get('/dashboard/');
   },
 };
 
@@ -230,4 +265,5 @@ export {
   RentalService,
   ReviewService,
   PaymentService,
+  DashboardService,
 };
\ No newline at end of file